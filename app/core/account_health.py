@@ -0,0 +1,234 @@
+"""
+账号健康度与限流调度：每个账号 (登录会话；匿名实例各自视为一个账号) 独立维护
+
+    - 请求速率预算：令牌桶，每分钟 rate_per_minute 个请求，允许 burst 个突发；
+    - 最近 window 秒内的错误率；
+    - 熔断器：检测到限流 (StreamGenerate 返回 429 或页面给出限流提示) 立即熔断，
+      错误率超过阈值 (且样本数足够) 时也熔断。熔断后冷却 base_cooldown 秒，连续熔断时冷却时间翻倍
+      (不超过 max_cooldown)；冷却结束进入半开状态，只放行一个探测请求，成功则恢复，失败则再次熔断。
+
+调度器只把请求分配给 allows() 为 True 的账号所在的实例，流量因此自动集中到健康的账号上。
+"""
+import math
+import re
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from loguru import logger
+
+from app.core import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 只检查较短的回答，避免把正常回答中引用的同类句子误判为限流提示
+RATE_LIMIT_MAX_CHARS = 400
+RATE_LIMIT_PATTERN = re.compile(
+    r"reached your (?:daily )?limit|too many requests|try again later|unusual traffic|"
+    r"quota (?:has been )?exceeded|已达到.{0,8}(?:上限|限制)|请求(?:过多|太多)|稍后再试",
+    re.IGNORECASE,
+)
+
+
+def detect_rate_limit(text: str) -> bool:
+    """回答是否为 Gemini 的限流提示 (而不是真正的回答)"""
+    return bool(text) and len(text) <= RATE_LIMIT_MAX_CHARS and RATE_LIMIT_PATTERN.search(text) is not None
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，capacity 为桶容量 (突发请求数)"""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1  # 允许为负：调度器已放行的请求不会因为并发分配而被拒绝
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class AccountHealth:
+    """单个账号的健康状态与熔断器"""
+    def __init__(self, name: str, bucket: Optional[TokenBucket], window: float, error_threshold: float,
+                 min_requests: int, base_cooldown: float, max_cooldown: float, probe_timeout: float):
+        self.name = name
+        self.bucket = bucket
+        self.window = window
+        self.error_threshold = error_threshold
+        self.min_requests = max(1, min_requests)
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max(base_cooldown, max_cooldown)
+        self.probe_timeout = probe_timeout
+        self.state = CLOSED
+        self.trips = 0  # 连续熔断次数 (决定下次冷却时长)，恢复后清零
+        self.open_until = 0.0
+        self.last_reason: Optional[str] = None
+        self._probe_until = 0.0  # 半开状态下探测请求的截止时间；探测请求未上报结果时到期后允许下一个探测
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self.totals = {"ok": 0, "error": 0, "throttled": 0}
+
+    def _prune(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def error_rate(self, now: Optional[float] = None) -> float:
+        self._prune(time.monotonic() if now is None else now)
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, ok in self._outcomes if not ok) / len(self._outcomes)
+
+    def _advance(self, now: float):
+        if self.state == OPEN and now >= self.open_until:
+            self.state = HALF_OPEN
+            self._probe_until = 0.0
+            logger.info(f"🩺 账号 {self.name} 冷却结束，放行一个探测请求。")
+
+    def allows(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self._advance(now)
+        if self.state == OPEN:
+            return False
+        if self.state == HALF_OPEN and now < self._probe_until:
+            return False
+        return self.bucket is None or self.bucket.available(now)
+
+    def admit(self, now: Optional[float] = None):
+        """调度器把一个请求分配给该账号"""
+        now = time.monotonic() if now is None else now
+        if self.bucket is not None:
+            self.bucket.take(now)
+        if self.state == HALF_OPEN:
+            self._probe_until = now + self.probe_timeout
+
+    def retry_in(self, now: Optional[float] = None) -> float:
+        """距离该账号可以再次接受请求的秒数"""
+        now = time.monotonic() if now is None else now
+        self._advance(now)
+        if self.state == OPEN:
+            return self.open_until - now
+        wait = self.bucket.wait_time(now) if self.bucket is not None else 0.0
+        if self.state == HALF_OPEN and now < self._probe_until:
+            wait = max(wait, self._probe_until - now)
+        return wait
+
+    def record(self, outcome: str, now: Optional[float] = None) -> bool:
+        """outcome: ok / error / throttled；返回本次结果是否触发了熔断"""
+        now = time.monotonic() if now is None else now
+        self.totals[outcome] += 1
+        self._advance(now)
+        if self.state == OPEN:
+            return False  # 熔断前已分配的请求陆续结束，它们的结果不改变冷却状态
+        self._outcomes.append((now, outcome == "ok"))
+        self._prune(now)
+        if outcome == "ok":
+            if self.state != CLOSED:
+                logger.success(f"💚 账号 {self.name} 探测成功，恢复调度。")
+            self.state = CLOSED
+            self.trips = 0
+            return False
+        if outcome == "throttled":
+            reason = "检测到限流"
+        elif self.state == HALF_OPEN:
+            reason = "探测请求失败"
+        elif len(self._outcomes) >= self.min_requests and self.error_rate(now) >= self.error_threshold:
+            reason = f"错误率 {self.error_rate(now):.0%}"
+        else:
+            return False
+        self._trip(reason, now)
+        return True
+
+    def _trip(self, reason: str, now: float):
+        cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** self.trips)
+        self.trips += 1
+        self.state = OPEN
+        self.open_until = now + cooldown
+        self.last_reason = reason
+        self._outcomes.clear()  # 恢复后重新统计错误率
+        logger.warning(f"🧊 账号 {self.name} 熔断 ({reason})，冷却 {cooldown:.0f}s (第 {self.trips} 次)。")
+
+    def as_dict(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.monotonic() if now is None else now
+        self._advance(now)
+        return {
+            "name": self.name,
+            "state": self.state,
+            "available": self.allows(now),
+            "cooldown_remaining": round(max(0.0, self.open_until - now), 1) if self.state == OPEN else 0,
+            "consecutive_trips": self.trips,
+            "last_reason": self.last_reason,
+            "error_rate": round(self.error_rate(now), 3),
+            "window_requests": len(self._outcomes),
+            "tokens": round(self.bucket.tokens, 2) if self.bucket is not None else None,
+            "totals": dict(self.totals),
+        }
+
+
+class AccountScheduler:
+    """
+    按账号汇总健康状态，供 RequestDispatcher 作为准入控制使用：
+    allows(instance) 过滤不可用账号的实例，admit(instance) 在分配时扣减令牌，
+    retry_in(instance) 告诉调度器何时重新检查被暂时挡住的实例。
+    """
+    def __init__(self, account_of: Callable[[Any], str], rate_per_minute: float, burst: int, window: float,
+                 error_threshold: float, min_requests: int, base_cooldown: float, max_cooldown: float,
+                 probe_timeout: float):
+        self.account_of = account_of
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.window = window
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+        self.accounts: Dict[str, AccountHealth] = {}
+
+    def health(self, name: str) -> AccountHealth:
+        account = self.accounts.get(name)
+        if account is None:
+            bucket = TokenBucket(self.rate_per_minute / 60, self.burst) if self.rate_per_minute > 0 else None
+            account = AccountHealth(name, bucket, self.window, self.error_threshold, self.min_requests,
+                                    self.base_cooldown, self.max_cooldown, self.probe_timeout)
+            self.accounts[name] = account
+        return account
+
+    def forget(self, name: str):
+        """账号不再存在 (匿名实例退役)：丢弃健康状态及其监控时间序列"""
+        if self.accounts.pop(name, None) is not None:
+            metrics.forget_account(name)
+
+    def allows(self, instance: Any) -> bool:
+        return self.health(self.account_of(instance)).allows()
+
+    def admit(self, instance: Any):
+        self.health(self.account_of(instance)).admit()
+
+    def retry_in(self, instance: Any) -> float:
+        return self.health(self.account_of(instance)).retry_in()
+
+    def record(self, instance: Any, outcome: str) -> bool:
+        return self.health(self.account_of(instance)).record(outcome)
+
+    def soonest_retry(self) -> int:
+        """所有账号中最早恢复可用的秒数，用于限流响应的 Retry-After"""
+        waits = [a.retry_in() for a in self.accounts.values()]
+        return max(1, math.ceil(min(waits))) if waits else 1
+
+    def stats(self):
+        now = time.monotonic()
+        return [a.as_dict(now) for a in sorted(self.accounts.values(), key=lambda a: a.name)]
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import AbstractSet, Iterator, List, Set, Tuple
+
+from loguru import logger
+
+
+class ArtifactStore:
+    """
+    有容量和时间上限的调试产物目录 (录屏 / 截图 / DOM 快照 / Playwright trace)。
+
+    每次写入后调用 enforce()：先删除超过 max_age 秒的文件，
+    再按最近访问时间 (LRU) 从旧到新删除，直到总大小不超过 max_bytes。
+    通过 writing() 取得的路径在写入完成前不会被淘汰；事件循环中使用 enforce_async()，目录扫描在线程池中执行。
+    """
+    def __init__(self, root: Path, max_bytes: int, max_age: float):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evicted = 0
+        self._writing: Set[Path] = set()
+
+    def new_path(self, stem: str, suffix: str) -> Path:
+        return self.root / f"{stem}{suffix}"
+
+    def hold(self, path: Path):
+        """标记仍在写入的文件 (如打开中的 context 的录屏)，淘汰时跳过"""
+        self._writing.add(Path(path))
+
+    def unhold(self, path: Path):
+        self._writing.discard(Path(path))
+
+    @contextmanager
+    def writing(self, stem: str, suffix: str) -> Iterator[Path]:
+        """取得一个新产物的路径，并在写入期间保护它不被淘汰"""
+        path = self.new_path(stem, suffix)
+        self.hold(path)
+        try:
+            yield path
+        finally:
+            self.unhold(path)
+
+    async def enforce_async(self):
+        await asyncio.to_thread(self.enforce, frozenset(self._writing))
+
+    def enforce(self, skip: AbstractSet[Path] = frozenset()):
+        now = time.time()
+        files: List[Tuple[float, int, Path]] = []
+        for path in self.root.rglob("*"):
+            if path in skip:
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if not path.is_file():
+                continue
+            last_used = max(stat.st_atime, stat.st_mtime)
+            if self.max_age and now - stat.st_mtime > self.max_age:
+                self._evict(path)
+                continue
+            files.append((last_used, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            self._evict(path)
+            total -= size
+
+    def _evict(self, path: Path):
+        try:
+            os.remove(path)
+            self.evicted += 1
+            logger.debug(f"🧹 调试产物已淘汰: {path.as_posix()}")
+        except FileNotFoundError:
+            pass  # 并发的另一次清理已删除
+        except OSError as e:
+            logger.warning(f"无法删除调试产物 {path.as_posix()}: {e}")
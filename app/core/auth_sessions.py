@@ -0,0 +1,159 @@
+"""
+登录会话池：把 inject_session.py / initial_login.py 生成的 user_data_N 目录在启动时一次性加载为内存中的
+Playwright storage_state，新建 BrowserContext 时直接注入。与持久化 profile 目录相比，
+从 storage_state 创建 context 几乎没有开销，且同一个会话可以被任意多个 context 同时使用。
+
+每个目录按以下顺序取得登录状态:
+    1. storage_state.json  本服务上次导出的缓存 (包含 Google 轮换后的最新 Cookie)
+    2. session.json        inject_session.py 写出的 Cookie
+    3. 持久化 profile      initial_login.py 登录过的 Chromium 用户目录 (启动一次无头持久化上下文导出)
+"""
+import asyncio
+import glob
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from playwright.async_api import Playwright
+
+STORAGE_STATE_FILE = "storage_state.json"
+SESSION_FILE = "session.json"
+# __Host- Cookie 只能绑定到具体站点
+GEMINI_URL = "https://gemini.google.com"
+
+
+class AuthSession:
+    """一个已登录账号的 storage_state，以及它被固定到的实例数和最近一次有效性检查结果"""
+    def __init__(self, directory: Path, state: Dict[str, Any], source: str):
+        self.directory = directory
+        self.state = state
+        self.source = source
+        self.instances = 0
+        self.valid = True
+        self.last_checked: Optional[float] = None
+
+    @property
+    def name(self) -> str:
+        return self.directory.name
+
+    def update_state(self, state: Dict[str, Any]):
+        """保存浏览器中轮换后的 Cookie，下次启动直接从缓存加载"""
+        self.state = state
+        path = self.directory / STORAGE_STATE_FILE
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "source": self.source,
+            "valid": self.valid,
+            "instances": self.instances,
+            "cookies": len(self.state.get("cookies", [])),
+            "last_checked": int(self.last_checked) if self.last_checked else None,
+        }
+
+
+def session_cookie(name: str, value: str, domain: str = ".google.com") -> Dict[str, Any]:
+    """
+    按注入时的默认属性补全一个 Cookie。__Host- 前缀的 Cookie 必须是 host-only (不能带 domain)、
+    path 为 "/" 且 secure，否则浏览器拒绝写入，因此改用 url 指定 (path 由 url 推出为 "/")
+    """
+    cookie = {"name": name, "value": value, "expires": -1, "httpOnly": True, "secure": True, "sameSite": "Lax"}
+    if name.startswith("__Host-"):
+        cookie["url"] = GEMINI_URL
+    else:
+        cookie.update({"domain": domain, "path": "/"})
+    return cookie
+
+
+def _state_from_session_file(path: Path) -> Dict[str, Any]:
+    """inject_session.py 的 session.json 只有 Cookie 名和值，按注入时的默认属性补全"""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    cookies = [session_cookie(name, value) for name, value in (data.get("cookies") or {}).items()]
+    return {"cookies": cookies, "origins": []}
+
+
+async def _state_from_profile(playwright: Playwright, directory: Path, user_agent: str) -> Dict[str, Any]:
+    context = await playwright.chromium.launch_persistent_context(
+        directory.as_posix(),
+        headless=True,
+        user_agent=user_agent,
+        args=['--no-sandbox', '--disable-setuid-sandbox'],
+    )
+    try:
+        return await context.storage_state()
+    finally:
+        await context.close()
+
+
+async def load_session(playwright: Playwright, directory: Path, user_agent: str) -> Optional[AuthSession]:
+    cached = directory / STORAGE_STATE_FILE
+    session_file = directory / SESSION_FILE
+    try:
+        if cached.exists():
+            return AuthSession(directory, json.loads(cached.read_text(encoding="utf-8")), STORAGE_STATE_FILE)
+        if session_file.exists():
+            return AuthSession(directory, _state_from_session_file(session_file), SESSION_FILE)
+        session = AuthSession(directory, await _state_from_profile(playwright, directory, user_agent), "profile")
+        await asyncio.to_thread(session.update_state, session.state)
+        return session
+    except Exception as e:
+        logger.error(f"❌ 无法加载登录会话 {directory}: {e}")
+        return None
+
+
+class AuthSessionPool:
+    """
+    登录会话池：每个浏览器实例固定使用一个会话 (同实例的所有页面共享该账号)，
+    分配时选择当前固定实例数最少的有效会话；没有有效会话时返回 None (实例退回匿名模式)。
+    """
+    def __init__(self, sessions: List[AuthSession]):
+        self.sessions = sessions
+
+    @classmethod
+    async def load(cls, playwright: Playwright, patterns: List[str], user_agent: str) -> "AuthSessionPool":
+        directories = sorted({Path(p) for pattern in patterns for p in glob.glob(pattern) if Path(p).is_dir()})
+        sessions = []
+        for directory in directories:
+            session = await load_session(playwright, directory, user_agent)
+            if session is None:
+                continue
+            if not session.state.get("cookies"):
+                logger.warning(f"⚠️ 登录会话 {session.name} 没有任何 Cookie，已跳过。")
+                continue
+            logger.info(f"  - 已加载登录会话 {session.name} (来源: {session.source}，{len(session.state['cookies'])} 个 Cookie)")
+            sessions.append(session)
+        return cls(sessions)
+
+    def assign(self) -> Optional[AuthSession]:
+        valid = [s for s in self.sessions if s.valid]
+        if not valid:
+            return None
+        session = min(valid, key=lambda s: s.instances)
+        session.instances += 1
+        return session
+
+    @staticmethod
+    def release(session: Optional[AuthSession]):
+        if session is not None:
+            session.instances = max(0, session.instances - 1)
+
+    def mark(self, session: AuthSession, valid: bool):
+        session.last_checked = time.time()
+        if session.valid and not valid:
+            logger.error(f"🔒 登录会话 {session.name} 已失效，固定到它的实例将改用其它会话。请重新运行 inject_session.py 或 initial_login.py。")
+        elif not session.valid and valid:
+            logger.success(f"🔓 登录会话 {session.name} 已恢复有效。")
+        session.valid = valid
+
+    @property
+    def valid_count(self) -> int:
+        return sum(1 for s in self.sessions if s.valid)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [s.as_dict() for s in self.sessions]
@@ -0,0 +1,118 @@
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+
+class ScaleDecision:
+    """一次扩缩容决策：delta > 0 扩容，< 0 缩容"""
+    def __init__(self, delta: int, current: int, reason: str, utilization: float, queue_depth: float):
+        self.delta = delta
+        self.current = current
+        self.reason = reason
+        self.utilization = utilization
+        self.queue_depth = queue_depth
+        self.at = time.time()
+
+    @property
+    def target(self) -> int:
+        return self.current + self.delta
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "at": int(self.at),
+            "action": "scale_up" if self.delta > 0 else "scale_down",
+            "from": self.current,
+            "to": self.target,
+            "reason": self.reason,
+            "utilization": round(self.utilization, 3),
+            "queue_depth": round(self.queue_depth, 2),
+        }
+
+
+class AutoscalePolicy:
+    """
+    浏览器池弹性伸缩策略 (只做决策，不负责启动/关闭实例)。
+
+    - 每次 observe() 记录一个采样 (排队数、占用槽位数、总槽位数)，只保留最近 window 秒。
+    - 扩容：窗口内平均占用率达到 up_utilization，或出现排队，且距上次扩容超过 up_cooldown。
+      扩容数量按当前排队数折算为实例数，在请求开始排队之前 (占用率高时) 就提前启动并预热实例。
+    - 缩容：窗口已采满、窗口内从未排队且平均占用率不高于 down_utilization，
+      且距上次扩缩容都超过 down_cooldown；每次只缩一个实例。
+    """
+    def __init__(self, min_instances: int, max_instances: int, window: float,
+                 up_utilization: float, down_utilization: float,
+                 up_cooldown: float, down_cooldown: float, slots_per_instance: int):
+        self.min_instances = max(0, min_instances)
+        self.max_instances = max(self.min_instances, max_instances)
+        self.window = window
+        self.up_utilization = up_utilization
+        self.down_utilization = down_utilization
+        self.up_cooldown = up_cooldown
+        self.down_cooldown = down_cooldown
+        self.slots_per_instance = max(1, slots_per_instance)
+        self._samples: Deque[Tuple[float, int, int, int]] = deque()
+        self._last_up = -math.inf
+        self._last_change = -math.inf
+        self.history: Deque[ScaleDecision] = deque(maxlen=50)
+
+    def clamp(self, size: int) -> int:
+        return min(self.max_instances, max(self.min_instances, size))
+
+    def observe(self, queue_depth: int, in_flight: int, capacity: int, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self._samples.append((now, queue_depth, in_flight, capacity))
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+
+    def window_stats(self) -> Dict[str, float]:
+        if not self._samples:
+            return {"utilization": 0.0, "avg_queue": 0.0, "peak_queue": 0, "samples": 0}
+        utilization = [min(1.0, in_flight / capacity) if capacity else 1.0 for _, _, in_flight, capacity in self._samples]
+        queues = [queue for _, queue, _, _ in self._samples]
+        return {
+            "utilization": sum(utilization) / len(utilization),
+            "avg_queue": sum(queues) / len(queues),
+            "peak_queue": max(queues),
+            "samples": len(self._samples),
+        }
+
+    def decide(self, current: int, can_shrink: bool = True, now: Optional[float] = None) -> Optional[ScaleDecision]:
+        """current 为当前本地实例数 (含正在启动的实例)，can_shrink 表示是否有可排空的空闲实例；不需要调整时返回 None"""
+        now = time.monotonic() if now is None else now
+        if not self._samples:
+            return None
+        stats = self.window_stats()
+        utilization, avg_queue = stats["utilization"], stats["avg_queue"]
+        latest_queue = self._samples[-1][1]
+
+        if current < self.min_instances and now - self._last_up >= self.up_cooldown:
+            return self._record(ScaleDecision(self.min_instances - current, current, "低于最小实例数", utilization, avg_queue), now)
+
+        if current < self.max_instances and now - self._last_up >= self.up_cooldown:
+            if latest_queue > 0:
+                delta = min(self.max_instances - current, max(1, math.ceil(latest_queue / self.slots_per_instance)))
+                return self._record(ScaleDecision(delta, current, f"排队 {latest_queue} 个请求", utilization, avg_queue), now)
+            if utilization >= self.up_utilization:
+                return self._record(ScaleDecision(1, current, f"平均占用率 {utilization:.0%}", utilization, avg_queue), now)
+
+        window_full = now - self._samples[0][0] >= self.window * 0.9
+        if (can_shrink and current > self.min_instances and window_full and stats["peak_queue"] == 0
+                and utilization <= self.down_utilization and now - self._last_change >= self.down_cooldown):
+            return self._record(ScaleDecision(-1, current, f"空闲 (平均占用率 {utilization:.0%})", utilization, avg_queue), now)
+        return None
+
+    def _record(self, decision: ScaleDecision, now: float) -> ScaleDecision:
+        if decision.delta > 0:
+            self._last_up = now
+        self._last_change = now
+        self.history.append(decision)
+        return decision
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "min_instances": self.min_instances,
+            "max_instances": self.max_instances,
+            "window": {k: round(v, 3) for k, v in self.window_stats().items()},
+            "decisions": [d.as_dict() for d in reversed(self.history)],
+        }
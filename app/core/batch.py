@@ -0,0 +1,373 @@
+"""
+离线批处理：OpenAI Batch API (/v1/files + /v1/batches) 的兼容子集。
+
+目录布局 (BATCH_DIR):
+    files/<file_id>.jsonl        上传的输入文件，以及批任务的输出 / 错误文件
+    files/<file_id>.json         文件元数据
+    batches/<batch_id>.json      批任务状态
+    batches/<batch_id>.cancel    取消标记 (任意 worker 都可写入)
+    .runner.lock                 执行者锁
+
+所有 API worker 共享同一目录，但同一时刻只有持有 .runner.lock 的进程执行批任务。
+结果先在内存中缓冲，约每秒随进度一起追加写入输出文件 (磁盘读写都放到线程中，不阻塞事件循环)；
+重启后跳过输出 / 错误文件中已出现的 custom_id，从未完成的行继续。
+"""
+import asyncio
+import fcntl
+import json
+import os
+import time
+import uuid
+from email import policy
+from email.parser import BytesParser
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from loguru import logger
+
+from app.providers.base_provider import BaseProvider
+
+SUPPORTED_ENDPOINTS = ("/v1/chat/completions",)
+ACTIVE_STATUSES = ("validating", "in_progress", "finalizing", "cancelling")
+# 以下状态码视为暂时性错误，退避后重试同一行
+RETRY_STATUS_CODES = (429, 502, 503)
+MAX_ATTEMPTS = 3
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}{uuid.uuid4().hex[:24]}"
+
+
+def _write_json(path: Path, data: Dict[str, Any]):
+    """先写临时文件再替换，其它 worker 读取时不会看到写了一半的内容"""
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def parse_upload(content_type: str, body: bytes) -> Tuple[bytes, Optional[str], Dict[str, str]]:
+    """
+    解析 /v1/files 的上传内容：multipart/form-data (OpenAI SDK 的格式) 或直接以请求体上传的 JSONL。
+    返回 (文件内容, 文件名, 其它表单字段)。
+    """
+    if not content_type.lower().startswith("multipart/form-data"):
+        return body, None, {}
+    message = BytesParser(policy=policy.HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+    content, filename, fields = None, None, {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if part.get_filename() is not None or name == "file":
+            content = part.get_payload(decode=True)
+            filename = part.get_filename()
+        elif name:
+            fields[name] = part.get_payload(decode=True).decode("utf-8").strip()
+    if content is None:
+        raise ValueError("multipart 表单中缺少 file 字段。")
+    return content, filename, fields
+
+
+class BatchStore:
+    """批处理文件与任务状态的磁盘存储，各 API worker 共享"""
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.files_dir = self.root / "files"
+        self.batches_dir = self.root / "batches"
+        self.files_dir.mkdir(parents=True, exist_ok=True)
+        self.batches_dir.mkdir(parents=True, exist_ok=True)
+
+    # -----------------------------------------------
+    # 文件
+    # -----------------------------------------------
+    def file_path(self, file_id: str) -> Path:
+        return self.files_dir / f"{Path(file_id).name}.jsonl"
+
+    def _new_file(self, filename: str, purpose: str) -> Dict[str, Any]:
+        file = {"id": _new_id("file-"), "object": "file", "bytes": 0, "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose}
+        self.file_path(file["id"]).touch()
+        _write_json(self.files_dir / f"{file['id']}.json", file)
+        return file
+
+    def create_file(self, content: bytes, filename: Optional[str], purpose: str) -> Dict[str, Any]:
+        file = self._new_file(filename or "upload.jsonl", purpose)
+        self.file_path(file["id"]).write_bytes(content)
+        file["bytes"] = len(content)
+        _write_json(self.files_dir / f"{file['id']}.json", file)
+        return file
+
+    def get_file(self, file_id: str) -> Optional[Dict[str, Any]]:
+        path = self.files_dir / f"{Path(file_id).name}.json"
+        if not path.exists():
+            return None
+        file = json.loads(path.read_text(encoding="utf-8"))
+        file["bytes"] = self.file_path(file_id).stat().st_size  # 输出文件在执行过程中不断增长
+        return file
+
+    # -----------------------------------------------
+    # 批任务
+    # -----------------------------------------------
+    def _batch_path(self, batch_id: str) -> Path:
+        return self.batches_dir / f"{Path(batch_id).name}.json"
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str,
+                     metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """校验输入文件后创建批任务，交由执行者异步处理；输入不合法时抛出 ValueError"""
+        if endpoint not in SUPPORTED_ENDPOINTS:
+            raise ValueError(f"不支持的 endpoint: {endpoint}，目前仅支持 {', '.join(SUPPORTED_ENDPOINTS)}。")
+        if self.get_file(input_file_id) is None:
+            raise ValueError(f"输入文件不存在: {input_file_id}")
+        total = 0
+        custom_ids: Set[str] = set()
+        for line_no, item in iter_requests(self.file_path(input_file_id)):
+            if not isinstance(item, dict) or not isinstance(item.get("body"), dict):
+                raise ValueError(f"第 {line_no} 行缺少请求体 body。")
+            custom_id = item.get("custom_id")
+            if not custom_id or custom_id in custom_ids:
+                raise ValueError(f"第 {line_no} 行的 custom_id 缺失或重复。")
+            if item.get("url", endpoint) != endpoint:
+                raise ValueError(f"第 {line_no} 行的 url 与批任务的 endpoint 不一致。")
+            custom_ids.add(custom_id)
+            total += 1
+        if not total:
+            raise ValueError("输入文件中没有任何请求。")
+
+        now = int(time.time())
+        batch = {
+            "id": _new_id("batch_"),
+            "object": "batch",
+            "endpoint": endpoint,
+            "errors": None,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": "in_progress",
+            "output_file_id": self._new_file("batch_output.jsonl", "batch_output")["id"],
+            "error_file_id": self._new_file("batch_errors.jsonl", "batch_output")["id"],
+            "created_at": now,
+            "in_progress_at": now,
+            "expires_at": None,
+            "finalizing_at": None,
+            "completed_at": None,
+            "failed_at": None,
+            "expired_at": None,
+            "cancelling_at": None,
+            "cancelled_at": None,
+            "request_counts": {"total": total, "completed": 0, "failed": 0},
+            "metadata": metadata,
+        }
+        self.save_batch(batch)
+        return batch
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        path = self._batch_path(batch_id)
+        if not path.exists():
+            return None
+        batch = json.loads(path.read_text(encoding="utf-8"))
+        if batch["status"] in ACTIVE_STATUSES and self.cancel_requested(batch_id):
+            batch["status"] = "cancelling"
+        return batch
+
+    def save_batch(self, batch: Dict[str, Any]):
+        _write_json(self._batch_path(batch["id"]), batch)
+
+    def list_batches(self, limit: int = 20) -> List[Dict[str, Any]]:
+        batches = [self.get_batch(p.stem) for p in self.batches_dir.glob("*.json")]
+        batches = [b for b in batches if b is not None]
+        batches.sort(key=lambda b: b["created_at"], reverse=True)
+        return batches[:limit]
+
+    def request_cancel(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        batch = self.get_batch(batch_id)
+        if batch is None or batch["status"] not in ACTIVE_STATUSES:
+            return batch
+        self.batches_dir.joinpath(f"{batch['id']}.cancel").touch()
+        batch["status"] = "cancelling"
+        batch["cancelling_at"] = batch["cancelling_at"] or int(time.time())
+        return batch
+
+    def cancel_requested(self, batch_id: str) -> bool:
+        return self.batches_dir.joinpath(f"{Path(batch_id).name}.cancel").exists()
+
+    def pending_batches(self) -> List[Dict[str, Any]]:
+        """尚未结束的批任务，按创建时间先后执行"""
+        batches = [b for b in self.list_batches(limit=1_000_000) if b["status"] in ACTIVE_STATUSES]
+        return sorted(batches, key=lambda b: b["created_at"])
+
+
+def iter_requests(path: Path) -> Iterator[Tuple[int, Any]]:
+    """逐行读取 JSONL 请求 (跳过空行)，返回 (行号, 解析结果)"""
+    with path.open("r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"第 {line_no} 行不是合法的 JSON: {e}")
+
+
+def _pending_requests(path: Path, finished: Set[str]) -> List[Dict[str, Any]]:
+    """读取输入文件中尚未完成的请求"""
+    return [item for _, item in iter_requests(path) if item["custom_id"] not in finished]
+
+
+def _append_lines(path: Path, lines: List[str]):
+    if lines:
+        with path.open("a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+
+def _finished_lines(path: Path) -> Tuple[Set[str], int]:
+    """读取已写入的结果，返回已完成的 custom_id 及行数；截掉进程中断时写了一半的最后一行"""
+    data = path.read_bytes()
+    if data and not data.endswith(b"\n"):
+        data = data[:data.rfind(b"\n") + 1]
+        with path.open("r+b") as f:
+            f.truncate(len(data))
+    custom_ids = set()
+    for line in data.splitlines():
+        if line.strip():
+            custom_ids.add(json.loads(line)["custom_id"])
+    return custom_ids, len(custom_ids)
+
+
+class BatchRunner:
+    """
+    批任务执行者：持有 .runner.lock 的进程按创建顺序逐个执行批任务，
+    每个任务内以 concurrency 个并发请求调用 provider，请求标记为 priority=batch 只使用空闲容量。
+    """
+    def __init__(self, provider: BaseProvider, store: BatchStore, concurrency: int, scan_interval: float = 2.0,
+                 progress_interval: float = 1.0):
+        self.provider = provider
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self.scan_interval = scan_interval
+        self.progress_interval = progress_interval
+        self._task: Optional[asyncio.Task] = None
+        self._lock_file = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._lock_file:
+            self._lock_file.close()  # 关闭文件即释放 flock，其它 worker 可以接管
+
+    def _try_lock(self) -> bool:
+        if self._lock_file is None:
+            self._lock_file = open(self.store.root / ".runner.lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    async def _loop(self):
+        while not self._try_lock():
+            await asyncio.sleep(self.scan_interval * 5)
+        logger.info(f"📦 本进程 (pid {os.getpid()}) 负责执行批处理任务。")
+        while True:
+            try:
+                for batch in await asyncio.to_thread(self.store.pending_batches):
+                    await self._run(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"批处理执行循环出错: {e}")
+            await asyncio.sleep(self.scan_interval)
+
+    async def _run(self, batch: Dict[str, Any]):
+        batch_id = batch["id"]
+        output_path = self.store.file_path(batch["output_file_id"])
+        error_path = self.store.file_path(batch["error_file_id"])
+        (completed_ids, completed), (failed_ids, failed) = await asyncio.gather(
+            asyncio.to_thread(_finished_lines, output_path), asyncio.to_thread(_finished_lines, error_path))
+        finished = completed_ids | failed_ids
+        counts = batch["request_counts"]
+        counts["completed"], counts["failed"] = completed, failed
+        if finished:
+            logger.info(f"📦 恢复批任务 {batch_id}：跳过已完成的 {len(finished)}/{counts['total']} 行。")
+        else:
+            logger.info(f"📦 开始执行批任务 {batch_id} ({counts['total']} 行，并发 {self.concurrency})。")
+
+        pending = iter(await asyncio.to_thread(_pending_requests, self.store.file_path(batch["input_file_id"]), finished))
+        buffered: Dict[Path, List[str]] = {output_path: [], error_path: []}
+        flush_lock = asyncio.Lock()
+        cancelled = await asyncio.to_thread(self.store.cancel_requested, batch_id)
+        last_saved = time.monotonic()
+
+        async def flush():
+            """把缓冲的结果行与当前进度一起写盘，并检查取消标记"""
+            nonlocal cancelled
+            async with flush_lock:
+                lines = dict(buffered)
+                for path in buffered:
+                    buffered[path] = []
+                snapshot = dict(batch, request_counts=dict(counts))
+                cancelled = await asyncio.to_thread(self._save_progress, snapshot, lines)
+                batch.update(status=snapshot["status"], cancelling_at=snapshot["cancelling_at"])
+
+        async def worker():
+            nonlocal last_saved
+            for item in pending:
+                if cancelled:
+                    return
+                line, ok = await self._execute(item)
+                buffered[output_path if ok else error_path].append(json.dumps(line, ensure_ascii=False) + "\n")
+                counts["completed" if ok else "failed"] += 1
+                if time.monotonic() - last_saved >= self.progress_interval and not flush_lock.locked():
+                    last_saved = time.monotonic()
+                    await flush()
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            # 进程退出时也把已完成的结果写盘，重启后不必重跑
+            await flush()
+
+        now = int(time.time())
+        if cancelled:
+            batch.update(status="cancelled", cancelled_at=now, cancelling_at=batch["cancelling_at"] or now)
+            logger.warning(f"📦 批任务 {batch_id} 已取消 (完成 {counts['completed']}，失败 {counts['failed']})。")
+        else:
+            batch.update(status="completed", finalizing_at=now, completed_at=now)
+            logger.success(f"📦 批任务 {batch_id} 完成 (成功 {counts['completed']}，失败 {counts['failed']})。")
+        await asyncio.to_thread(self.store.save_batch, batch)
+
+    def _save_progress(self, batch: Dict[str, Any], lines: Dict[Path, List[str]]) -> bool:
+        """在线程中执行：追加结果行并保存进度，返回是否已请求取消"""
+        for path, chunk in lines.items():
+            _append_lines(path, chunk)
+        cancelled = self.store.cancel_requested(batch["id"])
+        if cancelled and batch["status"] != "cancelling":
+            batch.update(status="cancelling", cancelling_at=int(time.time()))
+        self.store.save_batch(batch)
+        return cancelled
+
+    async def _execute(self, item: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """执行一行请求，返回 (输出行, 是否成功)；暂时性错误退避重试"""
+        request_data = dict(item["body"])
+        request_data["stream"] = False
+        request_data["priority"] = "batch"
+        line = {"id": _new_id("batch_req_"), "custom_id": item["custom_id"]}
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                response = await self.provider.chat_completion(request_data)
+                body = json.loads(response.body)
+                line.update(response={"status_code": response.status_code, "request_id": body.get("id"), "body": body}, error=None)
+                return line, True
+            except HTTPException as e:
+                if e.status_code in RETRY_STATUS_CODES and attempt < MAX_ATTEMPTS:
+                    retry_after = (e.headers or {}).get("Retry-After")
+                    await asyncio.sleep(float(retry_after) if retry_after else 2 ** attempt)
+                    continue
+                error = {"code": str(e.status_code), "message": str(e.detail)}
+                line.update(response={"status_code": e.status_code, "request_id": None, "body": {"error": error}}, error=error)
+                return line, False
+            except Exception as e:
+                error = {"code": "500", "message": f"内部服务器错误: {e}"}
+                line.update(response=None, error=error)
+                return line, False
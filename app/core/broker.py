@@ -0,0 +1,179 @@
+"""
+浏览器代理进程 (broker)：独占 Playwright 浏览器池，通过 Unix socket 为多个无状态 API worker 服务。
+
+浏览器容量仍由本进程内唯一的调度器统一管理，HTTP 解析、日志等工作则随 uvicorn worker 扩展到多核。
+
+协议为每行一个 JSON 的消息流，每个连接处理一个请求:
+    worker -> broker:  {"op": "chat", "request": {...}}  /  {"op": "stats"}  /  {"op": "metrics"}  /  {"op": "ready"}  /  {"op": "readiness"}
+    broker -> worker:  {"type": "start", "status": 200, "headers": {...}, "media_type": "..."}
+                       {"type": "chunk", "data": "..."}     (流式响应的每个分块原样转发)
+                       {"type": "end"}
+                       {"type": "error", "status": 502, "detail": "...", "headers": {...}}
+                       {"type": "result", "data": ...}      (stats / metrics / ready / readiness)
+worker 关闭连接即表示客户端已断开，broker 会取消对应的浏览器交互。
+
+用法 (在项目根目录，PROVIDER_MODE 决定 broker 内部使用的 Provider):
+    python -m app.core.broker
+    PROVIDER_MODE=broker uvicorn main:app --workers 4
+"""
+import asyncio
+import json
+import os
+import signal
+import sys
+from pathlib import Path
+from typing import Any, Dict
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from loguru import logger
+
+from app.core.config import settings
+from app.providers.base_provider import BaseProvider, ReleasingStreamingResponse
+
+# 单行消息上限 (长对话历史可能很大)
+MESSAGE_LIMIT = 16 * 1024 * 1024
+
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+class BrokerServer:
+    """把 Unix socket 上的请求转交给进程内的 Provider，并把响应逐块写回"""
+    def __init__(self, provider: BaseProvider, socket_path: str):
+        self.provider = provider
+        self.socket_path = socket_path
+        self._server: asyncio.AbstractServer = None
+
+    async def start(self):
+        path = Path(self.socket_path)
+        if path.exists():
+            path.unlink()  # 上次异常退出遗留的 socket 文件
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path, limit=MESSAGE_LIMIT)
+        os.chmod(self.socket_path, 0o660)
+        logger.success(f"✅ 浏览器代理进程已在 {self.socket_path} 上监听。")
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            op = message.get("op")
+            if op == "chat":
+                await self._serve_chat(message.get("request") or {}, reader, writer)
+            elif op == "stats":
+                await self._reply(writer, {"type": "result", "data": await self.provider.stats()})
+            elif op == "metrics":
+                data = (await self.provider.render_metrics()).decode("utf-8")
+                await self._reply(writer, {"type": "result", "data": data})
+            elif op == "ready":
+                await self._reply(writer, {"type": "result", "data": self.provider.is_ready()})
+            elif op == "readiness":
+                await self._reply(writer, {"type": "result", "data": await self.provider.readiness()})
+            else:
+                await self._reply(writer, {"type": "error", "status": 400, "detail": f"未知操作: {op}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"代理请求处理失败: {e}")
+        finally:
+            writer.close()
+
+    async def _serve_chat(self, request_data: Dict[str, Any], reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """执行请求并转发响应；worker 提前关闭连接时取消浏览器交互"""
+        work = asyncio.create_task(self._forward_chat(request_data, writer))
+        disconnected = asyncio.create_task(reader.read())  # worker 不会再发送数据，返回即表示连接已关闭
+        try:
+            done, _ = await asyncio.wait({work, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if work not in done:
+                logger.info("🔌 API worker 已断开，取消对应的浏览器交互。")
+                work.cancel()
+            await asyncio.gather(work, return_exceptions=True)
+        finally:
+            disconnected.cancel()
+
+    async def _forward_chat(self, request_data: Dict[str, Any], writer: asyncio.StreamWriter):
+        try:
+            response = await self.provider.chat_completion(request_data)
+        except HTTPException as e:
+            await self._reply(writer, {"type": "error", "status": e.status_code, "detail": e.detail, "headers": dict(e.headers or {})})
+            return
+        except Exception as e:
+            logger.error(f"代理进程处理聊天请求失败: {e}")
+            await self._reply(writer, {"type": "error", "status": 500, "detail": f"内部服务器错误: {e}"})
+            return
+
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in ("content-length", "content-type")}
+        try:
+            await self._reply(writer, {"type": "start", "status": response.status_code, "headers": headers, "media_type": response.media_type})
+            if isinstance(response, StreamingResponse):
+                async for chunk in response.body_iterator:
+                    data = chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+                    await self._reply(writer, {"type": "chunk", "data": data})
+            else:
+                await self._reply(writer, {"type": "chunk", "data": response.body.decode("utf-8")})
+        finally:
+            # worker 在首个分块前断开时正文从未开始迭代，订阅/上游连接同样需要释放
+            if isinstance(response, ReleasingStreamingResponse):
+                await response.release()
+            elif isinstance(response, StreamingResponse) and hasattr(response.body_iterator, "aclose"):
+                await response.body_iterator.aclose()
+        await self._reply(writer, {"type": "end"})
+
+    @staticmethod
+    async def _reply(writer: asyncio.StreamWriter, message: Dict[str, Any]):
+        writer.write(encode_message(message))
+        await writer.drain()
+
+
+def create_backend_provider() -> BaseProvider:
+    """broker 内部实际访问 Gemini 的 Provider，由 PROVIDER_MODE 决定"""
+    if settings.PROVIDER_MODE == "http":
+        from app.providers.gemini_http_provider import GeminiHttpProvider
+        return GeminiHttpProvider()
+    from app.providers.gemini_provider import GeminiProvider
+    return GeminiProvider()
+
+
+async def run_broker():
+    if settings.PROVIDER_MODE == "broker":
+        logger.error("🚫 代理进程自身不能使用 PROVIDER_MODE=broker，请设置为 browser 或 http。")
+        return
+
+    provider = create_backend_provider()
+    await provider.initialize()
+    server = BrokerServer(provider, settings.BROKER_SOCKET_PATH)
+    await server.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("代理进程关闭中...")
+    await server.close()
+    await provider.close()
+
+
+if __name__ == "__main__":
+    logger.remove()
+    logger.add(
+        sys.stdout,
+        level="INFO",
+        format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}:{function}:{line}</cyan> - <level>{message}</level>",
+        colorize=True
+    )
+    asyncio.run(run_broker())
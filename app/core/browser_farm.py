@@ -0,0 +1,44 @@
+from typing import List
+from urllib.parse import urlparse
+
+from playwright.async_api import Browser, Playwright
+
+# 连接方式: "playwright" = Playwright 浏览器服务 (playwright run-server)，"cdp" = Chrome DevTools 协议端口
+ENDPOINT_KINDS = ("playwright", "cdp")
+
+
+class RemoteEndpoint:
+    """
+    一个远程浏览器节点。配置格式为 "[类型|]地址[|并发槽位数]"，例如:
+        ws://10.0.0.5:3000/                 (ws 地址默认按 Playwright 服务连接)
+        cdp|http://10.0.0.6:9222|4          (http 地址默认按 CDP 连接)
+    """
+    def __init__(self, kind: str, url: str, capacity: int):
+        self.kind = kind
+        self.url = url
+        self.capacity = max(1, capacity)
+
+    @property
+    def name(self) -> str:
+        return f"Remote-{urlparse(self.url).netloc or self.url}"
+
+    @classmethod
+    def parse(cls, spec: str, default_capacity: int) -> "RemoteEndpoint":
+        parts = [p.strip() for p in spec.split("|")]
+        kind = parts.pop(0) if parts[0] in ENDPOINT_KINDS else None
+        if not parts or not parts[0]:
+            raise ValueError(f"远程浏览器配置缺少地址: {spec!r}")
+        url = parts[0]
+        capacity = int(parts[1]) if len(parts) > 1 and parts[1] else default_capacity
+        if kind is None:
+            kind = "cdp" if url.startswith(("http://", "https://")) else "playwright"
+        return cls(kind, url, capacity)
+
+    async def connect(self, playwright: Playwright, timeout_ms: float) -> Browser:
+        if self.kind == "cdp":
+            return await playwright.chromium.connect_over_cdp(self.url, timeout=timeout_ms)
+        return await playwright.chromium.connect(self.url, timeout=timeout_ms)
+
+
+def parse_endpoints(specs: List[str], default_capacity: int) -> List[RemoteEndpoint]:
+    return [RemoteEndpoint.parse(spec, default_capacity) for spec in specs if spec.strip()]
@@ -0,0 +1,51 @@
+import os
+import time
+from typing import Iterable, Optional
+
+from playwright.async_api import Browser
+
+
+async def browser_process_ids(browser: Browser) -> list:
+    """通过 CDP SystemInfo.getProcessInfo 取得该浏览器的全部进程 (browser / renderer / GPU ...) 的 PID"""
+    session = await browser.new_browser_cdp_session()
+    try:
+        info = await session.send("SystemInfo.getProcessInfo")
+    finally:
+        await session.detach()
+    return [p["id"] for p in info.get("processInfo", []) if p.get("id")]
+
+
+def read_rss_mb(pids: Iterable[int]) -> float:
+    """从 /proc 读取进程 RSS 总和；进程已退出或不在本机时忽略"""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / (1024 * 1024)
+
+
+class RecyclePolicy:
+    """浏览器实例的回收阈值：累计请求数、存活时间、进程树 RSS (0 表示不限制)"""
+    def __init__(self, max_requests: int, max_age: float, max_rss_mb: float):
+        self.max_requests = max_requests
+        self.max_age = max_age
+        self.max_rss_mb = max_rss_mb
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_requests or self.max_age or self.max_rss_mb)
+
+    def reason(self, requests: int, created_at: float, rss_mb: Optional[float]) -> Optional[str]:
+        """返回需要回收的原因，未超过任何阈值时返回 None"""
+        if self.max_requests and requests >= self.max_requests:
+            return f"已处理 {requests} 个请求"
+        age = time.monotonic() - created_at
+        if self.max_age and age >= self.max_age:
+            return f"已运行 {age / 3600:.1f} 小时"
+        if self.max_rss_mb and rss_mb is not None and rss_mb >= self.max_rss_mb:
+            return f"内存占用 {rss_mb:.0f} MB"
+        return None
@@ -1,6 +1,7 @@
 import os
 import uuid
 # 修正这里的导入，确保只使用正确的名称 SettingsConfigDict
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import List, Optional
 from loguru import logger
@@ -21,12 +22,167 @@ class Settings(BaseSettings):
     NGINX_PORT: int = 8088
     PLAYWRIGHT_POOL_SIZE: int = 3
 
+    # Provider 模式: "browser" = Playwright 浏览器交互，"http" = 使用注入的会话直接调用 StreamGenerate，
+    # "broker" = 多 worker 部署中的 API worker，把请求转交给独占浏览器池的代理进程 (python -m app.core.broker)
+    PROVIDER_MODE: str = "browser"
+    BROKER_SOCKET_PATH: str = "/tmp/gemini-broker.sock"
+    # API worker 启动时等待代理进程就绪的最长时间 (秒)
+    BROKER_CONNECT_TIMEOUT: int = 180
+    # Gemini 站点地址 (两种模式共用)；离线压测时指向 benchmarks/mock_gemini.py，如 http://127.0.0.1:9100
+    GEMINI_BASE_URL: str = "https://gemini.google.com"
+    # 直连模式的会话文件 (inject_session.py 写入 user_data_N/session.json)
+    GEMINI_SESSION_FILE: str = "user_data_1/session.json"
+    HTTP_MAX_CONNECTIONS: int = 100
+
+    # 每个浏览器进程同时服务的对话数 (标签页槽位)，用更少的进程换取更高的并发
+    BROWSER_TABS_PER_INSTANCE: int = 1
+
+    # 登录会话模式：inject_session.py / initial_login.py 生成的会话目录 (支持通配符，如 ["user_data_*"])。
+    # 启动时一次性加载为 storage_state，每个实例固定使用一个会话；留空则为匿名模式。
+    # 每隔 AUTH_SESSION_CHECK_INTERVAL 秒检查会话是否仍处于登录状态，并保存浏览器中轮换后的 Cookie
+    AUTH_SESSION_DIRS: List[str] = []
+    AUTH_SESSION_CHECK_INTERVAL: int = 600
+
+    # 账号健康度调度 (登录会话为账号；匿名实例各自视为一个账号)：
+    # 每个账号每分钟最多 ACCOUNT_RATE_PER_MINUTE 个请求 (0 表示不限制)，允许 ACCOUNT_BURST 个突发；
+    # 检测到限流或 ACCOUNT_ERROR_WINDOW 秒内错误率达到阈值 (至少 ACCOUNT_MIN_REQUESTS 个样本) 时熔断，
+    # 冷却 ACCOUNT_COOLDOWN_BASE 秒，连续熔断时翻倍 (不超过 ACCOUNT_COOLDOWN_MAX)，冷却期间流量分配到其它账号。
+    # 默认关闭：只有一两个匿名实例时，几次普通失败就会让全部实例进入冷却，所有请求在队列中返回 429
+    ACCOUNT_HEALTH_ENABLED: bool = False
+    ACCOUNT_RATE_PER_MINUTE: float = 0
+    ACCOUNT_BURST: int = 5
+    ACCOUNT_ERROR_WINDOW: float = 300
+    ACCOUNT_ERROR_THRESHOLD: float = 0.5
+    ACCOUNT_MIN_REQUESTS: int = 5
+    ACCOUNT_COOLDOWN_BASE: float = 60
+    ACCOUNT_COOLDOWN_MAX: float = 1800
+
+    # 启动：所有实例并发启动，至少 READY_MIN_INSTANCES 个实例完成预热导航即视为就绪 (/readyz 返回 200)；
+    # 启动最多等待 STARTUP_TIMEOUT 秒，未完成的实例在后台继续启动
+    READY_MIN_INSTANCES: int = 1
+    STARTUP_TIMEOUT: float = 120
+
+    # 远程浏览器节点 (与本地启动的 PLAYWRIGHT_POOL_SIZE 个实例一起组成浏览器池)，格式 "[playwright|cdp|]地址[|槽位数]"，
+    # 如 ["ws://10.0.0.5:3000/", "cdp|http://10.0.0.6:9222|4"]；槽位数缺省为 BROWSER_TABS_PER_INSTANCE
+    REMOTE_BROWSER_ENDPOINTS: List[str] = []
+    REMOTE_CONNECT_TIMEOUT: int = 15
+    # 远程节点健康检查间隔 (秒)：失联节点移出池，恢复后自动重新加入
+    REMOTE_HEALTH_INTERVAL: int = 15
+
+    # 本地浏览器实例的回收阈值 (0 表示不限制)：累计请求数、存活小时数、进程树 RSS (MB)。
+    # 达到阈值时先启动替换实例，再排空并关闭旧实例；浏览器崩溃时立即替换
+    BROWSER_MAX_REQUESTS: int = 1000
+    BROWSER_MAX_AGE_HOURS: float = 12
+    BROWSER_MAX_RSS_MB: int = 2048
+    BROWSER_LIFECYCLE_INTERVAL: int = 30
+
+    # 弹性伸缩：本地实例数在 [MIN, MAX] 之间随负载调整 (PLAYWRIGHT_POOL_SIZE 为初始实例数)。
+    # 按 AUTOSCALE_WINDOW 秒滑动窗口内的平均占用率和排队数决策：占用率达到 UP 阈值或出现排队时提前扩容并预热，
+    # 窗口内无排队且占用率不高于 DOWN 阈值、并超过缩容冷却时间时，排空并关闭一个空闲实例
+    AUTOSCALE_ENABLED: bool = False
+    AUTOSCALE_MIN_INSTANCES: int = 1
+    AUTOSCALE_MAX_INSTANCES: int = 8
+    AUTOSCALE_INTERVAL: float = 5
+    AUTOSCALE_WINDOW: float = 60
+    AUTOSCALE_UP_UTILIZATION: float = 0.8
+    AUTOSCALE_DOWN_UTILIZATION: float = 0.3
+    AUTOSCALE_UP_COOLDOWN: float = 30
+    AUTOSCALE_DOWN_COOLDOWN: float = 300
+
+    # 每个浏览器实例预热的页面数 (不少于标签页槽位数) (已导航到 Gemini 且输入框就绪)
+    PAGE_POOL_SIZE: int = 2
+    # 单个预热页面最多复用的请求次数，超过后关闭并在后台补充新页面
+    PAGE_MAX_USES: int = 50
+    # 从页面池取页面的最长等待秒数 (含当场冷启动)，超时按页面准备失败处理
+    PAGE_ACQUIRE_TIMEOUT: float = 60
+
+    # 页面网络路由策略: "off" = 不拦截，"fast" = 仅按 URL/扩展名正则拦截 (放行的请求不经过 Python)，
+    # "precise" = 拦截全部请求并按资源类型精确屏蔽
+    ROUTE_POLICY: str = "fast"
+    ROUTE_BLOCK_RESOURCE_TYPES: List[str] = ["image", "media", "font"]
+    ROUTE_BLOCK_URL_PATTERNS: List[str] = [
+        "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+        "play.google.com/log", "/gen_204", "/jserror", "/csi?",
+    ]
+    # 永远放行的 URL 片段 (Gemini 应用正常工作所需)
+    ROUTE_ALLOW_URL_PATTERNS: List[str] = ["StreamGenerate", "batchexecute", "/_/BardChatUi/"]
+
+    # 调试采集策略: "off" = 不采集，"sampled" = 按请求抽样保存 trace (含截图/DOM 快照) + 失败现场，"failure" = 仅在失败时保存截图/DOM 快照
+    # DEBUG_CAPTURE_SAMPLE_RATE 为单个请求被抽中的概率
+    DEBUG_CAPTURE_MODE: str = "failure"
+    DEBUG_CAPTURE_SAMPLE_RATE: float = 0.01
+    # 失败时额外保存 Playwright trace (需要为每个页面持续录制 trace 分块)
+    DEBUG_CAPTURE_TRACE: bool = False
+    # 调试目录的容量/时间上限，超出后按 LRU 淘汰
+    DEBUG_ARTIFACT_MAX_MB: int = 200
+    DEBUG_ARTIFACT_MAX_AGE_HOURS: int = 72
+
+    # 回答缓存：按 消息 + 模型 + 采样参数 精确匹配，内存层 LRU + TTL，可选 SQLite 磁盘层 (重启后保留)。
+    # 默认关闭；开启后 temperature > 0 或 n > 1 的请求仍不使用缓存，除非请求体显式指定 "cache": true
+    CACHE_ENABLED: bool = False
+    CACHE_MAX_MB: int = 64
+    CACHE_TTL: int = 3600
+    CACHE_DISK_PATH: Optional[str] = None
+
+    # 合并同时进行的相同请求 (键与回答缓存一致)，只占用一个浏览器会话；默认关闭，绕过缓存的请求始终不合并
+    COALESCE_ENABLED: bool = False
+
+    # 会话保持：多轮对话复用仍持有该 Gemini 对话线程的页面，后续轮次只输入新消息。
+    # 会话键为请求头 X-Conversation-Id，或由消息前缀哈希得出；会话页面按 LRU + TTL 淘汰并关闭
+    CONVERSATION_AFFINITY: bool = False
+    CONVERSATION_MAX_PAGES: int = 8
+    CONVERSATION_TTL: int = 1800
+
+    # 调度队列：最大排队请求数，以及单个请求最长排队秒数，超出返回 429
+    QUEUE_MAX_SIZE: int = 32
+    QUEUE_MAX_WAIT: float = 60.0
+
+    # 尾延迟治理 (非真流式请求)：提示词提交之前的失败 (页面准备失败、输入/点击发送失败) 和账号被限流在 API_REQUEST_TIMEOUT
+    # 截止时间内换实例重试，每个请求最多执行 RETRY_MAX_ATTEMPTS 次 (1 表示不重试)。
+    # 对冲：取页面到提交提示词的耗时超过最近样本的 HEDGE_QUANTILE 分位数 (不少于 HEDGE_MIN_DELAY 秒，至少 HEDGE_MIN_SAMPLES
+    # 个样本) 仍未提交时，在空闲实例上并行发出同一请求，先提交者胜出、另一方取消；对冲数量不超过请求数的 HEDGE_MAX_RATIO
+    RETRY_MAX_ATTEMPTS: int = 2
+    HEDGE_ENABLED: bool = False
+    HEDGE_QUANTILE: float = 0.95
+    HEDGE_MIN_DELAY: float = 5.0
+    HEDGE_MIN_SAMPLES: int = 20
+    HEDGE_MAX_RATIO: float = 0.05
+
+    # 批处理 (/v1/files + /v1/batches)：输入/输出 JSONL 与任务状态保存在 BATCH_DIR，重启后从未完成的行继续。
+    # 批处理请求只使用空闲容量，并始终为交互请求预留 BATCH_RESERVED_SLOTS 个槽位
+    BATCH_ENABLED: bool = True
+    BATCH_DIR: str = "data/batches"
+    BATCH_CONCURRENCY: int = 4
+    BATCH_RESERVED_SLOTS: int = 1
+
     API_REQUEST_TIMEOUT: int = 180
+    # 回答文本持续多少秒没有变化即视为生成完毕 (完成检测的兜底信号之一；等待上限随 API_REQUEST_TIMEOUT 伸缩)
+    ANSWER_QUIET_PERIOD: float = 3.0
+
+    # 流式模式: "live" = 真流式 (回答生成过程中实时推送增量)，"pseudo" = 等待完整答案后伪流式回放
+    STREAMING_MODE: str = "live"
+    # SSE 分块策略: "bytes" = 按字节数切分，"sentence" = 按句子切分，"time" = 真流式中合并同一时间窗口内的增量 (伪流式按字节数切分)
+    SSE_CHUNK_STRATEGY: str = "bytes"
+    # 每个 SSE 数据块的最大字节数 (伪流式切分以及 "time" 策略的缓冲上限)，不小于 4 (一个 UTF-8 字符的最大宽度)
+    SSE_CHUNK_BYTES: int = 256
+    # "time" 策略的合并窗口 (毫秒)
+    SSE_CHUNK_WINDOW_MS: int = 50
+    # 伪流式数据块之间的人为间隔 (毫秒)，0 表示不延迟、尽快发送
+    SSE_PACING_MS: int = 0
+    # 回答提取方式: "dom" = 从渲染后的回答 DOM 提取，"network" = 直接解析 StreamGenerate 响应帧 (原始 Markdown)
+    EXTRACTION_MODE: str = "dom"
     
     API_REQUEST_TIMEOUT: int = 180
     DEFAULT_MODEL: str = "gemini-pro"
     KNOWN_MODELS: List[str] = ["gemini-pro"]
 
+    @field_validator("SSE_CHUNK_BYTES")
+    @classmethod
+    def _check_sse_chunk_bytes(cls, value: int) -> int:
+        if value < 4:
+            raise ValueError("SSE_CHUNK_BYTES 不能小于 4 (一个 UTF-8 字符最多 4 字节)")
+        return value
+
     def __init__(self, **values):
         super().__init__(**values)
 
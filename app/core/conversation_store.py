@@ -0,0 +1,141 @@
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+# 会话页面被淘汰后，用完整历史重建对话时发送的提示词
+THREAD_REBUILD_TEMPLATE = (
+    "以下是我们之前的对话记录:\n\n{history}\n\n"
+    "请在此基础上继续对话，只回复最后一条用户消息:\n{latest}"
+)
+ROLE_LABELS = {"system": "System", "user": "User", "assistant": "Assistant"}
+
+
+def _normalize(content: Any) -> str:
+    """客户端回传的助手消息与页面提取的文本可能有空白差异，统一折叠后再比较"""
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False, sort_keys=True)
+    return re.sub(r"\s+", " ", content).strip()
+
+
+def _hash_messages(messages: List[Dict[str, Any]]) -> str:
+    material = [[m.get("role"), _normalize(m.get("content"))] for m in messages]
+    encoded = json.dumps(material, ensure_ascii=False, separators=(",", ":"))
+    return "prefix:" + hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def build_thread_prompt(messages: List[Dict[str, Any]]) -> str:
+    """把历史消息和最后一条用户消息合成一个提示词，用于在新页面上重建对话"""
+    history = "\n\n".join(
+        f"[{ROLE_LABELS.get(m.get('role'), m.get('role'))}]: {m.get('content')}" for m in messages[:-1]
+    )
+    return THREAD_REBUILD_TEMPLATE.format(history=history, latest=messages[-1].get("content") or "")
+
+
+class ConversationTurn:
+    """
+    一次请求在会话保持模式下的上下文。
+
+    会话键优先使用客户端显式提供的会话 ID；否则由消息前缀的哈希决定：
+    本轮结束后以 "全部消息 + 本轮回答" 登记，下一轮请求的 "除最后一条外的消息" 恰好与之相同。
+    """
+    def __init__(self, messages: List[Dict[str, Any]], conversation_id: Optional[str] = None):
+        self.messages = messages
+        self.conversation_id = conversation_id
+        self.conversation: Optional["Conversation"] = None  # 命中的会话页面
+
+    @property
+    def has_history(self) -> bool:
+        return len(self.messages) > 1
+
+    @property
+    def lookup_key(self) -> Optional[str]:
+        if self.conversation_id:
+            return f"id:{self.conversation_id}"
+        return _hash_messages(self.messages[:-1]) if self.has_history else None
+
+    def next_key(self, answer: str) -> str:
+        if self.conversation_id:
+            return f"id:{self.conversation_id}"
+        return _hash_messages(self.messages + [{"role": "assistant", "content": answer}])
+
+    def prompt(self, latest_user_message: str) -> str:
+        """命中会话页面时只输入新的一轮；否则有历史就重建整个对话"""
+        if self.conversation is not None or not self.has_history:
+            return latest_user_message
+        return build_thread_prompt(self.messages)
+
+
+class Conversation:
+    """一个仍保留着 Gemini 对话线程的页面 (已移出页面池)"""
+    def __init__(self, instance: Any, warm: Any):
+        self.instance = instance
+        self.warm = warm
+        self.turns = 0
+        self.last_used = time.monotonic()
+
+
+class ConversationStore:
+    """
+    会话键 -> 会话页面 的 LRU + TTL 映射。
+
+    页面被取出 (checkout) 期间不在映射中，同一会话的并发请求会各自重建对话；
+    超过 max_pages 或 ttl 秒未使用的会话会被淘汰，由 closer 关闭其页面。
+    """
+    def __init__(self, max_pages: int, ttl: float, closer: Callable[[Conversation], None]):
+        self.max_pages = max(1, max_pages)
+        self.ttl = ttl
+        self._closer = closer
+        self._entries: "OrderedDict[str, Conversation]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def checkout(self, key: Optional[str]) -> Optional[Conversation]:
+        self.expire()
+        if not key:
+            return None
+        conversation = self._entries.pop(key, None)
+        if conversation is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return conversation
+
+    def checkin(self, key: str, conversation: Conversation):
+        conversation.last_used = time.monotonic()
+        previous = self._entries.pop(key, None)
+        if previous is not None and previous is not conversation:
+            self._evict(previous, "被同一会话的新页面替换")
+        self._entries[key] = conversation
+        while len(self._entries) > self.max_pages:
+            _, oldest = self._entries.popitem(last=False)
+            self._evict(oldest, "超出会话页面上限")
+        self.expire()
+
+    def expire(self):
+        now = time.monotonic()
+        for key in [k for k, c in self._entries.items() if now - c.last_used > self.ttl]:
+            self._evict(self._entries.pop(key), "超时未使用")
+
+    def discard_instance(self, instance: Any):
+        """实例下线时丢弃其上的全部会话"""
+        for key in [k for k, c in self._entries.items() if c.instance is instance]:
+            self._evict(self._entries.pop(key), "所属实例已下线")
+
+    def close(self):
+        while self._entries:
+            _, conversation = self._entries.popitem()
+            self._closer(conversation)
+
+    def stats(self) -> Dict[str, int]:
+        return {"pages": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _evict(self, conversation: Conversation, reason: str):
+        self.evictions += 1
+        logger.info(f"🗂️ 淘汰 {conversation.instance.name} 上的会话页面 ({conversation.turns} 轮): {reason}")
+        self._closer(conversation)
@@ -0,0 +1,311 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Collection, Deque, Dict, List, Optional
+
+from loguru import logger
+
+
+class QueueFullError(Exception):
+    """排队已满或等待超时，调用方应返回 429 并携带 Retry-After"""
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Lease:
+    """一次调度的结果：分配到的实例及排队耗时"""
+    def __init__(self, instance: Any, queue_wait: float):
+        self.instance = instance
+        self.queue_wait = queue_wait
+        self.acquired_at = time.monotonic()
+
+    @property
+    def queue_wait_ms(self) -> int:
+        return int(self.queue_wait * 1000)
+
+
+class RequestDispatcher:
+    """
+    整个浏览器池前的公平 FIFO 调度器。
+
+    - 每个实例可同时承载 instance.capacity 个请求 (标签页槽位)，优先分配负载率最低的实例。
+    - 有空闲槽位且无人排队时立即分配；否则按到达顺序排队，实例释放时直接移交给队首请求。
+    - acquire(instance) 可指定实例 (会话保持)：该请求只等待这个实例，不影响其它请求的分配；
+      acquire(exclude=[...]) 则相反，用于换实例重试：该请求不会被分配到这些实例。
+    - try_acquire_spare() 立即取得一个空闲槽位 (与后台请求一样只用空闲容量)，没有则返回 None，用于对冲请求。
+    - acquire(background=True) 为批处理等后台请求：只使用空闲容量，在没有交互请求排队、
+      且空闲槽位多于 reserved_slots 时才分配；不计入 max_queue_size，也没有排队超时。
+    - admission (可选，如 AccountScheduler) 为账号级准入控制：allows(instance) 为 False 的实例
+      (账号冷却中或超出速率预算) 暂不分配，admit(instance) 在分配时调用；有请求因此等待时，
+      按 retry_in(instance) 定时重新调度。
+    - 排队长度超过 max_queue_size 或等待超过 max_wait 秒时抛出 QueueFullError，
+      Retry-After 根据平均服务时长、队列长度和池容量估算。
+    """
+    def __init__(self, max_queue_size: int, max_wait: float, reserved_slots: int = 0, admission: Optional[Any] = None):
+        self.max_queue_size = max_queue_size
+        self.max_wait = max_wait
+        self.reserved_slots = reserved_slots
+        self.admission = admission
+        self._recheck: Optional[asyncio.TimerHandle] = None
+        self.instances: List[Any] = []
+        self._active: Dict[Any, int] = {}
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._pinned: Dict[asyncio.Future, Any] = {}  # 指定了实例的排队请求
+        self._excluded: Dict[asyncio.Future, Collection[Any]] = {}  # 排除了部分实例的排队请求
+        self._background: Deque[asyncio.Future] = deque()
+        self._avg_service = 10.0  # 秒，EWMA
+        self.rejected = 0
+
+    # -----------------------------------------------
+    # 实例管理
+    # -----------------------------------------------
+    def add_instance(self, instance: Any):
+        self.instances.append(instance)
+        self._active.setdefault(instance, 0)
+        self._dispatch()
+
+    def remove_instance(self, instance: Any):
+        """实例下线：不再分配新请求；已持有的租约照常释放，指定该实例排队的请求改为任意实例"""
+        if instance not in self.instances:
+            return
+        self.instances.remove(instance)
+        for waiter, pinned in list(self._pinned.items()):
+            if pinned is instance:
+                del self._pinned[waiter]
+        if not self._active.get(instance):
+            self._active.pop(instance, None)
+        self._dispatch()
+
+    def capacity(self, instance: Any) -> int:
+        return instance.capacity
+
+    def load(self, instance: Any) -> int:
+        """实例上正在进行的请求数 (含已下线实例上尚未释放的租约)"""
+        return self._active.get(instance, 0)
+
+    @property
+    def total_capacity(self) -> int:
+        return sum(self.capacity(i) for i in self.instances)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for w in self._waiters if not w.done())
+
+    @property
+    def in_flight(self) -> int:
+        return sum(self._active.values())
+
+    @property
+    def avg_service(self) -> float:
+        """槽位平均占用时长 (秒，EWMA)"""
+        return self._avg_service
+
+    @property
+    def background_depth(self) -> int:
+        return sum(1 for w in self._background if not w.done())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "background_queue_depth": self.background_depth,
+            "in_flight": self.in_flight,
+            "capacity": self.total_capacity,
+            "avg_service_seconds": round(self._avg_service, 3),
+            "rejected": self.rejected,
+        }
+
+    # -----------------------------------------------
+    # 获取 / 释放
+    # -----------------------------------------------
+    async def acquire(self, instance: Optional[Any] = None, background: bool = False,
+                      exclude: Optional[Collection[Any]] = None) -> Lease:
+        if background:
+            return await self._acquire_background(exclude)
+        start = time.monotonic()
+
+        # 每次状态变化后 _dispatch 都会把空闲实例分给能用它的排队请求，
+        # 所以此时的空闲实例不会被任何排队请求需要，可以直接分配
+        # (账号恢复可用不是状态变化事件，先让排队请求取走刚恢复的实例，保持 FIFO)
+        if self.admission is not None:
+            self._dispatch_waiters()
+        free = self._pick_free(instance, exclude)
+        if free is not None:
+            self._assign(free)
+            return Lease(free, 0.0)
+
+        if self.queue_depth >= self.max_queue_size:
+            self.rejected += 1
+            raise QueueFullError("请求队列已满", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if instance is not None:
+            self._pinned[waiter] = instance
+        if exclude:
+            self._excluded[waiter] = exclude
+        self._schedule_recheck()
+        try:
+            async with asyncio.timeout(self.max_wait):
+                instance = await waiter
+        except TimeoutError:
+            self._abandon(waiter)
+            self.rejected += 1
+            raise QueueFullError(f"排队等待超过 {self.max_wait} 秒", self.retry_after())
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        return Lease(instance, time.monotonic() - start)
+
+    async def _acquire_background(self, exclude: Optional[Collection[Any]] = None) -> Lease:
+        start = time.monotonic()
+        free = self._pick_spare(exclude)
+        if free is not None:
+            self._assign(free)
+            return Lease(free, 0.0)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._background.append(waiter)
+        if exclude:
+            self._excluded[waiter] = exclude
+        self._schedule_recheck()
+        try:
+            instance = await waiter
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        return Lease(instance, time.monotonic() - start)
+
+    def try_acquire_spare(self, exclude: Optional[Collection[Any]] = None) -> Optional[Lease]:
+        free = self._pick_spare(exclude)
+        if free is None:
+            return None
+        self._assign(free)
+        return Lease(free, 0.0)
+
+    def release(self, lease: Lease):
+        held = time.monotonic() - lease.acquired_at
+        self._avg_service = 0.8 * self._avg_service + 0.2 * held
+        self._return_slot(lease.instance)
+
+    def retry_after(self) -> int:
+        capacity = max(1, self.total_capacity)
+        return max(1, math.ceil(self._avg_service * (self.queue_depth + 1) / capacity))
+
+    # -----------------------------------------------
+    # 内部实现
+    # -----------------------------------------------
+    def _has_free_slot(self, instance: Any) -> bool:
+        return self._active[instance] < self.capacity(instance)
+
+    def _admits(self, instance: Any) -> bool:
+        return self.admission is None or self.admission.allows(instance)
+
+    def _pick_free(self, pinned: Optional[Any] = None, exclude: Optional[Collection[Any]] = None) -> Optional[Any]:
+        if pinned is not None:
+            usable = pinned in self.instances and self._has_free_slot(pinned) and self._admits(pinned)
+            return pinned if usable else None
+        free = [i for i in self.instances if self._has_free_slot(i) and self._admits(i) and not (exclude and i in exclude)]
+        if not free:
+            return None
+        return min(free, key=lambda i: self._active[i] / self.capacity(i))
+
+    def _pick_spare(self, exclude: Optional[Collection[Any]] = None) -> Optional[Any]:
+        """后台请求可用的实例：没有交互请求在等待任意实例，且空闲槽位多于预留数"""
+        if any(not w.done() and w not in self._pinned for w in self._waiters):
+            return None
+        free_slots = sum(self.capacity(i) - self._active[i] for i in self.instances if self._admits(i))
+        reserved = min(self.reserved_slots, self.total_capacity - 1)  # 至少留一个槽位给后台请求，避免小池永远无法处理批任务
+        if free_slots <= reserved:
+            return None
+        return self._pick_free(exclude=exclude)
+
+    def _assign(self, instance: Any):
+        self._active[instance] += 1
+        if self.admission is not None:
+            self.admission.admit(instance)
+
+    def _return_slot(self, instance: Any):
+        self._active[instance] -= 1
+        if not self._active[instance] and instance not in self.instances:
+            del self._active[instance]  # 已下线实例的最后一个租约
+        self._dispatch()
+
+    def _dispatch(self):
+        self._dispatch_waiters()
+        self._schedule_recheck()
+
+    def _dispatch_waiters(self):
+        """把空闲实例按 FIFO 顺序移交给排队中的请求；指定了实例的请求只等待该实例"""
+        for waiter in list(self._waiters):
+            if waiter.done():
+                self._forget(self._waiters, waiter)
+                continue
+            pinned = self._pinned.get(waiter)
+            excluded = self._excluded.get(waiter)
+            instance = self._pick_free(pinned, excluded)
+            if instance is None:
+                if pinned is None and excluded is None:
+                    return  # 已没有任何空闲实例
+                continue
+            self._forget(self._waiters, waiter)
+            self._assign(instance)
+            waiter.set_result(instance)
+
+        # 交互请求都已分配 (或只在等待各自指定/排除的实例)，剩余空闲容量交给后台请求
+        for waiter in list(self._background):
+            if waiter.done():
+                self._forget(self._background, waiter)
+                continue
+            excluded = self._excluded.get(waiter)
+            instance = self._pick_spare(excluded)
+            if instance is None:
+                if excluded is None:
+                    return
+                continue
+            self._forget(self._background, waiter)
+            self._assign(instance)
+            waiter.set_result(instance)
+
+    def _forget(self, queue: Deque[asyncio.Future], waiter: asyncio.Future):
+        queue.remove(waiter)
+        self._pinned.pop(waiter, None)
+        self._excluded.pop(waiter, None)
+
+    def _schedule_recheck(self):
+        """
+        有请求在等待、而有空闲槽位的实例被准入控制挡住时，账号恢复可用不会触发任何释放事件，
+        因此按最早的 retry_in 定时重新调度
+        """
+        if self.admission is None or self._recheck is not None:
+            return
+        if not any(not w.done() for w in self._waiters) and not any(not w.done() for w in self._background):
+            return
+        blocked = [i for i in self.instances if self._has_free_slot(i) and not self.admission.allows(i)]
+        if not blocked:
+            return
+        delay = min(self.admission.retry_in(i) for i in blocked)
+        self._recheck = asyncio.get_running_loop().call_later(min(5.0, max(0.05, delay)), self._on_recheck)
+
+    def _on_recheck(self):
+        self._recheck = None
+        self._dispatch()
+
+    def _abandon(self, waiter: asyncio.Future):
+        """排队请求超时/取消：若实例已移交则归还，否则移出队列"""
+        if waiter.done() and not waiter.cancelled():
+            instance = waiter.result()
+            self._return_slot(instance)
+            logger.debug("排队请求已放弃，归还刚分配的实例。")
+        else:
+            waiter.cancel()
+            for queue in (self._waiters, self._background):
+                try:
+                    queue.remove(waiter)
+                except ValueError:
+                    pass
+        self._pinned.pop(waiter, None)
+        self._excluded.pop(waiter, None)
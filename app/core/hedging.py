@@ -0,0 +1,103 @@
+"""
+尾延迟治理：失败重试与对冲请求。
+
+    - 重试：提示词提交之前的失败 (页面准备失败、输入/点击发送失败) 以及账号被限流，显式抛出 RetryableError，
+      在请求的截止时间内换一个实例重新执行，最多 max_attempts 次；点击发送之后的失败直接返回给客户端。
+    - 对冲：取页面、输入、点击发送 (提交之前的阶段) 的耗时超过最近样本的 p95 (可配置分位数) 仍未提交时，
+      若有空闲容量且对冲预算充足，在另一个实例上并行发出同一请求，先提交提示词的一方胜出，另一方被取消。
+      提交之后不再对冲，同一提示词不会被提交给上游两次。
+      对冲只使用空闲槽位 (不与排队中的请求争抢)，数量不超过请求数的 max_ratio。
+"""
+import math
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+
+class RetryableError(Exception):
+    """可以换实例重试的失败"""
+
+
+class PageUnavailable(RetryableError):
+    """实例无法提供预热页面 (导航超时、输入框未出现等)"""
+
+
+class PromptNotSent(RetryableError):
+    """输入或点击发送失败，提示词尚未提交给上游"""
+
+
+class AccountThrottled(RetryableError):
+    """回答是账号限流提示；retry_after 为账号池最早恢复可用的秒数"""
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    只有显式标记为 RetryableError 的失败才重试。点击发送之后抛出的任何错误 (等待响应/回答超时、
+    提取失败、生成过程中页面关闭) 都视为最终结果，避免同一提示词被重复提交给上游
+    """
+    return isinstance(error, RetryableError)
+
+
+class LatencyTracker:
+    """最近 size 次提交提示词之前的耗时，用于估计分位数"""
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = max(1, min_samples)
+        self._samples: Deque[float] = deque(maxlen=max(size, self.min_samples))
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """样本不足 min_samples 时返回 None"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class HedgePolicy:
+    """
+    对冲决策：delay() 给出发出对冲前应等待的秒数 (None 表示不对冲)，
+    每个请求为预算存入 max_ratio 个令牌 (最多积累 burst 个)，每次对冲消耗一个。
+    """
+    def __init__(self, enabled: bool, quantile: float, min_delay: float, max_ratio: float,
+                 min_samples: int, burst: float = 5):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.burst = max(1.0, burst)
+        self.latency = LatencyTracker(min_samples=min_samples)
+        self._tokens = 0.0
+        self.counts = {"requests": 0, "hedged": 0, "hedge_won": 0, "no_budget": 0, "no_capacity": 0, "retried": 0}
+
+    def observe(self, seconds: float):
+        self.latency.observe(seconds)
+
+    def delay(self) -> Optional[float]:
+        if not self.enabled:
+            return None
+        threshold = self.latency.quantile(self.quantile)
+        return None if threshold is None else max(self.min_delay, threshold)
+
+    def on_request(self):
+        self.counts["requests"] += 1
+        self._tokens = min(self.burst, self._tokens + self.max_ratio)
+
+    def try_spend(self) -> bool:
+        if self._tokens < 1:
+            self.counts["no_budget"] += 1
+            return False
+        self._tokens -= 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        threshold = self.latency.quantile(self.quantile)
+        return {
+            "enabled": self.enabled,
+            "hedge_delay_seconds": round(max(self.min_delay, threshold), 3) if threshold is not None else None,
+            "budget_tokens": round(self._tokens, 2),
+            **self.counts,
+        }
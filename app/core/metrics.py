@@ -0,0 +1,151 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# CONTENT_TYPE_LATEST 在此重新导出，供 /metrics 端点设置响应类型
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest  # noqa: F401
+
+# 浏览器交互各阶段耗时从几十毫秒 (填充/点击) 到数十秒 (等待回答) 不等
+STAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60)
+REQUEST_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180)
+
+STAGE_SECONDS = Histogram(
+    "gemini_stage_seconds",
+    "浏览器交互各阶段耗时 (仅统计成功的阶段)",
+    ["stage", "instance"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_FAILURES = Counter(
+    "gemini_stage_failures_total",
+    "浏览器交互各阶段失败次数",
+    ["stage", "instance"],
+)
+COMPLETION_SIGNALS = Counter(
+    "gemini_completion_signal_total",
+    "回答完成检测中最先触发的信号 (button / stop_button / quiet / network)",
+    ["signal"],
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "gemini_queue_wait_seconds",
+    "请求在调度队列中等待浏览器槽位的时间",
+    buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "gemini_request_seconds",
+    "请求端到端耗时 (流式请求统计到最后一个增量发出)",
+    ["mode", "outcome"],
+    buckets=REQUEST_BUCKETS,
+)
+TTFT_SECONDS = Histogram(
+    "gemini_time_to_first_token_seconds",
+    "真流式请求从到达到第一段增量的时间 (含排队)",
+    ["instance"],
+    buckets=REQUEST_BUCKETS,
+)
+POOL_CAPACITY = Gauge("gemini_pool_capacity", "浏览器池的并发槽位总数")
+POOL_IN_FLIGHT = Gauge("gemini_pool_in_flight", "正在占用槽位的请求数")
+POOL_UTILIZATION = Gauge("gemini_pool_utilization", "槽位占用率 (in_flight / capacity)")
+QUEUE_DEPTH = Gauge("gemini_queue_depth", "排队等待槽位的请求数")
+POOL_INSTANCES = Gauge("gemini_pool_instances", "浏览器池中的实例数", ["kind"])
+AUTH_SESSIONS = Gauge("gemini_auth_sessions", "登录会话数", ["state"])
+ACCOUNT_AVAILABLE = Gauge("gemini_account_available", "账号当前是否接受请求 (未熔断且有速率预算)", ["account"])
+ACCOUNT_COOLDOWN_SECONDS = Gauge("gemini_account_cooldown_seconds", "账号熔断冷却的剩余秒数", ["account"])
+ACCOUNT_ERROR_RATE = Gauge("gemini_account_error_rate", "账号在统计窗口内的错误率", ["account"])
+ACCOUNT_OUTCOMES = Counter("gemini_account_outcomes_total", "按账号统计的请求结果 (ok / error / throttled)", ["account", "outcome"])
+ACCOUNT_TRIPS = Counter("gemini_account_trips_total", "账号熔断次数", ["account"])
+RETRIES = Counter("gemini_retries_total", "换实例重试次数 (按失败类型)", ["reason"])
+HEDGES = Counter("gemini_hedges_total", "对冲请求 (launched = 已发出，won = 对冲方先完成)", ["event"])
+ABANDONED_REQUESTS = Counter(
+    "gemini_abandoned_requests_total",
+    "客户端断开等原因被取消的请求 (按取消时所处阶段：queued / interaction / stream)",
+    ["stage"],
+)
+ABANDONED_SAVED_SECONDS = Counter(
+    "gemini_abandoned_saved_slot_seconds_total",
+    "取消被放弃的请求而省下的浏览器槽位时间估计 (秒)",
+)
+AUTOSCALE_EVENTS = Counter("gemini_autoscale_events_total", "弹性伸缩的扩容/缩容次数", ["direction"])
+IDLE_PAGES = Gauge("gemini_idle_pages", "各实例页面池中可立即使用的预热页面数", ["instance"])
+
+
+# 出现过的阶段名，移除实例的时间序列时需要逐个阶段删除
+_STAGES = set()
+
+
+@contextmanager
+def stage(name: str, instance: str):
+    """记录一个交互阶段：成功时观测耗时，异常时累计失败次数 (取消不计为失败)"""
+    _STAGES.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        raise
+    except BaseException:
+        STAGE_FAILURES.labels(name, instance).inc()
+        raise
+    STAGE_SECONDS.labels(name, instance).observe(time.perf_counter() - started)
+
+
+def observe_request(mode: str, outcome: str, started: float):
+    """started 为 time.monotonic() 取得的请求到达时间"""
+    REQUEST_SECONDS.labels(mode, outcome).observe(time.monotonic() - started)
+
+
+def observe_ttft(instance: str, started: float):
+    TTFT_SECONDS.labels(instance).observe(time.monotonic() - started)
+
+
+def set_pool_gauges(capacity: int, in_flight: int, queue_depth: int, idle_pages: Optional[dict] = None):
+    POOL_CAPACITY.set(capacity)
+    POOL_IN_FLIGHT.set(in_flight)
+    POOL_UTILIZATION.set(in_flight / capacity if capacity else 0)
+    QUEUE_DEPTH.set(queue_depth)
+    IDLE_PAGES.clear()  # 已移出池的实例不再上报
+    for name, idle in (idle_pages or {}).items():
+        IDLE_PAGES.labels(name).set(idle)
+
+
+def observe_stage(name: str, instance: str, seconds: float):
+    _STAGES.add(name)
+    STAGE_SECONDS.labels(name, instance).observe(seconds)
+
+
+def stage_failed(name: str, instance: str):
+    _STAGES.add(name)
+    STAGE_FAILURES.labels(name, instance).inc()
+
+
+def forget_instance(instance: str):
+    """删除已移出池的实例的全部时间序列，实例名不复用时标签基数不会随实例轮换无限增长"""
+    for name in _STAGES:
+        for metric in (STAGE_SECONDS, STAGE_FAILURES):
+            try:
+                metric.remove(name, instance)
+            except KeyError:
+                pass
+    for metric in (TTFT_SECONDS, IDLE_PAGES):
+        try:
+            metric.remove(instance)
+        except KeyError:
+            pass
+
+
+def forget_account(account: str):
+    """删除已不存在的账号 (随实例退役的匿名账号) 的全部时间序列"""
+    for metric in (ACCOUNT_AVAILABLE, ACCOUNT_COOLDOWN_SECONDS, ACCOUNT_ERROR_RATE, ACCOUNT_TRIPS):
+        try:
+            metric.remove(account)
+        except KeyError:
+            pass
+    for outcome in ("ok", "error", "throttled"):
+        try:
+            ACCOUNT_OUTCOMES.remove(account, outcome)
+        except KeyError:
+            pass
+
+
+def render_latest() -> bytes:
+    return generate_latest()
+
@@ -0,0 +1,209 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional, Set
+
+from loguru import logger
+from playwright.async_api import BrowserContext, Page
+
+
+class WarmPage:
+    """一个已导航到 Gemini 且输入框就绪的页面 (及其所属的 BrowserContext)"""
+    def __init__(self, context: BrowserContext, page: Page):
+        self.context = context
+        self.page = page
+        self.uses = 0
+        self.generation = 0  # 创建时页面池的代数；renew() 之后旧代页面不再复用
+        self.created_at = time.monotonic()
+        self.route_stats = {"requests": 0, "blocked": 0}  # 路由策略计数
+        self.tracing = False  # 是否正在录制 Playwright trace 分块
+        self.sampled = False  # 当前请求是否被抽样保存 trace
+        self.sample_trace = False  # 抽样请求单独开启的 trace (未开启失败 trace 分块时)
+        self.stream_sink: Optional[Callable[[str, bool], None]] = None  # 真流式模式下接收页面推送的数据
+        self.rate_limited = False  # 当前请求期间 StreamGenerate 是否返回过 429
+        self.on_sent: Optional[Callable[[], None]] = None  # 当前请求的提示词提交后调用
+
+
+class PagePool:
+    """
+    单个浏览器实例的预热页面池。
+
+    - acquire(): 取出一个空闲的预热页面；池中没有空闲页面且总数未达上限时，当场冷启动一个；
+      已达上限时等待页面归还或页面数下降 (重置/预热失败) 后重新检查，最多等待 acquire_timeout 秒。
+    - release(): 归还页面。页面在后台重置为 "新对话" 状态后重新入池；
+      重置失败或达到复用上限的页面会被关闭，并在后台预热一个替补页面。
+    - detach(): 页面离开池 (如保留为会话页面)，池在后台补足页面数。
+    - renew(): 实例的登录会话变更后丢弃全部旧页面，按新会话重新预热。
+    """
+    def __init__(
+        self,
+        name: str,
+        size: int,
+        factory: Callable[[], Awaitable[WarmPage]],
+        resetter: Callable[[WarmPage], Awaitable[bool]],
+        closer: Callable[[WarmPage], Awaitable[None]],
+        max_uses: int,
+        acquire_timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.acquire_timeout = acquire_timeout
+        self._factory = factory
+        self._resetter = resetter
+        self._closer = closer
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._total = 0  # 存活 + 正在预热的页面数
+        self.warmed = 0  # 累计成功预热 (完成 Gemini 导航) 的页面数
+        self._generation = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._closed = False
+        self._changed = asyncio.Event()  # 有页面入池或页面数下降时触发
+
+    @property
+    def idle_count(self) -> int:
+        return self._idle.qsize()
+
+    async def start(self):
+        """并发预热到目标页面数"""
+        await asyncio.gather(*(self._warm_one() for _ in range(self.size - self._total)))
+        logger.info(f"  - {self.name}: 页面池已就绪 ({self.idle_count}/{self.size} 个预热页面)。")
+
+    async def acquire(self) -> WarmPage:
+        """超过 acquire_timeout 秒仍没有可用页面时抛出 TimeoutError"""
+        try:
+            async with asyncio.timeout(self.acquire_timeout):
+                return await self._acquire()
+        except TimeoutError:
+            raise TimeoutError(f"{self.acquire_timeout:g}s 内没有可用的预热页面") from None
+
+    async def _acquire(self) -> WarmPage:
+        while True:
+            if self._closed:
+                raise RuntimeError("页面池已关闭。")
+            try:
+                warm = self._idle.get_nowait()
+            except asyncio.QueueEmpty:
+                if self._total >= self.size:
+                    await self._changed.wait()
+                    continue
+                # 冷启动路径：替补页面预热失败时也会走到这里
+                self._total += 1
+                try:
+                    warm = await self._new_page()
+                except BaseException:
+                    self._total -= 1
+                    self._wake()
+                    raise
+
+            if warm.page.is_closed() or warm.generation != self._generation:
+                await self._retire(warm)
+                continue
+            warm.uses += 1
+            return warm
+
+    def release(self, warm: WarmPage, reusable: bool = True):
+        """归还页面 (不阻塞调用方，重置/替换在后台进行)"""
+        self._spawn(self._recycle(warm, reusable))
+
+    def detach(self, warm: WarmPage):
+        """把页面永久移出池 (交给会话保持使用，由调用方负责关闭)，并在后台预热一个替补页面"""
+        self._total -= 1
+        self._wake()
+        if not self._closed:
+            self._spawn(self._warm_one())
+
+    def renew(self):
+        """
+        丢弃用旧登录状态创建的页面：空闲页面立即关闭并预热替补，使用中的页面归还时不再重置复用，
+        之后新建的页面使用工厂函数当时读取的登录状态
+        """
+        self._generation += 1
+        while not self._idle.empty():
+            self._spawn(self._replace(self._idle.get_nowait()))
+
+    async def close(self):
+        self._closed = True
+        self._wake()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        # 等后台的重置/预热任务真正退出 (被取消时自行关闭手上的页面)，再关闭已入池的页面
+        await asyncio.gather(*tasks, return_exceptions=True)
+        while not self._idle.empty():
+            warm = self._idle.get_nowait()
+            try:
+                await self._closer(warm)
+            except Exception:
+                pass
+        self._total = 0
+
+    # -----------------------------------------------
+    # 内部实现
+    # -----------------------------------------------
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _put_idle(self, warm: WarmPage):
+        self._idle.put_nowait(warm)
+        self._wake()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _new_page(self) -> WarmPage:
+        generation = self._generation
+        warm = await self._factory()
+        warm.generation = generation
+        self.warmed += 1
+        return warm
+
+    async def _warm_one(self):
+        self._total += 1
+        try:
+            warm = await self._new_page()
+        except Exception as e:
+            self._total -= 1
+            self._wake()
+            logger.warning(f"  - {self.name}: 预热页面失败: {e}")
+            return
+        if self._closed:
+            await self._closer(warm)
+            return
+        if warm.generation != self._generation:
+            # 预热期间池被 renew()，这个页面用的还是旧登录状态
+            await self._replace(warm)
+            return
+        self._put_idle(warm)
+
+    async def _recycle(self, warm: WarmPage, reusable: bool):
+        if self._closed:
+            await self._closer(warm)
+            return
+        if reusable and warm.generation == self._generation and warm.uses < self.max_uses and not warm.page.is_closed():
+            try:
+                if await self._resetter(warm):
+                    self._put_idle(warm)
+                    return
+            except asyncio.CancelledError:
+                await self._retire(warm)
+                raise
+            except Exception as e:
+                logger.warning(f"  - {self.name}: 重置页面失败: {e}")
+        await self._replace(warm)
+
+    async def _replace(self, warm: WarmPage):
+        """关闭页面并预热一个替补"""
+        await self._retire(warm)
+        if not self._closed:
+            await self._warm_one()
+
+    async def _retire(self, warm: WarmPage):
+        self._total -= 1
+        self._wake()
+        try:
+            await self._closer(warm)
+        except Exception as e:
+            logger.warning(f"  - {self.name}: 关闭页面失败: {e}")
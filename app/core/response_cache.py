@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+
+# 参与缓存键计算的采样参数 (请求中出现才计入)
+SAMPLING_KEYS = (
+    "temperature", "top_p", "top_k", "n", "max_tokens", "max_completion_tokens", "stop",
+    "presence_penalty", "frequency_penalty", "seed", "response_format", "tools", "tool_choice",
+)
+
+
+def _normalize_content(content: Any) -> Any:
+    if isinstance(content, str):
+        return content.replace("\r\n", "\n").strip()
+    return content
+
+
+def make_cache_key(request_data: Dict[str, Any], default_model: str) -> str:
+    """由规范化后的消息、模型和采样参数计算精确匹配的缓存键"""
+    messages = [
+        {"role": m.get("role"), "content": _normalize_content(m.get("content"))}
+        for m in request_data.get("messages", [])
+    ]
+    material = {
+        "model": request_data.get("model") or default_model,
+        "messages": messages,
+        "sampling": {k: request_data[k] for k in SAMPLING_KEYS if k in request_data},
+    }
+    # 显式会话的回答取决于页面中的对话线程，不能与其它会话共享
+    if request_data.get("conversation_id"):
+        material["conversation"] = request_data["conversation_id"]
+    encoded = json.dumps(material, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(request_data: Dict[str, Any]) -> bool:
+    """
+    请求体 "cache" 字段显式指定时以其为准；否则采样请求 (temperature > 0 或 n > 1) 不走缓存，
+    客户端期望的是新的采样结果，而不是上一次的回答
+    """
+    explicit = request_data.get("cache")
+    if explicit is not None:
+        return explicit is not False
+    try:
+        temperature = float(request_data.get("temperature") or 0)
+        n = int(request_data.get("n") or 1)
+    except (TypeError, ValueError):
+        return False
+    return temperature <= 0 and n <= 1
+
+
+class _DiskTier:
+    """SQLite 持久层，重启后仍可命中；所有操作在线程池中执行，避免阻塞事件循环"""
+    def __init__(self, path: Path, ttl: float):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path.as_posix(), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, text TEXT NOT NULL, created REAL NOT NULL)")
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl,))
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute("SELECT text, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row and time.time() - row[1] <= self.ttl:
+            return row[0], row[1]
+        return None
+
+    def put(self, key: str, text: str, created: float):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, text, created) VALUES (?, ?, ?)", (key, text, created))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """
+    精确匹配的回答缓存：内存层按 LRU + TTL 淘汰并限制总字节数，可选 SQLite 磁盘层。
+    """
+    def __init__(self, max_bytes: int, ttl: float, disk_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+        self._disk = _DiskTier(Path(disk_path), ttl) if disk_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry and time.time() - entry[1] <= self.ttl:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if entry:
+            self._remove(key)
+
+        if self._disk:
+            found = await asyncio.to_thread(self._disk.get, key)
+            if found:
+                self._store_memory(key, *found)
+                self.hits += 1
+                self.disk_hits += 1
+                return found[0]
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, text: str):
+        created = time.time()
+        self._store_memory(key, text, created)
+        if self._disk:
+            try:
+                await asyncio.to_thread(self._disk.put, key, text, created)
+            except sqlite3.Error as e:
+                logger.warning(f"写入磁盘缓存失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "disk_enabled": self._disk is not None,
+        }
+
+    def close(self):
+        if self._disk:
+            self._disk.close()
+
+    # -----------------------------------------------
+    # 内部实现
+    # -----------------------------------------------
+    def _store_memory(self, key: str, text: str, created: float):
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (text, created)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        text, _ = self._entries.pop(key)
+        self._bytes -= len(text.encode("utf-8"))
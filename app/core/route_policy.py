@@ -0,0 +1,82 @@
+import re
+from typing import Dict, List, Optional, Pattern
+
+from loguru import logger
+from playwright.async_api import Page, Route
+
+# 资源类型对应的常见扩展名，用于 "fast" 模式下不经过 Python 的 URL 预筛
+RESOURCE_TYPE_EXTENSIONS = {
+    "image": r"png|jpe?g|gif|webp|avif|svg|ico",
+    "media": r"mp4|webm|mp3|ogg|wav|m4a",
+    "font": r"woff2?|ttf|otf|eot",
+    "stylesheet": r"css",
+}
+
+
+class RoutePolicy:
+    """
+    页面网络请求的路由策略。
+
+    - "off":     不安装任何 Python 路由，所有请求由浏览器直接处理。
+    - "fast":    只为匹配屏蔽规则 (URL 片段 + 资源扩展名) 的请求安装正则路由，
+                 其余请求完全不经过 Python 事件循环。
+    - "precise": 为所有请求安装路由，按 request.resource_type 精确屏蔽，代价是每个请求一次往返。
+
+    允许列表中的 URL 片段永远不会被屏蔽 (应用正常工作所需的接口/脚本)。
+    """
+    def __init__(self, mode: str, block_types: List[str], block_patterns: List[str], allow_patterns: List[str]):
+        self.mode = mode
+        self.block_types = set(block_types)
+        self.block_patterns = block_patterns
+        self.allow_patterns = allow_patterns
+        self._fast_pattern = self._build_fast_pattern()
+        self.totals: Dict[str, int] = {"requests": 0, "blocked": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off" and bool(self.block_types or self.block_patterns)
+
+    def _build_fast_pattern(self) -> Optional[Pattern]:
+        parts = [re.escape(p) for p in self.block_patterns]
+        extensions = "|".join(RESOURCE_TYPE_EXTENSIONS[t] for t in self.block_types if t in RESOURCE_TYPE_EXTENSIONS)
+        if extensions:
+            parts.append(rf"\.(?:{extensions})(?:[?#]|$)")
+        return re.compile("|".join(parts), re.IGNORECASE) if parts else None
+
+    def is_allowed(self, url: str) -> bool:
+        return any(p in url for p in self.allow_patterns)
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        if self.is_allowed(url):
+            return False
+        return resource_type in self.block_types or any(p in url for p in self.block_patterns)
+
+    async def install(self, page: Page, stats: Dict[str, int]):
+        """为页面安装路由，并在 stats 中累计该页面的请求总数和被屏蔽数 (放行数 = 总数 - 屏蔽数)"""
+        if not self.enabled:
+            return
+
+        def on_request(request):
+            stats["requests"] += 1
+            self.totals["requests"] += 1
+
+        async def handle(route: Route):
+            request = route.request
+            block = self.should_block(request.resource_type, request.url) if self.mode == "precise" else not self.is_allowed(request.url)
+            if block:
+                stats["blocked"] += 1
+                self.totals["blocked"] += 1
+                await route.abort("blockedbyclient")
+            else:
+                await route.continue_()
+
+        page.on("request", on_request)
+        if self.mode == "precise":
+            await page.route("**/*", handle)
+        elif self._fast_pattern is not None:
+            await page.route(self._fast_pattern, handle)
+        logger.debug(f"路由策略已安装 (模式: {self.mode})。")
+
+
+def format_route_stats(stats: Dict[str, int]) -> str:
+    return f"放行 {stats['requests'] - stats['blocked']} / 屏蔽 {stats['blocked']}"
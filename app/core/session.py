@@ -0,0 +1,66 @@
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+# Gemini 页面 WIZ_global_data 中的动态参数键名
+WIZ_KEYS = {
+    "at": "SNlM0e",
+    "f_sid": "FdrFJe",
+    "build_label": "cfb2h",
+}
+
+
+class GeminiSession:
+    """
+    一个已登录 Gemini 会话的凭据：Cookie + 动态参数 (at / f.sid / bl)。
+    文件格式与 inject_session.py 写出的 session.json 一致:
+    {"cookies": {...}, "dynamicParams": {"fSid": "...", "at": "...", "bl": "..."}}
+    """
+    def __init__(self, path: Path, cookies: Dict[str, str], f_sid: Optional[str], at: Optional[str], build_label: Optional[str] = None):
+        self.path = path
+        self.cookies = cookies
+        self.f_sid = f_sid
+        self.at = at
+        self.build_label = build_label
+
+    @property
+    def name(self) -> str:
+        return self.path.parent.name or self.path.stem
+
+    @property
+    def has_params(self) -> bool:
+        return bool(self.f_sid and self.at)
+
+    @classmethod
+    def load(cls, path: Path) -> "GeminiSession":
+        data: Dict[str, Any] = json.loads(Path(path).read_text(encoding="utf-8"))
+        params = data.get("dynamicParams") or {}
+        return cls(Path(path), data.get("cookies") or {}, params.get("fSid"), params.get("at"), params.get("bl"))
+
+    def save(self):
+        data = {
+            "cookies": self.cookies,
+            "dynamicParams": {"fSid": self.f_sid, "at": self.at, "bl": self.build_label},
+        }
+        self.path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    def update_params(self, values: Dict[str, Optional[str]]) -> bool:
+        """用从页面提取的 WIZ_global_data 值更新动态参数，返回是否拿到了 at 和 f.sid"""
+        at, f_sid = values.get(WIZ_KEYS["at"]), values.get(WIZ_KEYS["f_sid"])
+        if not at or not f_sid:
+            return False
+        self.at, self.f_sid = at, f_sid
+        self.build_label = values.get(WIZ_KEYS["build_label"]) or self.build_label
+        # at 是防 CSRF 凭据，不写入日志
+        logger.info(f"🔄 会话 {self.name} 动态参数已刷新 (f.sid={self.f_sid}, bl={self.build_label})。")
+        return True
+
+    def update_params_from_html(self, html: str) -> bool:
+        values = {}
+        for key in WIZ_KEYS.values():
+            match = re.search(rf'"{key}":"(.*?)"', html)
+            values[key] = match.group(1) if match else None
+        return self.update_params(values)
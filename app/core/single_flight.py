@@ -0,0 +1,131 @@
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+
+class FlightAbandoned(Exception):
+    """领头请求在产出结果前被取消 (如客户端断开)，跟随者应自行重新执行"""
+
+
+class Subscription:
+    """
+    Flight 的一个独立订阅：从第一段增量开始回放，之后实时接收新增量。
+    创建时即计入订阅数，close() 后减少；订阅数归零时 Flight 会通知生产方可以停止。
+    """
+    def __init__(self, flight: "Flight"):
+        self._flight = flight
+        self._index = 0
+        self._closed = False
+        flight.subscribers += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        flight = self._flight
+        while True:
+            if self._index < len(flight.parts):
+                self._index += 1
+                return flight.parts[self._index - 1]
+            if flight.finished:
+                if flight.error is not None:
+                    raise flight.error
+                raise StopAsyncIteration
+            await flight.changed.wait()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._flight.subscribers -= 1
+        if self._flight.subscribers == 0:
+            self._flight.on_idle()
+
+
+class Flight:
+    """一次进行中的浏览器交互，其增量可被多个相同的请求共享"""
+    def __init__(self, key: Optional[str], on_finish: Callable[["Flight"], None]):
+        self.key = key
+        self.parts: List[str] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        # 产出增量的后台任务 (真流式)，所有订阅者离开后会被取消
+        self.producer: Optional[asyncio.Task] = None
+        self._on_finish = on_finish
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def publish(self, delta: str):
+        if delta:
+            self.parts.append(delta)
+            self._wake()
+
+    def finish(self, error: Optional[BaseException] = None):
+        if self.finished:
+            return
+        self.finished = True
+        self.error = error
+        self._wake()
+        self._on_finish(self)
+
+    def attach(self) -> Subscription:
+        return Subscription(self)
+
+    async def result(self) -> str:
+        subscription = self.attach()
+        try:
+            async for _ in subscription:
+                pass
+        finally:
+            subscription.close()
+        return self.text
+
+    def on_idle(self):
+        if not self.finished and self.producer is not None and not self.producer.done():
+            logger.info("所有订阅者均已离开，取消正在进行的浏览器交互。")
+            self.producer.cancel()
+
+    def _wake(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    相同请求的合并器：同一键同时只有一个浏览器交互在进行，其余请求作为跟随者共享结果。
+    saved 统计因合并而省下的浏览器会话数。
+    """
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self.leaders = 0
+        self.saved = 0
+
+    def join(self, key: str, lead: bool = True) -> Tuple[Flight, bool]:
+        """lead=False 时只跟随已有的 flight，没有则返回不参与合并的独立 Flight (后台请求不应让交互请求跟随它排队)"""
+        flight = self._flights.get(key)
+        if flight is not None and not flight.finished:
+            self.saved += 1
+            return flight, False
+        if not lead:
+            return self.private(), True
+        flight = Flight(key, self._forget)
+        self._flights[key] = flight
+        self.leaders += 1
+        return flight, True
+
+    @staticmethod
+    def private() -> Flight:
+        """不参与合并的独立 Flight (合并功能关闭时使用)"""
+        return Flight(None, lambda flight: None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._flights), "leaders": self.leaders, "saved_sessions": self.saved}
+
+    def _forget(self, flight: Flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
@@ -0,0 +1,52 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+
+class StartupReport:
+    """
+    启动耗时报告：按阶段 (模块导入、Playwright 驱动、每个浏览器启动、页面预热 ...) 记录耗时。
+    浏览器并发启动时各阶段的耗时会重叠，elapsed 为从进程开始计时到首次就绪的墙钟时间。
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.ready_after: Optional[float] = None
+        self._logged = 0  # 已输出到日志的阶段数
+
+    def record(self, name: str, seconds: float):
+        self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def mark_ready(self):
+        if self.ready_after is None:
+            self.ready_after = time.perf_counter() - self.started
+            self.log_summary()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "ready_after_seconds": round(self.ready_after, 3) if self.ready_after is not None else None,
+            "phases": [{"phase": name, "seconds": round(seconds, 3)} for name, seconds in self.phases],
+        }
+
+    def log_summary(self):
+        """输出报告；就绪后仍在后台启动的实例全部完成时再次调用，只在有新阶段时输出"""
+        if self._logged and self._logged == len(self.phases):
+            return
+        self._logged = len(self.phases)
+        lines = "\n".join(f"    {name:<40} {seconds:>8.2f}s" for name, seconds in self.phases)
+        status = f"就绪用时 {self.ready_after:.2f}s" if self.ready_after is not None else "尚未就绪"
+        logger.info(f"⏱️ 启动耗时报告 ({status}):\n{lines}")
+
+
+# 进程级单例：main.py 导入时即开始计时
+startup_report = StartupReport()
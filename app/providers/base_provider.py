@@ -1,7 +1,39 @@
+import inspect
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Any, Callable, Dict, Optional
 from fastapi.responses import StreamingResponse, JSONResponse
 
+from app.core import metrics
+
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """
+    响应结束后 (无论正文是否开始迭代) 调用 on_release 释放流占用的资源 (flight 订阅、上游连接)。
+    客户端在 Starlette 开始迭代前断开时，尚未启动的生成器不会执行自己的 finally，只能在这里释放
+    """
+    def __init__(self, content: Any, on_release: Callable[[], Any], **kwargs):
+        super().__init__(content, **kwargs)
+        self._on_release: Optional[Callable[[], Any]] = on_release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.release()
+
+    async def release(self):
+        """只执行一次；响应未被发送 (如请求已被放弃) 时由调用方直接调用"""
+        if self._on_release is None:
+            return
+        on_release, self._on_release = self._on_release, None
+        aclose = getattr(self.body_iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        result = on_release()
+        if inspect.isawaitable(result):
+            await result
+
+
 class BaseProvider(ABC):
     @abstractmethod
     async def chat_completion(self, request_data: Dict[str, Any]) -> StreamingResponse:
@@ -9,4 +41,23 @@ class BaseProvider(ABC):
 
     @abstractmethod
     async def get_models(self) -> JSONResponse:
-        pass
\ No newline at end of file
+        pass
+
+    async def initialize(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def is_ready(self) -> bool:
+        return True
+
+    async def readiness(self) -> Dict[str, Any]:
+        """就绪检查 (/readyz) 的详细状态，ready 为 False 时负载均衡不应转发流量"""
+        return {"ready": self.is_ready()}
+
+    async def stats(self) -> Dict[str, Any]:
+        return {}
+
+    async def render_metrics(self) -> bytes:
+        return metrics.render_latest()
\ No newline at end of file
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncGenerator, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from loguru import logger
+
+from app.core.broker import MESSAGE_LIMIT, encode_message
+from app.core.config import settings
+from app.providers.base_provider import BaseProvider, ReleasingStreamingResponse
+
+# 代理进程不可用时，is_ready() 最多每隔这么多秒在后台重新探测一次
+READY_PROBE_INTERVAL = 2.0
+
+
+class BrokerUnavailableError(Exception):
+    pass
+
+
+class BrokerClientProvider(BaseProvider):
+    """
+    多 worker 部署中 API worker 使用的 Provider：本身不持有浏览器，
+    把请求通过 Unix socket 转交给浏览器代理进程 (app/core/broker.py)，并把响应分块原样转发给客户端。
+    """
+    def __init__(self):
+        self.socket_path = settings.BROKER_SOCKET_PATH
+        # 最近一次与代理进程的往返是否成功：成功的往返置位，连接失败或连接被意外关闭时清除
+        self._ready = False
+        self._probe: Optional[asyncio.Task] = None
+        self._probed_at = 0.0
+
+    async def initialize(self):
+        """等待代理进程就绪 (它可能仍在预热浏览器页面)"""
+        deadline = time.monotonic() + settings.BROKER_CONNECT_TIMEOUT
+        while time.monotonic() < deadline:
+            if await self._probe_ready():
+                logger.success(f"✅ 已连接浏览器代理进程 ({self.socket_path})。")
+                return
+            await asyncio.sleep(1)
+        logger.error(f"❌ 等待浏览器代理进程超时 ({self.socket_path})。")
+
+    def is_ready(self) -> bool:
+        """
+        返回最近一次往返的结果；未就绪时在后台重新探测 (间隔 READY_PROBE_INTERVAL 秒)，
+        代理进程重启或恢复后无需等到下一个请求失败就能重新接受流量
+        """
+        if not self._ready and (self._probe is None or self._probe.done()) \
+                and time.monotonic() - self._probed_at >= READY_PROBE_INTERVAL:
+            self._probed_at = time.monotonic()
+            try:
+                self._probe = asyncio.get_running_loop().create_task(self._probe_ready())
+            except RuntimeError:
+                pass  # 不在事件循环中 (如启动前的同步检查)
+        return self._ready
+
+    async def _probe_ready(self) -> bool:
+        try:
+            self._ready = bool(await self._call("ready"))
+        except (BrokerUnavailableError, HTTPException):
+            self._ready = False
+        return self._ready
+
+    async def readiness(self) -> Dict[str, Any]:
+        """就绪状态以代理进程中的浏览器池为准"""
+        try:
+            state = await self._call("readiness")
+        except BrokerUnavailableError as e:
+            return {"ready": False, "detail": str(e)}
+        self._ready = bool(state.get("ready"))
+        return state
+
+    async def stats(self) -> Dict[str, Any]:
+        return await self._query("stats")
+
+    async def render_metrics(self) -> bytes:
+        return (await self._query("metrics")).encode("utf-8")
+
+    # -----------------------------------------------
+    # 与代理进程通信
+    # -----------------------------------------------
+    async def _open(self, message: Dict[str, Any]) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=MESSAGE_LIMIT)
+            writer.write(encode_message(message))
+            await writer.drain()
+        except OSError as e:
+            self._ready = False
+            raise BrokerUnavailableError(f"无法连接浏览器代理进程: {e}")
+        return reader, writer
+
+    async def _receive(self, reader: asyncio.StreamReader) -> Dict[str, Any]:
+        try:
+            line = await reader.readline()
+        except OSError as e:
+            self._ready = False
+            raise BrokerUnavailableError(f"与浏览器代理进程的连接中断: {e}")
+        if not line:
+            self._ready = False
+            raise BrokerUnavailableError("浏览器代理进程意外关闭了连接。")
+        self._ready = True
+        return json.loads(line)
+
+    async def _call(self, op: str) -> Any:
+        reader, writer = await self._open({"op": op})
+        try:
+            message = await self._receive(reader)
+        finally:
+            writer.close()
+        if message["type"] == "error":
+            raise HTTPException(status_code=message["status"], detail=message["detail"])
+        return message["data"]
+
+    async def _query(self, op: str) -> Any:
+        try:
+            return await self._call(op)
+        except BrokerUnavailableError as e:
+            raise HTTPException(status_code=503, detail=f"服务不可用：{e}")
+
+    async def _relay_chunks(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> AsyncGenerator[bytes, None]:
+        """转发代理进程的响应分块；客户端断开时关闭连接，代理进程随之取消浏览器交互"""
+        try:
+            while True:
+                message = await self._receive(reader)
+                if message["type"] != "chunk":
+                    break
+                yield message["data"].encode("utf-8")
+        except BrokerUnavailableError as e:
+            logger.error(f"流式转发中断: {e}")
+        finally:
+            writer.close()
+
+    async def chat_completion(self, request_data: Dict[str, Any]) -> [JSONResponse, StreamingResponse]:
+        try:
+            reader, writer = await self._open({"op": "chat", "request": request_data})
+        except BrokerUnavailableError as e:
+            raise HTTPException(status_code=503, detail=f"服务不可用：{e}")
+
+        try:
+            start = await self._receive(reader)
+        except BaseException as e:
+            writer.close()
+            if isinstance(e, BrokerUnavailableError):
+                raise HTTPException(status_code=503, detail=f"服务不可用：{e}")
+            raise
+        if start["type"] == "error":
+            writer.close()
+            raise HTTPException(status_code=start["status"], detail=start["detail"], headers=start.get("headers") or None)
+
+        if start.get("media_type") == "text/event-stream":
+            return ReleasingStreamingResponse(
+                self._relay_chunks(reader, writer),
+                on_release=writer.close,
+                status_code=start["status"],
+                media_type="text/event-stream",
+                headers=start["headers"],
+            )
+
+        body = b"".join([chunk async for chunk in self._relay_chunks(reader, writer)])
+        return Response(content=body, status_code=start["status"], media_type=start.get("media_type"), headers=start["headers"])
+
+    async def get_models(self) -> JSONResponse:
+        return JSONResponse(content={
+            "object": "list",
+            "data": [{"id": name, "object": "model", "created": int(time.time()), "owned_by": "Google"} for name in settings.KNOWN_MODELS]
+        })
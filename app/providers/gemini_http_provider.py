@@ -0,0 +1,220 @@
+import asyncio
+import json
+import random
+import time
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from loguru import logger
+
+from app.core.config import settings
+from app.core.session import GeminiSession, WIZ_KEYS
+from app.providers.base_provider import BaseProvider, ReleasingStreamingResponse
+from app.utils.sse_utils import ChunkEncoder, coalesce_deltas, create_chat_completion_response, DONE_CHUNK
+from app.utils.stream_generate import StreamGenerateParser
+
+STREAM_GENERATE_ENDPOINT = "/_/BardChatUi/data/assistant.lamda.BardFrontendService/StreamGenerate"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36"
+
+# 这些状态码说明 at / f.sid 已失效，刷新后重试一次
+EXPIRED_STATUS_CODES = {400, 401, 403}
+
+
+class SessionExpiredError(Exception):
+    pass
+
+
+class GeminiHttpProvider(BaseProvider):
+    """
+    无浏览器的直连模式：使用 inject_session.py 导出的 Cookie 与动态参数 (at / f.sid)，
+    通过连接池化的 HTTP/2 请求直接调用 StreamGenerate，并增量解析返回的帧。
+    只有在 at / f.sid 失效时才需要刷新 (先尝试 HTTP 拉取首页，失败再启动浏览器)。
+    """
+    def __init__(self):
+        self.session: Optional[GeminiSession] = None
+        self.client = httpx.AsyncClient(
+            base_url=settings.GEMINI_BASE_URL,
+            http2=True,
+            timeout=settings.API_REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=settings.HTTP_MAX_CONNECTIONS, max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS),
+            headers={"User-Agent": USER_AGENT},
+        )
+        self._refresh_lock = asyncio.Lock()
+        self._req_id = random.randint(10000, 99999)
+
+    async def initialize(self):
+        session_file = Path(settings.GEMINI_SESSION_FILE)
+        try:
+            self.session = GeminiSession.load(session_file)
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ 无法读取会话文件 {session_file}: {e}")
+            return
+
+        self.client.cookies.update(self.session.cookies)
+        if not self.session.has_params:
+            logger.warning(f"⚠️ 会话 {self.session.name} 缺少动态参数，尝试刷新...")
+            try:
+                await self._refresh_params(self.session.at)
+            except SessionExpiredError as e:
+                logger.error(f"❌ {e}")
+                return
+        logger.success(f"✅ 直连 HTTP 模式已就绪 (会话: {self.session.name}，目标: {settings.GEMINI_BASE_URL})。")
+
+    async def close(self):
+        await self.client.aclose()
+
+    def is_ready(self) -> bool:
+        return self.session is not None and self.session.has_params
+
+    # -----------------------------------------------
+    # 动态参数刷新
+    # -----------------------------------------------
+    async def _refresh_params(self, stale_at: Optional[str]):
+        """刷新 at / f.sid；并发的过期请求只触发一次刷新"""
+        async with self._refresh_lock:
+            if self.session.at != stale_at and self.session.has_params:
+                return  # 其它请求已经刷新过了
+            if not await self._refresh_params_via_http():
+                await self._refresh_params_via_browser()
+            if not self.session.has_params:
+                raise SessionExpiredError("无法刷新会话动态参数，请重新导出会话。")
+            self.session.save()
+
+    async def _refresh_params_via_http(self) -> bool:
+        try:
+            response = await self.client.get("/app")
+            return self.session.update_params_from_html(response.text)
+        except httpx.HTTPError as e:
+            logger.warning(f"HTTP 刷新会话参数失败: {e}")
+            return False
+
+    async def _refresh_params_via_browser(self) -> bool:
+        logger.info(f"🌐 会话 {self.session.name}: 启动浏览器刷新动态参数...")
+        from playwright.async_api import async_playwright
+
+        host = httpx.URL(settings.GEMINI_BASE_URL).host
+        # __Host- Cookie 不能带 domain，改用 url 指定
+        cookies = [
+            {"name": k, "value": v, "url": settings.GEMINI_BASE_URL, "secure": True} if k.startswith("__Host-")
+            else {"name": k, "value": v, "domain": host, "path": "/", "secure": True}
+            for k, v in self.session.cookies.items()
+        ]
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True, args=['--no-sandbox', '--disable-setuid-sandbox'])
+            try:
+                context = await browser.new_context(user_agent=USER_AGENT)
+                await context.add_cookies(cookies)
+                page = await context.new_page()
+                await page.goto(f"{settings.GEMINI_BASE_URL}/app", timeout=30000)
+                values = await page.evaluate(
+                    "(keys) => Object.fromEntries(keys.map(k => [k, (window.WIZ_global_data || {})[k] || null]))",
+                    list(WIZ_KEYS.values()),
+                )
+                return self.session.update_params(values)
+            except Exception as e:
+                logger.warning(f"浏览器刷新会话参数失败: {e}")
+                return False
+            finally:
+                await browser.close()
+
+    # -----------------------------------------------
+    # StreamGenerate 请求
+    # -----------------------------------------------
+    def _get_latest_user_message(self, request_data: Dict[str, Any]) -> str:
+        for m in reversed(request_data.get("messages", [])):
+            if m.get('role') == 'user':
+                return m.get('content') or "Hello"
+        return "Hello"
+
+    def _build_request(self, prompt: str) -> httpx.Request:
+        self._req_id += 100000
+        params = {"f.sid": self.session.f_sid, "hl": "en", "_reqid": str(self._req_id), "rt": "c"}
+        if self.session.build_label:
+            params["bl"] = self.session.build_label
+        f_req = json.dumps([None, json.dumps([[prompt], None, None])])
+        return self.client.build_request(
+            "POST",
+            STREAM_GENERATE_ENDPOINT,
+            params=params,
+            data={"f.req": f_req, "at": self.session.at},
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded;charset=utf-8",
+                "Origin": settings.GEMINI_BASE_URL,
+                "Referer": f"{settings.GEMINI_BASE_URL}/",
+                "X-Same-Domain": "1",
+            },
+        )
+
+    async def _open_stream(self, prompt: str) -> httpx.Response:
+        """发送请求并返回尚未读取响应体的流式响应；参数过期时刷新后重试一次"""
+        for attempt in range(2):
+            used_at = self.session.at
+            response = await self.client.send(self._build_request(prompt), stream=True)
+            if response.status_code == 200:
+                return response
+            await response.aclose()
+            if response.status_code in EXPIRED_STATUS_CODES and attempt == 0:
+                logger.warning(f"⚠️ StreamGenerate 返回 {response.status_code}，刷新会话参数后重试...")
+                await self._refresh_params(used_at)
+                continue
+            raise HTTPException(status_code=502, detail=f"StreamGenerate 请求失败，状态码: {response.status_code}")
+
+    async def _stream_deltas(self, response: httpx.Response) -> AsyncGenerator[str, None]:
+        parser = StreamGenerateParser()
+        try:
+            async for chunk in response.aiter_text():
+                for delta in parser.feed_deltas(chunk):
+                    yield delta
+        finally:
+            await response.aclose()
+        if parser.last_frame and parser.last_frame.error_code is not None:
+            raise RuntimeError(f"StreamGenerate 返回错误码: {parser.last_frame.error_code}")
+
+    async def _stream_generator(self, response: httpx.Response, request_id: str, model_name: str) -> AsyncGenerator[bytes, None]:
+        encoder = ChunkEncoder(request_id, model_name)
+        deltas = self._stream_deltas(response)
+        if settings.SSE_CHUNK_STRATEGY == "time":
+            deltas = coalesce_deltas(deltas, settings.SSE_CHUNK_WINDOW_MS / 1000, settings.SSE_CHUNK_BYTES)
+        try:
+            async for delta in deltas:
+                yield encoder.encode(delta)
+            yield encoder.stop()
+        except Exception as e:
+            logger.error(f"直连流式输出中断: {e}")
+        yield DONE_CHUNK
+
+    async def chat_completion(self, request_data: Dict[str, Any]) -> [JSONResponse, StreamingResponse]:
+        if not self.is_ready():
+            raise HTTPException(status_code=503, detail="服务不可用：会话凭据未加载。")
+
+        prompt = self._get_latest_user_message(request_data)
+        request_id = f"chatcmpl-{int(time.time())}"
+        try:
+            response = await self._open_stream(prompt)
+        except (httpx.HTTPError, SessionExpiredError) as e:
+            raise HTTPException(status_code=502, detail=f"StreamGenerate 请求失败: {e}")
+
+        if request_data.get("stream") is True:
+            return ReleasingStreamingResponse(
+                self._stream_generator(response, request_id, settings.DEFAULT_MODEL),
+                on_release=response.aclose,
+                media_type="text/event-stream"
+            )
+
+        try:
+            text = "".join([delta async for delta in self._stream_deltas(response)])
+        except (httpx.HTTPError, RuntimeError) as e:
+            raise HTTPException(status_code=502, detail=f"读取 StreamGenerate 响应失败: {e}")
+        if not text:
+            raise HTTPException(status_code=502, detail="StreamGenerate 响应中没有回答文本。")
+        logger.info(f"✅ 直连模式返回答案。长度: {len(text)}")
+        return JSONResponse(content=create_chat_completion_response(request_id, settings.DEFAULT_MODEL, text.strip()))
+
+    async def get_models(self) -> JSONResponse:
+        return JSONResponse(content={
+            "object": "list",
+            "data": [{"id": name, "object": "model", "created": int(time.time()), "owned_by": "Google"} for name in settings.KNOWN_MODELS]
+        })
@@ -1,13 +1,12 @@
 import json
 import time
 import asyncio
+import contextlib
 import random
-import re
-from typing import Dict, Any, AsyncGenerator, List, Optional, Tuple
+from typing import Dict, Any, AsyncGenerator, List, Optional, Set, Tuple
 from pathlib import Path
 from urllib.parse import parse_qs, urlparse, unquote_plus
 import traceback
-import httpx# 保持导入，用于客户端初始化
 
 from fastapi import HTTPException
 from fastapi.responses import JSONResponse, StreamingResponse
@@ -15,66 +14,867 @@ from loguru import logger
 from playwright.async_api import async_playwright, Playwright, BrowserContext, Browser, Error as PlaywrightError, Route 
 
 # 导入 BaseProvider
+from app.core import metrics
 from app.core.config import settings
-from app.providers.base_provider import BaseProvider
-from app.utils.sse_utils import create_sse_data, create_chat_completion_chunk, DONE_CHUNK
+from app.core.account_health import AccountScheduler, detect_rate_limit
+from app.core.artifact_store import ArtifactStore
+from app.core.auth_sessions import AuthSession, AuthSessionPool
+from app.core.autoscaler import AutoscalePolicy
+from app.core.browser_farm import RemoteEndpoint, parse_endpoints
+from app.core.browser_lifecycle import RecyclePolicy, browser_process_ids, read_rss_mb
+from app.core.response_cache import ResponseCache, is_cacheable, make_cache_key
+from app.core.conversation_store import ConversationStore, ConversationTurn, Conversation
+from app.core.startup import startup_report
+from app.core.single_flight import SingleFlight, Flight, FlightAbandoned, Subscription
+from app.core.route_policy import RoutePolicy, format_route_stats
+from app.core.dispatcher import RequestDispatcher, QueueFullError, Lease
+from app.core.hedging import AccountThrottled, HedgePolicy, PageUnavailable, PromptNotSent, is_retryable
+from app.core.page_pool import PagePool, WarmPage
+from app.providers.base_provider import BaseProvider, ReleasingStreamingResponse
+from app.utils.stream_generate import StreamGenerateParser, parse_stream_generate_body
+from app.utils.sse_utils import ChunkEncoder, coalesce_deltas, create_chat_completion_response, split_text, DONE_CHUNK
 
 # 调试目录常量
 DEBUG_DIR = Path("debug")
 DEBUG_DIR.mkdir(exist_ok=True)
 
+# Gemini 页面的 DOM 约定 (页面地址由 settings.GEMINI_BASE_URL 决定，压测时可指向本地模拟页面)
+GEMINI_APP_PATH = "/app"
+TEXT_INPUT_SELECTOR = 'rich-textarea div.ql-editor'
+SEND_BUTTON_SELECTOR = 'button[aria-label*="Send"], button.send-button'
+ACTIVE_SEND_BUTTON_SELECTOR = 'button[aria-label*="Send"]:not([aria-disabled="true"]), button.send-button:not([aria-disabled="true"])'
+ANSWER_CONTENT_SELECTOR = 'message-content'
+STOP_BUTTON_SELECTOR = 'button[aria-label*="Stop"], button.stop-button'
+ANSWER_FINISHED_SELECTOR = 'button[aria-label*="Send"][aria-disabled="true"], button.send-button[aria-disabled="true"]'
+NEW_CHAT_SELECTOR = 'button[aria-label*="New chat"], a[href="/app"]'
+# 未登录时页面顶部的登录入口
+SIGN_IN_SELECTOR = 'a[href*="accounts.google.com/ServiceLogin"], a[href*="accounts.google.com/v3/signin"]'
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36"
+
+# 回答生成接口 (网络层提取模式直接解析它的响应体)
+STREAM_GENERATE_PATH = "StreamGenerate"
+
+# 关闭时等待后台任务 (保存失败现场、关闭会话页面、缩容排空等) 的上限 (秒)，超时的任务被取消
+BACKGROUND_SHUTDOWN_TIMEOUT = 10.0
+
+# 回答完成检测：以下脚本由 wait_for_function 轮询，新回答块出现后才判断，避免把上一轮的状态当成完成
+# 发送按钮恢复为禁用状态
+BUTTON_IDLE_JS = """
+({ selector, startCount, finishedSelector }) =>
+    document.querySelectorAll(selector).length > startCount && !!document.querySelector(finishedSelector)
+"""
+# 最后一个回答块的文本在 quietMs 内没有变化
+CONTENT_QUIET_JS = """
+({ selector, startCount, quietMs }) => {
+    const blocks = document.querySelectorAll(selector);
+    if (blocks.length <= startCount) return false;
+    const text = blocks[blocks.length - 1].innerText || "";
+    const now = Date.now();
+    const state = window.__geminiQuiet;
+    if (!state || state.count !== blocks.length || state.text !== text) {
+        window.__geminiQuiet = { count: blocks.length, text, since: now };
+        return false;
+    }
+    return text.length > 0 && now - state.since >= quietMs;
+}
+"""
+# 网络信号到达后等待 DOM 渲染跟上的静默时间
+RENDER_SETTLE_MS = 300
+
+# 真流式 (DOM)：页面内观察最后一个回答块，把新增文本通过 binding 推回 Python
+STREAM_BINDING_NAME = "__geminiStreamPush"
+STREAM_OBSERVER_JS = """
+({ selector, startCount, binding }) => {
+    let emitted = "";
+    let pending = Promise.resolve();
+    const emit = () => {
+        const blocks = document.querySelectorAll(selector);
+        if (blocks.length <= startCount) return pending;
+        const text = blocks[blocks.length - 1].innerText || "";
+        // 渲染过程中已输出的前缀可能被改写 (如 Markdown 格式化)，只推送超出已输出长度的部分
+        if (text.length > emitted.length) {
+            const delta = text.slice(emitted.length);
+            emitted = text;
+            pending = window[binding](delta);
+        }
+        return pending;
+    };
+    const observer = new MutationObserver(emit);
+    observer.observe(document.body, { childList: true, subtree: true, characterData: true });
+    window.__geminiStreamStop = async () => {
+        observer.disconnect();
+        window.__geminiStreamStop = null;
+        await emit();
+        return emitted.length;
+    };
+}
+"""
+
+# 真流式 (网络层)：页面加载前注入，截获 StreamGenerate XHR 的响应体增量并原样推回 Python
+NETWORK_BINDING_NAME = "__geminiNetworkPush"
+NETWORK_TAP_JS = """
+(() => {
+    const binding = "%s";
+    const open = XMLHttpRequest.prototype.open;
+    const send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.open = function (method, url) {
+        this.__isStreamGenerate = String(url).includes("%s");
+        return open.apply(this, arguments);
+    };
+    XMLHttpRequest.prototype.send = function () {
+        if (this.__isStreamGenerate) {
+            let offset = 0;
+            const flush = (done) => {
+                const text = this.responseText || "";
+                const chunk = text.slice(offset);
+                offset = text.length;
+                if ((chunk || done) && window[binding]) window[binding](chunk, done);
+            };
+            this.addEventListener("progress", () => flush(false));
+            this.addEventListener("loadend", () => flush(true));
+        }
+        return send.apply(this, arguments);
+    };
+})();
+""" % (NETWORK_BINDING_NAME, STREAM_GENERATE_PATH)
+
 class BrowserInstance:
-    """封装 Playwright Browser实例及其锁"""
-    def __init__(self, browser: Browser, name: str):
+    """封装 Playwright Browser实例、并发槽位数及其预热页面池"""
+    def __init__(self, browser: Browser, name: str, capacity: int = 1, endpoint: Optional[RemoteEndpoint] = None):
         self.browser = browser
-        self.lock = asyncio.Lock()
+        self.capacity = max(1, capacity) # 同时进行的对话数，由调度器保证不超出
         self.name = name
+        self.endpoint = endpoint  # 远程节点；本地启动的实例为 None
+        self.pages: Optional[PagePool] = None
+        self.requests = 0  # 累计分配到的请求数
+        self.created_at = time.monotonic()
+        self.rss_mb: Optional[float] = None  # 最近一次采样的进程树 RSS (仅本地实例)
+        self.session: Optional[AuthSession] = None  # 固定使用的登录会话；None 为匿名
 
 class GeminiProvider(BaseProvider):
     def __init__(self):
         self.playwright: Optional[Playwright] = None
         self.browser_pool: List[BrowserInstance] = [] # 浏览器实例池
-        self.client = httpx.AsyncClient(timeout=settings.API_REQUEST_TIMEOUT)
+        self.app_url = settings.GEMINI_BASE_URL.rstrip("/") + GEMINI_APP_PATH
+        self.accounts: Optional[AccountScheduler] = None
+        if settings.ACCOUNT_HEALTH_ENABLED:
+            self.accounts = AccountScheduler(
+                self._account_of,
+                settings.ACCOUNT_RATE_PER_MINUTE,
+                settings.ACCOUNT_BURST,
+                settings.ACCOUNT_ERROR_WINDOW,
+                settings.ACCOUNT_ERROR_THRESHOLD,
+                settings.ACCOUNT_MIN_REQUESTS,
+                settings.ACCOUNT_COOLDOWN_BASE,
+                settings.ACCOUNT_COOLDOWN_MAX,
+                settings.API_REQUEST_TIMEOUT,
+            )
+        self.dispatcher = RequestDispatcher(settings.QUEUE_MAX_SIZE, settings.QUEUE_MAX_WAIT, settings.BATCH_RESERVED_SLOTS, self.accounts)
+        self.hedging = HedgePolicy(
+            settings.HEDGE_ENABLED,
+            settings.HEDGE_QUANTILE,
+            settings.HEDGE_MIN_DELAY,
+            settings.HEDGE_MAX_RATIO,
+            settings.HEDGE_MIN_SAMPLES,
+        )
+        self.artifacts = ArtifactStore(
+            DEBUG_DIR,
+            max_bytes=settings.DEBUG_ARTIFACT_MAX_MB * 1024 * 1024,
+            max_age=settings.DEBUG_ARTIFACT_MAX_AGE_HOURS * 3600,
+        )
+        self._background_tasks: Set[asyncio.Task] = set()
+        self.abandoned = {"queued": 0, "interaction": 0, "stream": 0, "saved_slot_seconds": 0.0}  # 被取消的请求
+        self.remote_endpoints = parse_endpoints(settings.REMOTE_BROWSER_ENDPOINTS, settings.BROWSER_TABS_PER_INSTANCE)
+        self._health_task: Optional[asyncio.Task] = None
+        self.autoscaler: Optional[AutoscalePolicy] = None
+        if settings.AUTOSCALE_ENABLED:
+            self.autoscaler = AutoscalePolicy(
+                settings.AUTOSCALE_MIN_INSTANCES,
+                settings.AUTOSCALE_MAX_INSTANCES,
+                settings.AUTOSCALE_WINDOW,
+                settings.AUTOSCALE_UP_UTILIZATION,
+                settings.AUTOSCALE_DOWN_UTILIZATION,
+                settings.AUTOSCALE_UP_COOLDOWN,
+                settings.AUTOSCALE_DOWN_COOLDOWN,
+                settings.BROWSER_TABS_PER_INSTANCE,
+            )
+        self._autoscale_task: Optional[asyncio.Task] = None
+        self.auth_sessions: Optional[AuthSessionPool] = None
+        self._auth_task: Optional[asyncio.Task] = None
+        self._launching = 0  # 正在启动的本地实例数
+        self.recycle_policy = RecyclePolicy(
+            settings.BROWSER_MAX_REQUESTS,
+            settings.BROWSER_MAX_AGE_HOURS * 3600,
+            settings.BROWSER_MAX_RSS_MB,
+        )
+        self._lifecycle_task: Optional[asyncio.Task] = None
+        self._local_seq = 0  # 本地实例编号 (替换实例使用新编号)
+        self._closing = False
+        self._starting = False  # 首次启动的实例尚未全部启动完成
+        self._required_ready = 1
+        self.flights = SingleFlight()
+        self.conversations: Optional[ConversationStore] = None
+        if settings.CONVERSATION_AFFINITY:
+            self.conversations = ConversationStore(settings.CONVERSATION_MAX_PAGES, settings.CONVERSATION_TTL, self._close_conversation)
+        self.cache: Optional[ResponseCache] = None
+        if settings.CACHE_ENABLED:
+            self.cache = ResponseCache(settings.CACHE_MAX_MB * 1024 * 1024, settings.CACHE_TTL, settings.CACHE_DISK_PATH)
+        self.route_policy = RoutePolicy(
+            settings.ROUTE_POLICY,
+            settings.ROUTE_BLOCK_RESOURCE_TYPES,
+            settings.ROUTE_BLOCK_URL_PATTERNS,
+            settings.ROUTE_ALLOW_URL_PATTERNS,
+        )
 
     async def initialize(self):
         """初始化 Playwright 和浏览器实例池"""
-        self.playwright = await async_playwright().start()
+        with startup_report.phase("playwright driver"):
+            self.playwright = await async_playwright().start()
+        if settings.AUTH_SESSION_DIRS:
+            with startup_report.phase("auth sessions"):
+                self.auth_sessions = await AuthSessionPool.load(self.playwright, settings.AUTH_SESSION_DIRS, USER_AGENT)
+            if not self.auth_sessions.sessions:
+                logger.warning("⚠️ AUTH_SESSION_DIRS 中没有可用的登录会话，退回匿名模式。")
+                self.auth_sessions = None
+        await self.artifacts.enforce_async()
         
-        logger.info("注意: 采用 Playwright 提取 + 伪流式返回方案。")
+        source_desc = "网络层 (StreamGenerate)" if settings.EXTRACTION_MODE == "network" else "DOM"
+        stream_desc = "真流式" if settings.STREAMING_MODE == "live" else "伪流式"
+        logger.info(f"注意: 采用 Playwright {source_desc} 提取 + {stream_desc}返回方案。")
 
-        for i in range(settings.PLAYWRIGHT_POOL_SIZE):
-            session_name = f"Browser-Instance-{i+1}"
-            try:
-                # 启动一个常驻的 Browser 实例
+        # 本地实例和远程节点并发启动，至少 READY_MIN_INSTANCES 个实例预热完成即返回，其余在后台继续
+        self._starting = True
+        local_count = self.autoscaler.clamp(settings.PLAYWRIGHT_POOL_SIZE) if self.autoscaler else settings.PLAYWRIGHT_POOL_SIZE
+        launches = [asyncio.create_task(self._launch_local()) for _ in range(local_count)]
+        launches += [asyncio.create_task(self._connect_remote(endpoint)) for endpoint in self.remote_endpoints]
+        self._required_ready = max(1, min(settings.READY_MIN_INSTANCES, len(launches)))
+        await self._wait_for_startup(launches)
+        if self.remote_endpoints:
+            # 定期检查远程节点：失联的节点移出池，恢复的节点重新加入
+            self._health_task = asyncio.create_task(self._health_check_loop())
+        if self.recycle_policy.enabled:
+            # 按请求数/存活时间/RSS 回收本地实例：先启动替换实例，再排空并关闭旧实例
+            self._lifecycle_task = asyncio.create_task(self._lifecycle_loop())
+        if self.autoscaler:
+            self._autoscale_task = asyncio.create_task(self._autoscale_loop())
+        if self.auth_sessions:
+            self._auth_task = asyncio.create_task(self._auth_check_loop())
+
+        if not self.browser_pool:
+            logger.error("🚫 所有浏览器实例初始化失败。服务将无法工作。")
+        else:
+            logger.success(
+                f"✅ {len(self.browser_pool)} 个浏览器实例已成功加载（{self._session_mode_desc()}），"
+                f"每个实例 {settings.BROWSER_TABS_PER_INSTANCE} 个并发槽位，共 {self.dispatcher.total_capacity} 个。"
+            )
+
+    async def _wait_for_startup(self, launches: List[asyncio.Task]):
+        """等待足够的实例就绪或启动预算用完；全部启动任务结束后输出启动耗时报告"""
+        startup = asyncio.gather(*launches, return_exceptions=True)
+        startup.add_done_callback(lambda _: self._finish_startup())
+        deadline = time.monotonic() + settings.STARTUP_TIMEOUT
+        pending = set(launches)
+        while pending and self.ready_instances < self._required_ready:
+            done, pending = await asyncio.wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.warning(f"⏱️ 启动预算 {settings.STARTUP_TIMEOUT}s 已用完，仍有 {len(pending)} 个实例在后台继续启动。")
+                break
+        if pending and self.ready_instances >= self._required_ready:
+            logger.info(f"🚀 {self.ready_instances} 个实例已就绪，其余 {len(pending)} 个实例在后台继续启动。")
+        for task in pending:
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+    def _finish_startup(self):
+        self._starting = False
+        startup_report.log_summary()
+
+    def _startup_phase(self, name: str):
+        """只记录首次启动期间的阶段耗时 (之后的替换/回收实例不计入启动报告)"""
+        return startup_report.phase(name) if self._starting else contextlib.nullcontext()
+
+    @property
+    def ready_instances(self) -> int:
+        """已完成预热导航 (至少一个页面成功打开 Gemini) 的实例数"""
+        return sum(1 for instance in self.browser_pool if instance.pages.warmed)
+
+    def is_ready(self) -> bool:
+        return bool(self.browser_pool)
+
+    async def readiness(self) -> Dict[str, Any]:
+        ready = self.ready_instances
+        return {
+            "ready": ready >= self._required_ready,
+            "ready_instances": ready,
+            "required_instances": self._required_ready,
+            "starting": self._starting,
+        }
+
+    async def _launch_local(self) -> Optional[BrowserInstance]:
+        """在本机启动一个常驻的 Browser 实例并加入池；失败时返回 None"""
+        self._local_seq += 1
+        session_name = f"Browser-Instance-{self._local_seq}"
+        self._launching += 1
+        try:
+            with self._startup_phase(f"launch {session_name}"):
                 browser = await self.playwright.chromium.launch(
                     headless=True,
                     args=[
                         '--no-sandbox', 
                         '--disable-setuid-sandbox', 
                         '--disable-features=IsolateOrigins,site-per-process',
-                        '--disable-blink-features=AutomationControlled'
+                        '--disable-blink-features=AutomationControlled',
+                        # 多标签页并发时避免后台页面被降频
+                        '--disable-background-timer-throttling',
+                        '--disable-backgrounding-occluded-windows',
+                        '--disable-renderer-backgrounding'
                     ],
                 )
-                self.browser_pool.append(BrowserInstance(browser, session_name))
-                logger.success(f"✅ {session_name} 浏览器实例已成功加载。")
+            instance = BrowserInstance(browser, session_name, settings.BROWSER_TABS_PER_INSTANCE)
+            await self._add_instance(instance)
+            browser.on("disconnected", lambda _: self._on_browser_disconnected(instance))
+            logger.success(f"✅ {session_name} 浏览器实例已成功加载。")
+            return instance
+
+        except PlaywrightError as e:
+            logger.error(f"❌ Playwright 初始化 {session_name} 失败: {e}")
+        except Exception as e:
+            logger.error(f"❌ 初始化 {session_name} 发生未知错误: {e}")
+        finally:
+            self._launching -= 1
+        return None
+
+    async def _connect_remote(self, endpoint: RemoteEndpoint) -> bool:
+        """连接一个远程浏览器节点并加入池；失败时返回 False，由健康检查稍后重试"""
+        try:
+            with self._startup_phase(f"connect {endpoint.name}"):
+                browser = await endpoint.connect(self.playwright, settings.REMOTE_CONNECT_TIMEOUT * 1000)
+        except Exception as e:
+            logger.warning(f"⚠️ 无法连接远程浏览器 {endpoint.name} ({endpoint.kind}): {e}")
+            return False
+        instance = BrowserInstance(browser, endpoint.name, endpoint.capacity, endpoint)
+        try:
+            await self._add_instance(instance, require_warm=True)
+        except Exception as e:
+            logger.warning(f"⚠️ 远程浏览器 {endpoint.name} 预热失败: {e}")
+            await self._close_browser(instance)
+            return False
+        browser.on("disconnected", lambda _: self._on_browser_disconnected(instance))
+        logger.success(f"✅ 远程浏览器 {endpoint.name} 已加入池 ({endpoint.capacity} 个槽位)。")
+        return True
+
+    async def _add_instance(self, instance: BrowserInstance, require_warm: bool = False):
+        if self.auth_sessions:
+            instance.session = self.auth_sessions.assign()
+        instance.pages = self._create_page_pool(instance)
+        with self._startup_phase(f"warmup {instance.name}"):
+            await instance.pages.start()
+        if require_warm and instance.pages.idle_count == 0:
+            await instance.pages.close()
+            AuthSessionPool.release(instance.session)
+            raise RuntimeError("没有任何页面预热成功。")
+        self.browser_pool.append(instance)
+        self.dispatcher.add_instance(instance)
+        if self._starting and self.ready_instances >= self._required_ready:
+            startup_report.mark_ready()
 
-            except PlaywrightError as e:
-                logger.error(f"❌ Playwright 初始化 {session_name} 失败: {e}")
+    async def _remove_instance(self, instance: BrowserInstance, reason: str, drain: bool = False):
+        """
+        把实例移出池：不再分配新请求，预热页面和会话页面随之关闭。
+        drain=True 时等待进行中的请求结束 (最多 API_REQUEST_TIMEOUT 秒) 再关闭浏览器，否则进行中的请求自行失败。
+        """
+        if instance not in self.browser_pool:
+            return
+        logger.warning(f"🔻 {instance.name} 移出浏览器池: {reason}")
+        self.browser_pool.remove(instance)
+        self.dispatcher.remove_instance(instance)
+        AuthSessionPool.release(instance.session)
+        if self.accounts:
+            self.accounts.forget(instance.name)  # 匿名实例的账号随实例一起消失
+        if self.conversations:
+            self.conversations.discard_instance(instance)
+        if drain:
+            deadline = time.monotonic() + settings.API_REQUEST_TIMEOUT
+            while self.dispatcher.load(instance) and time.monotonic() < deadline:
+                await asyncio.sleep(0.5)
+        await instance.pages.close()
+        await self._close_browser(instance)
+        metrics.forget_instance(instance.name)
+        logger.info(f"{instance.name} 已关闭 (共处理 {instance.requests} 个请求)。")
+
+    @staticmethod
+    async def _close_browser(instance: BrowserInstance):
+        try:
+            await instance.browser.close()
+        except Exception:
+            pass
+
+    def _on_browser_disconnected(self, instance: BrowserInstance):
+        """浏览器崩溃或连接断开：立即移出池；本地实例同时启动替换实例，远程节点由健康检查重连"""
+        if self._closing or instance not in self.browser_pool:
+            return
+
+        async def remove_and_replace():
+            await self._remove_instance(instance, "浏览器进程已退出或连接已断开")
+            if instance.endpoint is None:
+                await self._launch_local()
+
+        self._run_in_background(remove_and_replace())
+
+    async def _lifecycle_loop(self):
+        while True:
+            await asyncio.sleep(settings.BROWSER_LIFECYCLE_INTERVAL)
+            for instance in [i for i in self.browser_pool if i.endpoint is None]:
+                try:
+                    await self._check_lifecycle(instance)
+                except Exception as e:
+                    logger.error(f"{instance.name} 生命周期检查失败: {e}")
+
+    async def _check_lifecycle(self, instance: BrowserInstance):
+        if self.recycle_policy.max_rss_mb:
+            instance.rss_mb = read_rss_mb(await browser_process_ids(instance.browser))
+        reason = self.recycle_policy.reason(instance.requests, instance.created_at, instance.rss_mb)
+        if reason is None or instance not in self.browser_pool:
+            return
+        logger.info(f"♻️ {instance.name} 达到回收阈值 ({reason})，先启动替换实例...")
+        if await self._launch_local() is None:
+            logger.warning(f"替换实例启动失败，{instance.name} 暂不回收。")
+            return
+        await self._remove_instance(instance, f"回收 ({reason})", drain=True)
+
+    async def _autoscale_loop(self):
+        while True:
+            await asyncio.sleep(settings.AUTOSCALE_INTERVAL)
+            try:
+                self._check_autoscale()
             except Exception as e:
-                logger.error(f"❌ 初始化 {session_name} 发生未知错误: {e}")
+                logger.error(f"弹性伸缩检查失败: {e}")
 
-        if not self.browser_pool:
-            logger.error("🚫 所有浏览器实例初始化失败。服务将无法工作。")
+    def _check_autoscale(self):
+        """采样调度器负载并按策略扩缩容；启动/排空实例在后台进行，不阻塞下一次采样"""
+        self.autoscaler.observe(self.dispatcher.queue_depth, self.dispatcher.in_flight, self.dispatcher.total_capacity)
+        local = [i for i in self.browser_pool if i.endpoint is None]
+        idle = [i for i in local if not self.dispatcher.load(i)]
+        decision = self.autoscaler.decide(len(local) + self._launching, can_shrink=bool(idle))
+        if decision is None:
+            return
+        if decision.delta > 0:
+            logger.info(f"📈 弹性扩容: {decision.current} -> {decision.target} 个本地实例 ({decision.reason})")
+            metrics.AUTOSCALE_EVENTS.labels("up").inc(decision.delta)
+            for _ in range(decision.delta):
+                self._run_in_background(self._launch_local())
         else:
-            logger.success(f"✅ {len(self.browser_pool)} 个浏览器实例已成功加载（纯匿名非持久化模式启动）。")
+            victim = min(idle, key=lambda i: i.created_at)
+            logger.info(f"📉 弹性缩容: {decision.current} -> {decision.target} 个本地实例 ({decision.reason})，排空 {victim.name}")
+            metrics.AUTOSCALE_EVENTS.labels("down").inc()
+            self._run_in_background(self._remove_instance(victim, "弹性缩容", drain=True))
+
+    def _session_mode_desc(self) -> str:
+        if not self.auth_sessions:
+            return "纯匿名非持久化模式启动"
+        return f"登录会话模式，{self.auth_sessions.valid_count} 个有效会话"
+
+    @staticmethod
+    def _context_options(session: Optional[AuthSession]) -> Dict[str, Any]:
+        options = dict(
+            user_agent=USER_AGENT,
+            viewport={"width": 1920, "height": 1080},
+            locale="zh-CN",
+        )
+        if session is not None:
+            options["storage_state"] = session.state  # 内存中的登录状态，创建 context 无需读取 profile 目录
+        return options
+
+    async def _auth_check_loop(self):
+        while True:
+            await asyncio.sleep(settings.AUTH_SESSION_CHECK_INTERVAL)
+            for session in self.auth_sessions.sessions:
+                try:
+                    await self._check_auth_session(session)
+                except Exception as e:
+                    logger.warning(f"登录会话 {session.name} 检查失败 (暂不判定为失效): {e}")
+
+    async def _check_auth_session(self, session: AuthSession):
+        """用该会话的 storage_state 打开一次 Gemini：出现登录入口即视为失效；有效时保存轮换后的 Cookie"""
+        if not self.browser_pool:
+            return
+        instance = next((i for i in self.browser_pool if i.session is session), self.browser_pool[0])
+        context = await instance.browser.new_context(**self._context_options(session))
+        try:
+            page = await context.new_page()
+            await page.goto(self.app_url, timeout=30000)
+            await page.wait_for_selector(TEXT_INPUT_SELECTOR, timeout=10000)
+            valid = await page.locator(SIGN_IN_SELECTOR).count() == 0
+            if valid:
+                state = await context.storage_state()
+                await asyncio.to_thread(session.update_state, state)
+        finally:
+            await context.close()
+
+        self.auth_sessions.mark(session, valid)
+        # 固定到失效会话的实例改用其它有效会话 (没有则匿名)；会话恢复后匿名实例重新固定。
+        # 已预热的页面仍带着旧 Cookie，整池换新
+        for instance in self.browser_pool:
+            if (not valid and instance.session is session) or (valid and instance.session is None):
+                AuthSessionPool.release(instance.session)
+                instance.session = self.auth_sessions.assign()
+                instance.pages.renew()
+                logger.info(f"🔁 {instance.name} 改用登录会话 {instance.session.name if instance.session else '(匿名)'}，预热页面将重新创建。")
+
+    async def _health_check_loop(self):
+        while True:
+            await asyncio.sleep(settings.REMOTE_HEALTH_INTERVAL)
+            try:
+                await self._check_remote_endpoints()
+            except Exception as e:
+                logger.error(f"远程浏览器健康检查失败: {e}")
+
+    async def _check_remote_endpoints(self):
+        connected = {i.endpoint: i for i in self.browser_pool if i.endpoint is not None}
+        for endpoint in self.remote_endpoints:
+            instance = connected.get(endpoint)
+            if instance is None:
+                await self._connect_remote(endpoint)
+            elif not await self._probe(instance):
+                await self._remove_instance(instance, "健康检查失败")
+
+    @staticmethod
+    async def _probe(instance: BrowserInstance) -> bool:
+        """节点能在限定时间内创建并关闭一个 context 即视为健康"""
+        if not instance.browser.is_connected():
+            return False
+        try:
+            context = await asyncio.wait_for(instance.browser.new_context(), timeout=settings.REMOTE_CONNECT_TIMEOUT)
+            await context.close()
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ {instance.name} 健康检查未通过: {e}")
+            return False
 
     async def close(self):
         """清理资源"""
-        for instance in self.browser_pool:
+        self._closing = True
+        loops = [t for t in (self._health_task, self._lifecycle_task, self._autoscale_task, self._auth_task) if t]
+        for task in loops:
+            task.cancel()
+        await asyncio.gather(*loops, return_exceptions=True)
+        if self.conversations:
+            self.conversations.close()
+        if self._background_tasks:
+            _, pending = await asyncio.wait(set(self._background_tasks), timeout=BACKGROUND_SHUTDOWN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        # 后台任务结束后再取实例列表，期间启动完成的实例也一并关闭
+        instances, self.browser_pool = self.browser_pool, []
+        for instance in instances:
+            if instance.pages:
+                await instance.pages.close()
             await instance.browser.close()  
         if self.playwright:
             await self.playwright.stop()
-        await self.client.aclose()
+        if self.cache:
+            self.cache.close()
+
+    async def stats(self) -> Dict[str, Any]:
+        """调度队列、请求合并、回答缓存和路由屏蔽的运行统计"""
+        return {
+            "dispatcher": self.dispatcher.stats(),
+            "coalescing": self.flights.stats(),
+            "cache": self.cache.stats() if self.cache else None,
+            "conversations": self.conversations.stats() if self.conversations else None,
+            "routes": dict(self.route_policy.totals),
+            "instances": [
+                {
+                    "name": i.name,
+                    "remote": i.endpoint is not None,
+                    "capacity": i.capacity,
+                    "in_flight": self.dispatcher.load(i),
+                    "requests": i.requests,
+                    "age_seconds": int(time.monotonic() - i.created_at),
+                    "rss_mb": round(i.rss_mb) if i.rss_mb is not None else None,
+                }
+                for i in self.browser_pool
+            ],
+            "startup": startup_report.as_dict(),
+            "autoscaler": self.autoscaler.stats() if self.autoscaler else None,
+            "auth_sessions": self.auth_sessions.stats() if self.auth_sessions else None,
+            "accounts": self.accounts.stats() if self.accounts else None,
+            "tail_latency": self.hedging.stats(),
+            "abandoned": {**self.abandoned, "saved_slot_seconds": round(self.abandoned["saved_slot_seconds"], 1)},
+        }
+
+    async def render_metrics(self) -> bytes:
+        """抓取前刷新池容量/占用/排队等瞬时指标"""
+        metrics.set_pool_gauges(
+            self.dispatcher.total_capacity,
+            self.dispatcher.in_flight,
+            self.dispatcher.queue_depth,
+            {i.name: i.pages.idle_count for i in self.browser_pool if i.pages},
+        )
+        remote = sum(1 for i in self.browser_pool if i.endpoint is not None)
+        metrics.POOL_INSTANCES.labels("local").set(len(self.browser_pool) - remote)
+        metrics.POOL_INSTANCES.labels("remote").set(remote)
+        if self.auth_sessions:
+            metrics.AUTH_SESSIONS.labels("valid").set(self.auth_sessions.valid_count)
+            metrics.AUTH_SESSIONS.labels("invalid").set(len(self.auth_sessions.sessions) - self.auth_sessions.valid_count)
+        if self.accounts:
+            for account in self.accounts.stats():
+                metrics.ACCOUNT_AVAILABLE.labels(account["name"]).set(1 if account["available"] else 0)
+                metrics.ACCOUNT_COOLDOWN_SECONDS.labels(account["name"]).set(account["cooldown_remaining"])
+                metrics.ACCOUNT_ERROR_RATE.labels(account["name"]).set(account["error_rate"])
+        return metrics.render_latest()
+
+    # -----------------------------------------------
+    # 预热页面池：创建 / 重置 / 关闭
+    # -----------------------------------------------
+    def _create_page_pool(self, instance: BrowserInstance) -> PagePool:
+        return PagePool(
+            name=instance.name,
+            size=max(settings.PAGE_POOL_SIZE, instance.capacity),
+            factory=lambda: self._open_warm_page(instance),
+            resetter=self._reset_warm_page,
+            closer=self._close_warm_page,
+            max_uses=settings.PAGE_MAX_USES,
+            acquire_timeout=settings.PAGE_ACQUIRE_TIMEOUT,
+        )
+
+    async def _open_warm_page(self, instance: BrowserInstance) -> WarmPage:
+        """新建 context + page，导航到 Gemini 首页并等待输入框就绪"""
+        context_options = self._context_options(instance.session)
+        started = time.monotonic()
+        with metrics.stage("context", instance.name):
+            context: BrowserContext = await instance.browser.new_context(**context_options)
+        try:
+            with metrics.stage("new_page", instance.name):
+                page = await context.new_page()
+            warm = WarmPage(context, page)
+            # 按路由策略屏蔽图片/字体/统计上报等无关请求 (ROUTE_POLICY=off 时不安装任何路由)
+            await self.route_policy.install(page, warm.route_stats)
+            # 真流式增量的回传通道，交给当前占用该页面的请求处理
+            await page.expose_binding(STREAM_BINDING_NAME, lambda source, delta: self._on_stream_push(warm, delta, False))
+            await page.expose_binding(NETWORK_BINDING_NAME, lambda source, chunk, done: self._on_stream_push(warm, chunk, done))
+            page.on("response", lambda response: self._on_page_response(warm, response))
+            if settings.EXTRACTION_MODE == "network":
+                await page.add_init_script(NETWORK_TAP_JS)
+            logger.info(f"  - 会话 {instance.name}: 预热页面，导航到 Gemini 首页...")
+            with metrics.stage("goto", instance.name):
+                await page.goto(self.app_url, timeout=30000)
+            with metrics.stage("editor_wait", instance.name):
+                await page.wait_for_selector(TEXT_INPUT_SELECTOR, timeout=10000)
+            logger.info(
+                f"  - 会话 {instance.name}: 页面就绪，耗时 {time.monotonic() - started:.2f}s "
+                f"(请求{format_route_stats(warm.route_stats)})"
+            )
+            if settings.DEBUG_CAPTURE_MODE != "off" and settings.DEBUG_CAPTURE_TRACE:
+                # 每个请求一个 trace 分块，成功时丢弃，失败时写入调试目录
+                await context.tracing.start(screenshots=True, snapshots=True)
+                await context.tracing.start_chunk()
+                warm.tracing = True
+        except BaseException:
+            # 包括页面池关闭时被取消的预热任务
+            await context.close()
+            raise
+        return warm
+
+    @staticmethod
+    def _on_stream_push(warm: WarmPage, chunk: str, done: bool):
+        if warm.stream_sink is not None:
+            warm.stream_sink(chunk, done)
+
+    @staticmethod
+    def _on_page_response(warm: WarmPage, response):
+        if response.status == 429 and STREAM_GENERATE_PATH in response.url:
+            warm.rate_limited = True
+
+    # -----------------------------------------------
+    # 账号健康度
+    # -----------------------------------------------
+    @staticmethod
+    def _account_of(instance: BrowserInstance) -> str:
+        """实例所属的账号：登录会话名；匿名实例各自视为一个账号"""
+        return instance.session.name if instance.session is not None else instance.name
+
+    def _record_account(self, instance: BrowserInstance, warm: WarmPage, ok: bool, answer: str = "") -> str:
+        """上报一次交互结果，返回判定的结果类别 (ok / error / throttled)"""
+        if warm.rate_limited or (ok and detect_rate_limit(answer)):
+            outcome = "throttled"
+        else:
+            outcome = "ok" if ok else "error"
+        if self.accounts:
+            account = self._account_of(instance)
+            metrics.ACCOUNT_OUTCOMES.labels(account, outcome).inc()
+            if self.accounts.record(instance, outcome):
+                metrics.ACCOUNT_TRIPS.labels(account).inc()
+        return outcome
+
+    async def _reset_warm_page(self, warm: WarmPage) -> bool:
+        """将页面重置为干净的 "新对话" 状态；返回 False 表示该页面应被淘汰"""
+        await self._save_sample(warm)
+        page = warm.page
+        new_chat = page.locator(NEW_CHAT_SELECTOR).first
+        if await new_chat.count() > 0:
+            await new_chat.click(timeout=3000)
+            await page.wait_for_selector(TEXT_INPUT_SELECTOR, timeout=10000)
+
+        # 点击新对话后仍残留旧回答时，退回到整页导航
+        if await page.locator(ANSWER_CONTENT_SELECTOR).count() > 0:
+            await page.goto(self.app_url, timeout=30000)
+            await page.wait_for_selector(TEXT_INPUT_SELECTOR, timeout=10000)
+            if await page.locator(ANSWER_CONTENT_SELECTOR).count() > 0:
+                return False
+
+        await page.fill(TEXT_INPUT_SELECTOR, "", timeout=5000)
+        if warm.tracing:
+            await warm.context.tracing.stop_chunk()
+            await warm.context.tracing.start_chunk()
+        return True
+
+    async def _close_warm_page(self, warm: WarmPage):
+        """关闭页面所属的 context (抽样请求的 trace 先写入调试目录)"""
+        await self._save_sample(warm)
+        await warm.context.close()
+
+    # -----------------------------------------------
+    # 抽样采集：按请求抽样，被抽中的请求保存一份独立的 trace (含截图和 DOM 快照)
+    # -----------------------------------------------
+    async def _start_sample(self, warm: WarmPage):
+        """在取出的页面上决定本次请求是否抽样；会话页面上一轮的抽样在这里先行保存"""
+        await self._save_sample(warm)
+        if settings.DEBUG_CAPTURE_MODE != "sampled" or random.random() >= settings.DEBUG_CAPTURE_SAMPLE_RATE:
+            return
+        try:
+            if not warm.tracing:
+                # 失败 trace 分块已在录制时直接复用当前分块 (重置页面时开始新分块)
+                await warm.context.tracing.start(screenshots=True, snapshots=True)
+                warm.sample_trace = True
+            warm.sampled = True
+        except Exception as e:
+            logger.warning(f"抽样 trace 启动失败: {e}")
+
+    async def _save_sample(self, warm: WarmPage):
+        if not warm.sampled:
+            return
+        warm.sampled = False
+        try:
+            with self.artifacts.writing(f"sample-{int(time.time() * 1000)}", ".trace.zip") as path:
+                if warm.sample_trace:
+                    warm.sample_trace = False
+                    await warm.context.tracing.stop(path=path.as_posix())
+                elif warm.tracing:
+                    await warm.context.tracing.stop_chunk(path=path.as_posix())
+                    await warm.context.tracing.start_chunk()
+                else:
+                    return  # 分块已作为失败现场保存
+            logger.info(f"🎥 抽样请求 trace 已保存: {path.name}")
+            await self.artifacts.enforce_async()
+        except Exception as e:
+            logger.warning(f"抽样 trace 保存失败: {e}")
+
+    # -----------------------------------------------
+    # 失败现场：截图 + DOM 快照 + trace，写入有上限的调试目录
+    # -----------------------------------------------
+    def _run_in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _retire_failed_page(self, instance: BrowserInstance, warm: WarmPage, reason: Optional[str] = None, detached: bool = False):
+        """
+        淘汰交互失败的页面；有失败原因且开启采集时，先在后台保存现场再关闭。
+        detached 表示页面已移出页面池 (会话页面)，直接关闭而不归还。
+        """
+        async def capture_then_release():
+            if reason and settings.DEBUG_CAPTURE_MODE != "off":
+                await self._capture_failure(instance, warm, reason)
+            if detached:
+                await self._close_warm_page(warm)
+            else:
+                instance.pages.release(warm, reusable=False)
+
+        self._run_in_background(capture_then_release())
+
+    def _abort_interaction(self, instance: BrowserInstance, warm: WarmPage, detached: bool = False):
+        """
+        中止被取消的交互：点击停止按钮终止生成，页面照常在后台重置为新对话后重新入池，省去重新预热；
+        停止失败的页面淘汰。会话页面的对话线程已不完整，直接关闭。
+        """
+        async def stop_then_release():
+            stopped = False
+            try:
+                stop_button = warm.page.locator(STOP_BUTTON_SELECTOR).first
+                if await stop_button.count() > 0:
+                    await stop_button.click(timeout=2000)
+                stopped = True
+            except Exception as e:
+                logger.debug(f"{instance.name} 停止生成失败，淘汰页面: {e}")
+            if detached:
+                await self._close_warm_page(warm)
+            else:
+                instance.pages.release(warm, reusable=stopped)
+
+        self._run_in_background(stop_then_release())
+
+    def _record_abandoned(self, stage: str, lease: Optional[Lease] = None):
+        """
+        记录被取消的请求 (客户端断开等)。省下的槽位时间按平均服务时长估计：
+        排队中被取消省下整个服务时长，进行中被取消省下剩余部分
+        """
+        held = time.monotonic() - lease.acquired_at if lease is not None else 0.0
+        saved = max(0.0, self.dispatcher.avg_service - held)
+        self.abandoned[stage] += 1
+        self.abandoned["saved_slot_seconds"] += saved
+        metrics.ABANDONED_REQUESTS.labels(stage).inc()
+        metrics.ABANDONED_SAVED_SECONDS.inc(saved)
+        logger.info(f"🔌 请求已取消 (阶段: {stage})，释放浏览器槽位，估计节省 {saved:.1f}s。")
+
+    # -----------------------------------------------
+    # 会话保持：保留仍持有对话线程的页面
+    # -----------------------------------------------
+    def _close_conversation(self, conversation: Conversation):
+        self._run_in_background(self._close_warm_page(conversation.warm))
+
+    def _return_page(self, instance: BrowserInstance, warm: WarmPage, turn: Optional[ConversationTurn], answer: str):
+        """交互成功后归还页面：会话保持模式下保留为会话页面，否则在后台重置为新对话后重新入池"""
+        if turn is None:
+            instance.pages.release(warm, reusable=True)
+            return
+        conversation = turn.conversation
+        if conversation is None:
+            instance.pages.detach(warm)
+            conversation = Conversation(instance, warm)
+        conversation.turns += 1
+        self.conversations.checkin(turn.next_key(answer), conversation)
+
+    async def _capture_failure(self, instance: BrowserInstance, warm: WarmPage, reason: str):
+        page = warm.page
+        stem = f"failure-{instance.name}-{int(time.time() * 1000)}"
+        saved = []
+        if not page.is_closed():
+            try:
+                with self.artifacts.writing(stem, ".png") as path:
+                    await page.screenshot(path=path.as_posix(), timeout=5000)
+                saved.append(path.name)
+            except Exception as e:
+                logger.warning(f"失败截图保存失败: {e}")
+            try:
+                with self.artifacts.writing(stem, ".html") as path:
+                    html = f"<!-- {reason} -->\n" + await page.content()
+                    await asyncio.to_thread(path.write_text, html, encoding="utf-8")
+                saved.append(path.name)
+            except Exception as e:
+                logger.warning(f"DOM 快照保存失败: {e}")
+        if warm.tracing:
+            try:
+                with self.artifacts.writing(stem, ".trace.zip") as path:
+                    await warm.context.tracing.stop_chunk(path=path.as_posix())
+                warm.tracing = False
+                saved.append(path.name)
+            except Exception as e:
+                logger.warning(f"trace 保存失败: {e}")
+        await self.artifacts.enforce_async()
+        if saved:
+            logger.info(f"🧾 会话 {instance.name} 失败现场已保存: {', '.join(saved)}")
     
     # 辅助函数：提取用户的最新请求
     def _get_latest_user_message(self, request_data: Dict[str, Any]) -> str:
@@ -85,92 +885,169 @@ class GeminiProvider(BaseProvider):
         return "Hello" # 默认值
 
 
-    async def _get_and_extract_answer(self, instance: BrowserInstance, latest_user_message: str) -> Tuple[str, 'page', 'context']:
+    async def _send_prompt(self, instance: BrowserInstance, warm: WarmPage, latest_user_message: str):
         """
-        核心方法：模拟交互，让浏览器生成答案，并从 DOM 中提取最终的完整回答。
-        这个函数包含了参数提取、等待答案完成和最终答案提取的所有逻辑。
-        
-        :return: (extracted_answer_text, page, context)
+        在预热页面上输入用户消息并点击发送 (页面已预热，无需导航)。
+        这里的失败说明提示词尚未提交，抛出可换实例重试的 PromptNotSent
         """
-        session_name = instance.name
-        video_output_dir = DEBUG_DIR.as_posix()
-        
-        context: BrowserContext = await instance.browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36",
-            viewport={"width": 1920, "height": 1080},
-            locale="zh-CN",
-            record_video_dir=video_output_dir,
-            record_video_size={"width": 1280, "height": 720}
-        )
-        
-        page = await context.new_page()
-        
-        # ---------------------
-        # 步骤 0: 设置网络拦截器 (让请求通过，不再提取参数)
-        # ---------------------
-        
-        # 此时我们不关心参数，只关心请求能正常发出和完成
-        await page.route("**/*", lambda route: route.continue_())
-
-        # ---------------------
-        # 步骤 1/4: 导航和模拟交互
-        # ---------------------
-        
+        page = warm.page
         try:
-            TIMEOUT_USER_ACTION = 10000 
-            
-            logger.info(f"  - 会话 {session_name}: [步骤1] 导航到 Gemini 首页...")
-            await page.goto("https://gemini.google.com/app", timeout=30000)
-                
-            TEXT_INPUT_SELECTOR = 'rich-textarea div.ql-editor'
-            SEND_BUTTON_SELECTOR = 'button[aria-label*="Send"], button.send-button' 
-            ACTIVE_SEND_BUTTON_SELECTOR = 'button[aria-label*="Send"]:not([aria-disabled="true"]), button.send-button:not([aria-disabled="true"])'
-            
-            # 确保输入框可见
-            await page.wait_for_selector(TEXT_INPUT_SELECTOR, timeout=TIMEOUT_USER_ACTION)
-            
+            logger.info(f"  - 会话 {instance.name}: [步骤1] 使用预热页面 (第 {warm.uses} 次使用)...")
+        
             # 1. **关键步骤：输入逗号 (,) 激活按钮**
             logger.info("    -> 填充逗号 (,) 激活发送按钮...")
-            await page.type(TEXT_INPUT_SELECTOR, ",", delay=50) 
-            
+            with metrics.stage("type", instance.name):
+                await page.type(TEXT_INPUT_SELECTOR, ",", delay=50) 
+        
             # 2. **填充用户的完整请求**
             full_input = f"{latest_user_message}"
             logger.info(f"    -> 填充用户消息: {full_input[:50]}...")
-            await page.fill(TEXT_INPUT_SELECTOR, full_input, timeout=5000)
-            
+            with metrics.stage("fill", instance.name):
+                await page.fill(TEXT_INPUT_SELECTOR, full_input, timeout=5000)
+        
             # 3. **点击发送**
             logger.info("    -> 点击发送按钮，等待回答生成...")
-            
-            # 触发请求，并等待浏览器完成答案生成
-            # 这里我们只等待一个网络响应完成，表示开始生成答案。
-            await page.click(ACTIVE_SEND_BUTTON_SELECTOR, timeout=3000)
-            
-            
+            with metrics.stage("click", instance.name):
+                await page.click(ACTIVE_SEND_BUTTON_SELECTOR, timeout=3000)
+        except Exception as e:
+            raise PromptNotSent(f"提示词未能发送: {e}") from e
+        if warm.on_sent:
+            warm.on_sent()
+
+    @staticmethod
+    def _answer_timeout() -> float:
+        """等待回答生成的上限 (秒)，随 API 请求超时伸缩，并为提取和响应留出余量"""
+        return max(10.0, settings.API_REQUEST_TIMEOUT - 10)
+
+    @staticmethod
+    def _watch_generation(page) -> asyncio.Future:
+        """在发送前调用：StreamGenerate 请求完整结束时 future 完成 (请求失败时以异常结束)"""
+        future = asyncio.get_running_loop().create_future()
+
+        def on_finished(request):
+            if STREAM_GENERATE_PATH in request.url and not future.done():
+                future.set_result(None)
+
+        def on_failed(request):
+            if STREAM_GENERATE_PATH in request.url and not future.done():
+                future.set_exception(RuntimeError(f"StreamGenerate 请求失败: {request.failure}"))
+
+        def detach(_):
+            page.remove_listener("requestfinished", on_finished)
+            page.remove_listener("requestfailed", on_failed)
+            if not future.cancelled():
+                future.exception()  # 读取异常，避免 "exception was never retrieved" 警告
+
+        page.on("requestfinished", on_finished)
+        page.on("requestfailed", on_failed)
+        future.add_done_callback(detach)
+        return future
+
+    async def _wait_answer_finished(self, instance: BrowserInstance, page, start_count: int, generation: Optional[asyncio.Future] = None):
+        """
+        组合多个信号检测回答完成，任一可靠信号触发即返回：
+        发送按钮恢复禁用、停止按钮消失、回答文本静默 ANSWER_QUIET_PERIOD 秒、StreamGenerate 请求结束。
+        某个信号本身出错 (如停止按钮从未出现) 只会被忽略；全部超时只记录警告，由调用方提取当前可见答案。
+        """
+        timeout = self._answer_timeout()
+        timeout_ms = timeout * 1000
+        args = {"selector": ANSWER_CONTENT_SELECTOR, "startCount": start_count}
+
+        async def button_idle():
+            await page.wait_for_function(BUTTON_IDLE_JS, arg={**args, "finishedSelector": ANSWER_FINISHED_SELECTOR}, polling=250, timeout=timeout_ms)
+            return "button"
+
+        async def stop_button_gone():
+            await page.wait_for_selector(STOP_BUTTON_SELECTOR, state="attached", timeout=5000)
+            await page.wait_for_selector(STOP_BUTTON_SELECTOR, state="detached", timeout=timeout_ms)
+            return "stop_button"
+
+        async def content_quiet():
+            quiet_ms = settings.ANSWER_QUIET_PERIOD * 1000
+            await page.wait_for_function(CONTENT_QUIET_JS, arg={**args, "quietMs": quiet_ms}, polling=250, timeout=timeout_ms)
+            return "quiet"
+
+        async def network_done():
+            await generation
+            # 响应已结束，等待 DOM 渲染跟上 (静默时间很短，超时也无妨)
+            try:
+                await page.wait_for_function(CONTENT_QUIET_JS, arg={**args, "quietMs": RENDER_SETTLE_MS}, polling=100, timeout=3000)
+            except PlaywrightError:
+                pass
+            return "network"
+
+        signals = [button_idle(), stop_button_gone(), content_quiet()]
+        if generation is not None:
+            signals.append(network_done())
+        pending = {asyncio.create_task(signal) for signal in signals}
+        deadline = time.monotonic() + timeout
+        fired = None
+        started = time.perf_counter()
+        try:
+            while pending and fired is None:
+                done, pending = await asyncio.wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        fired = task.result()
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            if generation is not None:
+                generation.cancel()  # 页面会被复用，移除尚未触发的网络监听
+
+        if fired is None:
+            metrics.stage_failed("answer_wait", instance.name)
+            logger.warning(f"    -> 答案等待超时 ({timeout:.0f}s 内没有任何完成信号)，尝试提取当前可见答案。")
+            return
+        metrics.observe_stage("answer_wait", instance.name, time.perf_counter() - started)
+        metrics.COMPLETION_SIGNALS.labels(fired).inc()
+        logger.success(f"    -> 答案生成完毕 (信号: {fired})。")
+
+    async def _get_and_extract_answer(self, instance: BrowserInstance, warm: WarmPage, latest_user_message: str) -> str:
+        """
+        核心方法：在预热页面上模拟交互，让浏览器生成答案，并从 DOM 中提取最终的完整回答。
+        页面已在页面池中完成导航和输入框等待，这里直接从输入开始。
+        
+        :return: extracted_answer_text
+        """
+        session_name = instance.name
+        page = warm.page
+
+        try:
             # ---------------------
-            # 步骤 5: 等待答案完成并提取文本
+            # 步骤 1: 模拟交互
             # ---------------------
+            start_count = await page.locator(ANSWER_CONTENT_SELECTOR).count()
+            generation = None
+            if settings.EXTRACTION_MODE == "network":
+                # 网络层提取：直接解析 StreamGenerate 响应体，无需等待 DOM 渲染
+                network_answer = await self._send_and_extract_from_network(instance, warm, latest_user_message)
+                if network_answer:
+                    logger.success(f"🔑 会话 {session_name} 答案提取成功 (网络层)。")
+                    return network_answer
+                logger.warning("    -> 网络层未解析到回答文本，回退到 DOM 提取。")
+            else:
+                generation = self._watch_generation(page)
+                await self._send_prompt(instance, warm, latest_user_message)
             
-            # 等待发送按钮重新禁用 (表示回答结束)
-            ANSWER_FINISHED_SELECTOR = SEND_BUTTON_SELECTOR + '[aria-disabled="true"]'
-            
-            try:
-                # 等待按钮变禁用
-                await page.wait_for_selector(ANSWER_FINISHED_SELECTOR, timeout=40000) # 延长超时以适应长回答
-                logger.success("    -> 答案生成完毕 (发送按钮重新禁用)。")
-
-            except PlaywrightError as e:
-                logger.warning(f"    -> 答案等待超时，尝试提取当前可见答案。错误: {e}")
+            # ---------------------
+            # 步骤 2: 等待答案完成并提取文本
+            # ---------------------
+            await self._wait_answer_finished(instance, page, start_count, generation)
             
             # 提取最终答案文本
-            ANSWER_CONTENT_SELECTOR = 'message-content' 
-            
             extracted_answer = "Error: Failed to extract response text."
             try:
                 answer_locator = page.locator(ANSWER_CONTENT_SELECTOR)
                 last_answer_block = answer_locator.last
                 
                 # 使用 inner_text() 获取渲染后的文本（包括 Markdown 标记）
-                extracted_answer = await last_answer_block.inner_text() 
+                with metrics.stage("extract", instance.name):
+                    extracted_answer = await last_answer_block.inner_text() 
                 
             except Exception as e:
                 logger.error(f"提取答案文本失败: {e}")
@@ -186,39 +1063,222 @@ class GeminiProvider(BaseProvider):
                  raise RuntimeError(f"Playwright 提取失败。提取结果: {extracted_answer}")
 
             logger.success(f"🔑 会话 {session_name} 答案提取成功。")
-            
-            # 返回提取到的文本和资源，以便在 chat_completion 中处理清理
-            return extracted_answer, page, context
+            return extracted_answer
             
         except Exception as e:
             logger.error(f"❌ Playwright 模拟交互/提取过程中发生严重错误: {e}")
-            
+            raise e
+
+    async def _send_and_extract_from_network(self, instance: BrowserInstance, warm: WarmPage, latest_user_message: str) -> Optional[str]:
+        """发送消息并等待 StreamGenerate 响应结束，从解析出的帧中取得原始 Markdown 回答"""
+        page = warm.page
+        timeout = self._answer_timeout()
+        async with page.expect_response(lambda r: STREAM_GENERATE_PATH in r.url, timeout=timeout * 1000) as response_info:
+            await self._send_prompt(instance, warm, latest_user_message)
+        with metrics.stage("answer_wait", instance.name):
+            response = await response_info.value
+            body = await asyncio.wait_for(response.text(), timeout=timeout)
+
+        with metrics.stage("extract", instance.name):
+            parsed = parse_stream_generate_body(body)
+        if parsed.last_frame and parsed.last_frame.error_code is not None:
+            raise RuntimeError(f"StreamGenerate 返回错误码: {parsed.last_frame.error_code}")
+        logger.info(f"    -> StreamGenerate 响应已解析 (状态 {response.status}，{len(body)} 字符)。")
+        return parsed.text or None
+
+    # -----------------------------------------------
+    # 真流式：MutationObserver 监听回答 DOM，通过 binding 推送增量
+    # -----------------------------------------------
+    async def _stream_answer_from_dom(self, instance: BrowserInstance, warm: WarmPage, latest_user_message: str, events: asyncio.Queue):
+        """
+        发送消息后在页面内安装观察器，回答渲染过程中的每段新增文本都会经由
+        STREAM_BINDING_NAME 推入 events 队列。
+
+        队列事件: ("delta", text) / ("done", None) / ("error", exception)
+        """
+        page = warm.page
+        warm.stream_sink = lambda chunk, done: chunk and events.put_nowait(("delta", chunk))
+        try:
+            start_count = await page.locator(ANSWER_CONTENT_SELECTOR).count()
+            generation = self._watch_generation(page)
+            await self._send_prompt(instance, warm, latest_user_message)
+            await page.evaluate(STREAM_OBSERVER_JS, {"selector": ANSWER_CONTENT_SELECTOR, "startCount": start_count, "binding": STREAM_BINDING_NAME})
+            await self._wait_answer_finished(instance, page, start_count, generation)
+
+            # 停止观察并等待最后一段文本推送完成
+            emitted = await page.evaluate("() => window.__geminiStreamStop()")
+            if not emitted:
+                raise RuntimeError("流式观察器未捕获到任何回答文本。")
+            logger.success(f"🔑 会话 {instance.name} 流式回答完成 (长度: {emitted})。")
+            events.put_nowait(("done", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ 会话 {instance.name} 流式交互失败: {e}")
+            events.put_nowait(("error", e))
+        finally:
+            if not page.is_closed():
+                try:
+                    await page.evaluate("() => window.__geminiStreamStop && window.__geminiStreamStop()")
+                except Exception:
+                    pass
+
+    async def _stream_answer_from_network(self, instance: BrowserInstance, warm: WarmPage, latest_user_message: str, events: asyncio.Queue):
+        """
+        网络层真流式：页面注入的 XHR 监听把 StreamGenerate 响应体原样推回，
+        在 Python 侧增量解析帧并把回答的新增部分推入 events 队列。
+        """
+        parser = StreamGenerateParser()
+        finished = asyncio.Event()
+
+        def sink(chunk: str, done: bool):
+            for delta in parser.feed_deltas(chunk):
+                events.put_nowait(("delta", delta))
+            if done:
+                finished.set()
+
+        warm.stream_sink = sink
+        try:
+            await self._send_prompt(instance, warm, latest_user_message)
+            with metrics.stage("answer_wait", instance.name):
+                await asyncio.wait_for(finished.wait(), timeout=self._answer_timeout())
+            if parser.last_frame and parser.last_frame.error_code is not None:
+                raise RuntimeError(f"StreamGenerate 返回错误码: {parser.last_frame.error_code}")
+            if not parser.text:
+                raise RuntimeError("StreamGenerate 响应中没有回答文本。")
+            logger.success(f"🔑 会话 {instance.name} 流式回答完成 (网络层，长度: {len(parser.text)})。")
+            events.put_nowait(("done", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ 会话 {instance.name} 网络层流式交互失败: {e}")
+            events.put_nowait(("error", e))
+
+    async def _start_live_stream(self, lease: Lease, warm: WarmPage, latest_user_message: str, response_headers: Dict[str, str],
+                                 flight: Flight, started: float, cache_key: Optional[str] = None,
+                                 turn: Optional[ConversationTurn] = None) -> StreamingResponse:
+        """
+        启动真流式交互，等到第一段增量 (或失败) 后再返回响应，这样首包前的失败仍能以 502 返回。
+        之后由后台任务把增量发布到 flight，本请求与合并进来的相同请求各自独立订阅。
+        """
+        instance = lease.instance
+        events: asyncio.Queue = asyncio.Queue()
+        streamer = self._stream_answer_from_network if settings.EXTRACTION_MODE == "network" else self._stream_answer_from_dom
+        task = asyncio.create_task(streamer(instance, warm, latest_user_message, events))
+
+        try:
+            first_event = await events.get()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                self._record_abandoned("interaction", lease)
+            await self._finish_live_stream(lease, warm, task, ok=False, turn=turn)
+            raise
+        if first_event[0] != "delta":
+            error = first_event[1] or RuntimeError("回答为空。")
+            await self._finish_live_stream(lease, warm, task, ok=False, failure=str(error), turn=turn)
+            raise HTTPException(status_code=502, detail=f"无法从浏览器获取流式答案。错误: {error}")
+
+        metrics.observe_ttft(instance.name, started)
+        flight.publish(first_event[1])
+        subscription = flight.attach()
+        flight.producer = asyncio.create_task(self._pump_live_stream(lease, warm, task, events, flight, cache_key, turn))
+
+        logger.info("🟢 客户端请求流式响应，返回真流式 StreamingResponse。")
+        return ReleasingStreamingResponse(
+            self._flight_stream_generator(subscription, f"chatcmpl-{int(time.time())}", settings.DEFAULT_MODEL, started=started),
+            on_release=subscription.close,
+            media_type="text/event-stream",
+            headers=response_headers
+        )
+
+    async def _pump_live_stream(self, lease: Lease, warm: WarmPage, task: asyncio.Task, events: asyncio.Queue,
+                                flight: Flight, cache_key: Optional[str] = None, turn: Optional[ConversationTurn] = None):
+        """把交互任务产生的增量发布到 flight，结束后归还页面和槽位"""
+        ok = False
+        failure = None
+        try:
+            while True:
+                kind, payload = await events.get()
+                if kind == "delta":
+                    flight.publish(payload)
+                    continue
+                if kind == "done":
+                    ok = True
+                    if cache_key and not warm.rate_limited and not detect_rate_limit(flight.text):
+                        await self.cache.put(cache_key, flight.text)
+                    flight.finish()
+                else:
+                    failure = str(payload)
+                    logger.error(f"会话 {lease.instance.name} 流式输出中断: {payload}")
+                    flight.finish(RuntimeError(failure))
+                break
+        except asyncio.CancelledError:
+            # 所有订阅者 (客户端) 都已断开
+            self._record_abandoned("stream", lease)
+            flight.finish(FlightAbandoned())
+            raise
+        finally:
+            await self._finish_live_stream(lease, warm, task, ok, failure, turn, flight.text)
+
+    async def _flight_stream_generator(self, subscription: Subscription, request_id: str, model_name: str,
+                                       first_delta: Optional[str] = None, started: Optional[float] = None,
+                                       mode: str = "live") -> AsyncGenerator[bytes, None]:
+        """把 flight 的一个订阅编码为 SSE；每个客户端拥有独立的生成器"""
+        ok = False
+        encoder = ChunkEncoder(request_id, model_name)
+        deltas = subscription
+        if settings.SSE_CHUNK_STRATEGY == "time":
+            deltas = coalesce_deltas(subscription, settings.SSE_CHUNK_WINDOW_MS / 1000, settings.SSE_CHUNK_BYTES)
+        try:
+            if first_delta:
+                yield encoder.encode(first_delta)
+            async for delta in deltas:
+                yield encoder.encode(delta)
+            ok = True
+        except Exception as e:
+            logger.error(f"流式输出中断: {e}")
+        finally:
+            subscription.close()
+            if started is not None:
+                metrics.observe_request(mode, "ok" if ok else "error", started)
+        if ok:
+            yield encoder.stop()
+        yield DONE_CHUNK
+
+    async def _finish_live_stream(self, lease: Lease, warm: WarmPage, task: asyncio.Task, ok: bool, failure: Optional[str] = None,
+                                  turn: Optional[ConversationTurn] = None, answer: str = ""):
+        """结束流式交互：取消未完成的交互任务，归还页面和调度槽位"""
+        if not task.done():
+            task.cancel()
             try:
-                await context.close()
-            except:
+                await task
+            except BaseException:
                 pass
-            raise e
+        warm.stream_sink = None
+        if (ok or failure is not None) and self._record_account(lease.instance, warm, ok, answer) == "throttled":
+            # 流式模式下限流提示已发给客户端，只用于调度 (客户端断开等取消不反映账号状况，不上报)
+            ok, failure = False, "账号被限流"
+        detached = bool(turn and turn.conversation)
+        if ok:
+            self._return_page(lease.instance, warm, turn, answer)
+        elif failure is None:
+            self._abort_interaction(lease.instance, warm, detached)  # 被取消 (客户端断开)
+        else:
+            self._retire_failed_page(lease.instance, warm, failure, detached=detached)
+        self.dispatcher.release(lease)
 
     # -----------------------------------------------
     # 伪流式生成器 (用于模拟流式体验)
     # -----------------------------------------------
     async def _pseudo_stream_generator(self, extracted_text: str, request_id: str, model_name: str) -> AsyncGenerator[bytes, None]:
-        
-        # 将答案文本分成小块，模拟流式效果
-        # 使用正则表达式按空格或标点符号分割，保留 Markdown 格式
-        chunks = re.findall(r'(\*\*.*?\*\*|\n\n|\s|[^ \n]+)', extracted_text, re.DOTALL)
-        
-        if not chunks:
-            chunks = [extracted_text] # 如果无法分割，发送整个文本
-
-        for chunk in chunks:
-            if chunk:
-                # 兼容Markdown，但不转义
-                yield create_sse_data(create_chat_completion_chunk(request_id, model_name, chunk))
-                # 引入微小延迟来模拟流式传输感
-                await asyncio.sleep(0.01) 
-        
-        # 发送结束标记
+        """把完整答案按 SSE_CHUNK_STRATEGY 切块回放；只有配置了 SSE_PACING_MS 才在块之间延迟"""
+        encoder = ChunkEncoder(request_id, model_name)
+        pacing = settings.SSE_PACING_MS / 1000
+        for chunk in split_text(extracted_text, settings.SSE_CHUNK_STRATEGY, settings.SSE_CHUNK_BYTES):
+            yield encoder.encode(chunk)
+            if pacing:
+                await asyncio.sleep(pacing)
+        yield encoder.stop()
         yield DONE_CHUNK
 
 
@@ -229,74 +1289,169 @@ class GeminiProvider(BaseProvider):
         
         logger.info(f"📝 最终返回内容 (长度: {len(cleaned_text)}): {cleaned_text[:200]}...")
 
-        return {
-            "id": f"chatcmpl-{int(time.time())}",
-            "object": "chat.completion",
-            "created": int(time.time()),
-            "model": settings.DEFAULT_MODEL,
-            "choices": [
-                {
-                    "index": 0,
-                    "message": {
-                        "role": "assistant",
-                        "content": cleaned_text
-                    },
-                    "finish_reason": "stop"
-                }
-            ],
-            "usage": {
-                "prompt_tokens": 0,
-                "completion_tokens": 0,
-                "total_tokens": 0
-            }
-        }
+        return create_chat_completion_response(f"chatcmpl-{int(time.time())}", settings.DEFAULT_MODEL, cleaned_text)
 
 
     async def chat_completion(self, request_data: Dict[str, Any]) -> [JSONResponse, StreamingResponse]:
         """
-        处理聊天请求，返回伪流式 StreamingResponse 或非流式 JSONResponse。
+        处理聊天请求，返回 StreamingResponse (真流式或伪流式) 或非流式 JSONResponse。
         """
         if not self.browser_pool:
             raise HTTPException(status_code=503, detail="服务不可用：浏览器实例池为空。")
         
+        started = time.monotonic()
         is_streaming_request = request_data.get("stream") is True
+        # 批处理请求只使用交互流量之外的空闲容量
+        background = request_data.get("priority") == "batch"
         latest_user_message = self._get_latest_user_message(request_data)
-        instance = random.choice(self.browser_pool)
-        
-        page = None
-        context = None
-        
-        # 锁住实例，执行交互和提取
-        async with instance.lock:
-            try:
-                # 运行 Playwright 交互并提取完整答案
-                extracted_text, page, context = await self._get_and_extract_answer(instance, latest_user_message)
-            except Exception as e:
-                error_msg = f"无法从浏览器获取完整答案。错误: {e}"
-                logger.error(f"会话 {instance.name} 失败: {e}")
-                raise HTTPException(status_code=502, detail=error_msg)
-        
-        # --- Playwright 提取成功，处理清理和录屏 ---
-        
-        video_output_dir = DEBUG_DIR.as_posix()
+        if is_streaming_request:
+            mode = "live" if settings.STREAMING_MODE == "live" else "pseudo"
+        else:
+            mode = "json"
+
+        # 精确匹配缓存：命中时不占用任何浏览器槽位 (请求体 "cache": false 可绕过；采样请求需 "cache": true 才使用)
+        cache_key = None
+        cache_status = "BYPASS"
+        if self.cache and is_cacheable(request_data):
+            cache_key = make_cache_key(request_data, settings.DEFAULT_MODEL)
+            cached_text = await self.cache.get(cache_key)
+            if cached_text is not None:
+                logger.info(f"⚡ 命中回答缓存 (长度: {len(cached_text)})。")
+                metrics.observe_request("cache", "ok", started)
+                return self._cached_response(cached_text, is_streaming_request)
+            cache_status = "MISS"
+
+        # 合并同时进行的相同请求：只有领头请求占用浏览器，其余请求共享其结果。
+        # 绕过缓存的请求 ("cache": false、Cache-Control: no-cache、采样请求) 要的是一次新的回答，不参与合并
+        if settings.COALESCE_ENABLED and is_cacheable(request_data):
+            flight, is_leader = self.flights.join(cache_key or make_cache_key(request_data, settings.DEFAULT_MODEL), lead=not background)
+            if not is_leader:
+                return await self._follow_flight(flight, request_data, is_streaming_request, started)
+        else:
+            flight = SingleFlight.private()
+
+        turn = None
+        if self.conversations:
+            turn = ConversationTurn(request_data.get("messages", []), request_data.get("conversation_id"))
+        try:
+            response = await self._lead_flight(flight, latest_user_message, is_streaming_request, cache_key, cache_status, started, turn, background)
+        except asyncio.CancelledError:
+            flight.finish(FlightAbandoned())
+            raise
+        except Exception as e:
+            flight.finish(e)
+            metrics.observe_request(mode, "error", started)
+            raise
+        # 真流式请求在最后一个增量发出时才记录端到端耗时
+        if mode != "live":
+            metrics.observe_request(mode, "ok", started)
+        return response
+
+    async def _follow_flight(self, flight: Flight, request_data: Dict[str, Any], is_streaming_request: bool,
+                             started: float) -> [JSONResponse, StreamingResponse]:
+        """作为跟随者等待领头请求的结果；领头请求被放弃时自行重新执行"""
+        logger.info("🔗 相同请求正在处理中，合并到进行中的浏览器交互。")
+        headers = {"X-Queue-Wait-Ms": "0", "X-Coalesced": "1"}
+        subscription = flight.attach()
+        try:
+            first_delta = await subscription.__anext__()
+        except StopAsyncIteration:
+            subscription.close()
+            metrics.observe_request("coalesced", "error", started)
+            raise HTTPException(status_code=502, detail="合并的请求未得到回答文本。")
+        except FlightAbandoned:
+            subscription.close()
+            return await self.chat_completion(request_data)
+        except HTTPException:
+            subscription.close()
+            metrics.observe_request("coalesced", "error", started)
+            raise
+        except BaseException as e:
+            subscription.close()
+            if isinstance(e, Exception):
+                metrics.observe_request("coalesced", "error", started)
+                raise HTTPException(status_code=502, detail=f"无法从浏览器获取完整答案。错误: {e}")
+            raise
+
+        request_id = f"chatcmpl-{int(time.time())}"
+        if is_streaming_request:
+            return ReleasingStreamingResponse(
+                self._flight_stream_generator(subscription, request_id, settings.DEFAULT_MODEL, first_delta, started, "coalesced"),
+                on_release=subscription.close,
+                media_type="text/event-stream",
+                headers=headers
+            )
+
+        try:
+            async for _ in subscription:
+                pass
+        except Exception as e:
+            metrics.observe_request("coalesced", "error", started)
+            raise HTTPException(status_code=502, detail=f"无法从浏览器获取完整答案。错误: {e}")
+        finally:
+            subscription.close()
+        metrics.observe_request("coalesced", "ok", started)
+        return JSONResponse(content=self._create_openai_json_response(flight.text), headers=headers)
+
+    async def _lead_flight(self, flight: Flight, latest_user_message: str, is_streaming_request: bool,
+                           cache_key: Optional[str], cache_status: str, started: float,
+                           turn: Optional[ConversationTurn] = None, background: bool = False) -> [JSONResponse, StreamingResponse]:
+        """领头请求：排队获取浏览器槽位并执行交互，结果同时发布到 flight"""
+        # 会话保持：取出仍持有该对话线程的页面，本请求只能在它所在的实例上执行
+        conversation = None
+        if turn is not None:
+            conversation = self.conversations.checkout(turn.lookup_key)
+            if conversation is not None and conversation.instance not in self.browser_pool:
+                self._close_conversation(conversation)
+                conversation = None
+            turn.conversation = conversation
+
+        # 进入全局 FIFO 队列，等待分配空闲实例
+        try:
+            if background and conversation is None:
+                lease = await self.dispatcher.acquire(background=True)
+            else:
+                lease = await self.dispatcher.acquire(conversation.instance if conversation else None)
+        except BaseException as e:
+            if conversation is not None:
+                self.conversations.checkin(turn.lookup_key, conversation)
+            if isinstance(e, asyncio.CancelledError):
+                self._record_abandoned("queued")
+            if not isinstance(e, QueueFullError):
+                raise
+            logger.warning(f"⏳ 拒绝请求: {e.reason} (Retry-After: {e.retry_after}s)")
+            raise HTTPException(
+                status_code=429,
+                detail=f"服务繁忙：{e.reason}，请稍后重试。",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+
+        instance = lease.instance
+        instance.requests += 1
+        if conversation is not None and instance is not conversation.instance:
+            # 排队期间会话页面所在的实例已下线
+            self._close_conversation(conversation)
+            conversation = turn.conversation = None
+        metrics.QUEUE_WAIT_SECONDS.observe(lease.queue_wait)
+        logger.info(f"📥 请求分配到 {instance.name} (排队 {lease.queue_wait_ms}ms)")
+        response_headers = {"X-Queue-Wait-Ms": str(lease.queue_wait_ms), "X-Cache": cache_status}
 
-        async def cleanup_and_save_video(p, c):
-            """在后台任务中保存录屏并关闭 Playwright 资源"""
+        if is_streaming_request and settings.STREAMING_MODE == "live":
+            # 真流式：页面和槽位在流结束时才归还 (增量已发给客户端，不参与重试和对冲)
             try:
-                video = p.video
-                video_filename = Path(await video.path()).name 
-                final_video_path = Path(video_output_dir) / video_filename
-                
-                Path(final_video_path).parent.mkdir(parents=True, exist_ok=True)
-                await video.save_as(final_video_path)
-                logger.info(f"🎥 录屏已保存到: {final_video_path.as_posix()}")
-            except Exception as e:
-                logger.warning(f"无法保存录屏: {e}")
-            finally:
-                if c: await c.close()
-        
-        # 创建异步任务来处理录屏和清理，确保主线程不阻塞
-        asyncio.create_task(cleanup_and_save_video(page, context))
+                warm = await self._checkout_page(lease, conversation, turn)
+            except PageUnavailable as e:
+                raise HTTPException(status_code=502, detail=str(e))
+            warm.rate_limited = False
+            prompt = turn.prompt(latest_user_message) if turn is not None else latest_user_message
+            return await self._start_live_stream(lease, warm, prompt, response_headers, flight, started, cache_key, turn)
+
+        # 运行 Playwright 交互并提取完整答案 (可安全重试的失败换实例重试，慢请求按策略对冲)
+        extracted_text = await self._answer_with_retries(lease, conversation, turn, latest_user_message, started, background)
+        flight.publish(extracted_text)
+        flight.finish()
+        if cache_key:
+            await self.cache.put(cache_key, extracted_text)
         
         # -----------------------------------------
         # 返回响应 (伪流式或非流式)
@@ -307,15 +1462,234 @@ class GeminiProvider(BaseProvider):
             logger.info("🟢 客户端请求流式响应，返回伪流式 StreamingResponse。")
             return StreamingResponse(
                 self._pseudo_stream_generator(extracted_text, "chatcmpl-pseudo", settings.DEFAULT_MODEL),
-                media_type="text/event-stream"
+                media_type="text/event-stream",
+                headers=response_headers
             )
 
         else:
             # 客户端请求非流式，返回完整 JSONResponse
             response_data = self._create_openai_json_response(extracted_text)
             logger.info(f"✅ 成功返回非流式答案。长度: {len(extracted_text)}")
-            return JSONResponse(content=response_data)
+            return JSONResponse(content=response_data, headers=response_headers)
+
+    # -----------------------------------------------
+    # 非流式交互：单次尝试 / 对冲 / 换实例重试
+    # -----------------------------------------------
+    async def _checkout_page(self, lease: Lease, conversation: Optional[Conversation],
+                             turn: Optional[ConversationTurn]) -> WarmPage:
+        """取出本次交互使用的页面 (命中会话时直接使用会话页面)；失败时归还槽位并抛出 PageUnavailable"""
+        instance = lease.instance
+        if conversation is not None:
+            logger.info(f"💬 命中会话页面 ({instance.name}，已进行 {conversation.turns} 轮)，只输入新的一轮。")
+            await self._start_sample(conversation.warm)
+            return conversation.warm
+        try:
+            warm = await instance.pages.acquire()
+        except asyncio.CancelledError:
+            self.dispatcher.release(lease)
+            raise
+        except Exception as e:
+            self.dispatcher.release(lease)
+            logger.error(f"会话 {instance.name} 无法获取预热页面: {e}")
+            raise PageUnavailable(f"无法准备浏览器页面。错误: {e}") from e
+        if turn is not None and turn.has_history:
+            logger.info(f"💬 会话页面不存在或已淘汰，用 {len(turn.messages)} 条消息重建对话。")
+        try:
+            await self._start_sample(warm)
+        except asyncio.CancelledError:
+            instance.pages.release(warm, reusable=True)
+            self.dispatcher.release(lease)
+            raise
+        return warm
+
+    async def _attempt(self, lease: Lease, conversation: Optional[Conversation], turn: Optional[ConversationTurn],
+                       latest_user_message: str, sent: Optional[asyncio.Event] = None) -> str:
+        """
+        在租约分配的实例上完成一次交互并归还槽位；页面按结果归还 (或保留为会话页面)，失败或被取消时淘汰。
+        提示词提交后设置 sent，并把从取页面到提交的耗时记入对冲阈值的样本
+        """
+        instance = lease.instance
+        started = time.monotonic()
+        warm = await self._checkout_page(lease, conversation, turn)
+        warm.rate_limited = False
+
+        def on_sent():
+            self.hedging.observe(time.monotonic() - started)
+            if sent is not None:
+                sent.set()
+
+        warm.on_sent = on_sent
+        prompt = turn.prompt(latest_user_message) if turn is not None else latest_user_message
+        try:
+            extracted_text = await self._get_and_extract_answer(instance, warm, prompt)
+        except asyncio.CancelledError:
+            # 对冲落败或客户端断开：停止生成并重置页面，槽位立即归还
+            self._abort_interaction(instance, warm, detached=conversation is not None)
+            raise
+        except Exception as e:
+            # 交互失败的页面状态不可信，保存现场后淘汰并在后台补充
+            self._record_account(instance, warm, ok=False)
+            self._retire_failed_page(instance, warm, str(e), detached=conversation is not None)
+            logger.error(f"会话 {instance.name} 失败: {e}")
+            raise
+        finally:
+            warm.on_sent = None
+            self.dispatcher.release(lease)
+
+        if self._record_account(instance, warm, ok=True, answer=extracted_text) == "throttled":
+            # 限流提示不是回答：不缓存、不计入会话，换到其它账号重试
+            self._retire_failed_page(instance, warm, "账号被限流", detached=conversation is not None)
+            logger.warning(f"🧊 {instance.name} 所用账号被限流: {extracted_text[:80]!r}")
+            retry_after = self.accounts.soonest_retry() if self.accounts else int(settings.ACCOUNT_COOLDOWN_BASE)
+            raise AccountThrottled("上游账号被限流，请稍后重试。", retry_after)
+
+        # 页面在后台重置为新对话后重新入池 (会话保持模式下保留为会话页面)
+        self._return_page(instance, warm, turn, extracted_text)
+        return extracted_text
+
+    async def _hedged_attempt(self, lease: Lease, conversation: Optional[Conversation], turn: Optional[ConversationTurn],
+                              latest_user_message: str, hedge: bool) -> str:
+        """
+        执行一次交互；超过对冲阈值仍未提交提示词时在另一个空闲实例上并行发出同一请求。
+        只在提交之前竞争：先提交提示词的一方胜出，另一方立即取消，同一提示词不会被提交两次
+        """
+        delay = self.hedging.delay() if hedge else None
+        if delay is None:
+            return await self._attempt(lease, conversation, turn, latest_user_message)
+
+        primary_sent = asyncio.Event()
+        primary = asyncio.create_task(self._attempt(lease, conversation, turn, latest_user_message, primary_sent))
+        attempts: Dict[asyncio.Task, asyncio.Event] = {primary: primary_sent}
+        try:
+            if not await self._wait_sent(attempts, timeout=delay):
+                hedge_sent = asyncio.Event()
+                hedge_task = self._launch_hedge(lease.instance, turn, latest_user_message, delay, hedge_sent)
+                if hedge_task is not None:
+                    attempts[hedge_task] = hedge_sent
+            error = None
+            while attempts:
+                await self._wait_sent(attempts)
+                winner = next((task for task, sent in attempts.items() if sent.is_set()), None)
+                if winner is not None:
+                    for task in attempts:
+                        if task is not winner:
+                            task.cancel()
+                    if winner is not primary:
+                        self.hedging.counts["hedge_won"] += 1
+                        metrics.HEDGES.labels("won").inc()
+                        logger.info("🪁 对冲请求先提交了提示词，取消原请求。")
+                    return await winner
+                # 提交之前就结束的一方只可能是失败 (PageUnavailable / PromptNotSent)，另一方继续
+                for task in [t for t in attempts if t.done()]:
+                    del attempts[task]
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error or RuntimeError("交互被取消。")
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    @staticmethod
+    async def _wait_sent(attempts: Dict[asyncio.Task, asyncio.Event], timeout: Optional[float] = None) -> bool:
+        """等到任一方提交提示词或结束 (最多 timeout 秒)；超时返回 False"""
+        waiters = [asyncio.create_task(sent.wait()) for sent in attempts.values()]
+        try:
+            done, _ = await asyncio.wait([*attempts, *waiters], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        return bool(done)
+
+    def _launch_hedge(self, primary: BrowserInstance, turn: Optional[ConversationTurn], latest_user_message: str,
+                      delay: float, sent: asyncio.Event) -> Optional[asyncio.Task]:
+        """只使用空闲槽位 (不与排队中的请求争抢) 且对冲预算充足时发出对冲请求"""
+        lease = self.dispatcher.try_acquire_spare(exclude=[primary])
+        if lease is None:
+            self.hedging.counts["no_capacity"] += 1
+            return None
+        if not self.hedging.try_spend():
+            self.dispatcher.release(lease)
+            return None
+        lease.instance.requests += 1
+        self.hedging.counts["hedged"] += 1
+        metrics.HEDGES.labels("launched").inc()
+        logger.info(f"🪁 {primary.name} 上的交互超过 {delay:.1f}s 仍未提交提示词，在 {lease.instance.name} 上发出对冲请求。")
+        return asyncio.create_task(self._attempt(lease, None, turn, latest_user_message, sent))
+
+    async def _answer_with_retries(self, lease: Lease, conversation: Optional[Conversation], turn: Optional[ConversationTurn],
+                                   latest_user_message: str, started: float, background: bool) -> str:
+        """
+        非流式交互的策略层：可安全重试的失败在截止时间 (到达后 API_REQUEST_TIMEOUT 秒) 内换实例重试，
+        最终失败转换为 HTTPException。会话页面上的请求和批处理请求不对冲 (前者需要重建整个对话，后者不在意延迟)
+        """
+        deadline = started + settings.API_REQUEST_TIMEOUT
+        tried: List[BrowserInstance] = []
+        attempt = 1
+        if not background:
+            self.hedging.on_request()
+        while True:
+            tried.append(lease.instance)
+            hedge = not background and conversation is None
+            try:
+                # 首次尝试沿用各阶段自身的超时，重试则以请求的剩余时间为上限
+                async with asyncio.timeout(None if attempt == 1 else max(0.0, deadline - time.monotonic())):
+                    return await self._hedged_attempt(lease, conversation, turn, latest_user_message, hedge)
+            except asyncio.CancelledError:
+                self._record_abandoned("interaction", lease)
+                raise
+            except Exception as e:
+                error = e
+
+            remaining = deadline - time.monotonic()
+            if attempt >= settings.RETRY_MAX_ATTEMPTS or remaining <= 0 or not is_retryable(error):
+                raise self._attempt_error(error)
+            if conversation is not None:
+                # 会话页面已随失败淘汰，重试时在新页面上重建整个对话
+                conversation = turn.conversation = None
+            # 优先换到尚未尝试过的实例；都试过时不再排除
+            exclude = tried if any(i not in tried for i in self.browser_pool) else None
+            try:
+                async with asyncio.timeout(remaining):
+                    lease = await self.dispatcher.acquire(background=background, exclude=exclude)
+            except asyncio.CancelledError:
+                self._record_abandoned("queued")
+                raise
+            except (TimeoutError, QueueFullError):
+                raise self._attempt_error(error)
+            attempt += 1
+            lease.instance.requests += 1
+            reason = type(error).__name__
+            self.hedging.counts["retried"] += 1
+            metrics.RETRIES.labels(reason).inc()
+            logger.warning(f"🔁 {tried[-1].name} 上的交互失败 ({reason})，第 {attempt} 次尝试改在 {lease.instance.name} 上执行。")
+
+    @staticmethod
+    def _attempt_error(error: Exception) -> HTTPException:
+        if isinstance(error, AccountThrottled):
+            return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+        if isinstance(error, PageUnavailable):
+            return HTTPException(status_code=502, detail=str(error))
+        if isinstance(error, TimeoutError):
+            return HTTPException(status_code=502, detail=f"重试未能在 {settings.API_REQUEST_TIMEOUT} 秒内完成。")
+        return HTTPException(status_code=502, detail=f"无法从浏览器获取完整答案。错误: {error}")
+
+    def _cached_response(self, text: str, is_streaming_request: bool) -> [JSONResponse, StreamingResponse]:
+        headers = {"X-Queue-Wait-Ms": "0", "X-Cache": "HIT"}
+        request_id = f"chatcmpl-{int(time.time())}"
+        if not is_streaming_request:
+            return JSONResponse(content=self._create_openai_json_response(text), headers=headers)
+
+        async def cached_stream() -> AsyncGenerator[bytes, None]:
+            encoder = ChunkEncoder(request_id, settings.DEFAULT_MODEL)
+            yield encoder.encode(text)
+            yield encoder.stop()
+            yield DONE_CHUNK
 
+        return StreamingResponse(cached_stream(), media_type="text/event-stream", headers=headers)
 
     async def get_models(self) -> JSONResponse:
         return JSONResponse(content={
@@ -1,9 +1,16 @@
+import asyncio
 import json
+import re
 import time
-from typing import Dict, Any, Optional
+from json.encoder import encode_basestring_ascii
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 DONE_CHUNK = b"data: [DONE]\n\n"
 
+# 分块策略: "bytes" = 按字节数切分，"sentence" = 按句子切分，"time" = 真流式中合并同一时间窗口内的增量
+CHUNK_STRATEGIES = ("bytes", "sentence", "time")
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？\n])(?![.!?。！？\n])")
+
 def create_sse_data(data: Dict[str, Any]) -> bytes:
     """将字典格式的数据转换为 SSE 格式的字节串"""
     return f"data: {json.dumps(data)}\n\n".encode('utf-8')
@@ -35,4 +42,129 @@ def create_chat_completion_chunk(
         "created": int(time.time()),
         "model": model,
         "choices": [choice]
-    }
\ No newline at end of file
+    }
+
+def create_chat_completion_response(request_id: str, model: str, content: str) -> Dict[str, Any]:
+    """创建与 OpenAI 兼容的非流式响应"""
+    return {
+        "id": request_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": content
+                },
+                "finish_reason": "stop"
+            }
+        ],
+        "usage": {
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0
+        }
+    }
+
+
+class ChunkEncoder:
+    """
+    单个流式响应的 SSE 编码器。
+
+    id / model / created 在整个响应中不变，构造时一次性序列化为字节前缀和后缀，
+    每个数据块只需转义增量文本并拼接，输出与 create_sse_data(create_chat_completion_chunk(...)) 相同。
+    """
+    def __init__(self, request_id: str, model: str, created: Optional[int] = None):
+        envelope = json.dumps({
+            "id": request_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()) if created is None else created,
+            "model": model,
+        })
+        head = f'data: {envelope[:-1]}, "choices": [{{"index": 0, "delta": {{"content": '
+        self._prefix = head.encode("utf-8")
+        self._suffix = b"}}]}\n\n"
+        self._stop = (head + '""}, "finish_reason": "stop"}]}\n\n').encode("utf-8")
+
+    def encode(self, content: str) -> bytes:
+        return self._prefix + encode_basestring_ascii(content).encode("ascii") + self._suffix
+
+    def stop(self) -> bytes:
+        return self._stop
+
+
+def split_by_bytes(text: str, chunk_bytes: int) -> List[str]:
+    """按 UTF-8 字节数切分，切点回退到字符边界，不会拆开多字节字符"""
+    data = text.encode("utf-8")
+    if len(data) <= chunk_bytes:
+        return [text] if text else []
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = min(start + chunk_bytes, len(data))
+        while end < len(data) and end > start and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        if end == start:
+            # chunk_bytes 小于单个字符的编码宽度：向后扩展到该字符结束
+            end = start + 1
+            while end < len(data) and (data[end] & 0xC0) == 0x80:
+                end += 1
+        chunks.append(data[start:end].decode("utf-8"))
+        start = end
+    return chunks
+
+
+def split_by_sentence(text: str, chunk_bytes: int) -> List[str]:
+    """按句末标点或换行切分，超长的句子再按字节数切分"""
+    chunks = []
+    for sentence in _SENTENCE_END.split(text):
+        if sentence:
+            chunks.extend(split_by_bytes(sentence, chunk_bytes) if len(sentence.encode("utf-8")) > chunk_bytes else [sentence])
+    return chunks
+
+
+def split_text(text: str, strategy: str, chunk_bytes: int) -> List[str]:
+    """把完整答案切分为伪流式数据块 ("time" 策略对已完成的文本没有意义，按字节数切分)"""
+    if strategy == "sentence":
+        return split_by_sentence(text, chunk_bytes)
+    return split_by_bytes(text, chunk_bytes)
+
+
+async def coalesce_deltas(deltas: AsyncIterator[str], window: float, max_bytes: int) -> AsyncIterator[str]:
+    """
+    合并真流式中在同一时间窗口内到达的增量，减少 SSE 帧数；
+    窗口从缓冲区收到第一个增量时开始计时，缓冲内容超过 max_bytes 时立即输出。
+    """
+    iterator = deltas.__aiter__()
+    buffer: List[str] = []
+    size = 0
+    deadline = None
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if done:
+                task, pending = pending, None
+                try:
+                    delta = task.result()
+                except StopAsyncIteration:
+                    break
+                buffer.append(delta)
+                size += len(delta.encode("utf-8"))
+                if deadline is None:
+                    deadline = time.monotonic() + window
+                if size < max_bytes and time.monotonic() < deadline:
+                    continue
+            if buffer:
+                yield "".join(buffer)
+            buffer, size, deadline = [], 0, None
+    finally:
+        if pending is not None:
+            pending.cancel()
+    if buffer:
+        yield "".join(buffer)
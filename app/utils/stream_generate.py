@@ -0,0 +1,184 @@
+"""
+StreamGenerate 响应解析工具。
+
+gemini.google.com 的 StreamGenerate 接口返回分块的 "长度前缀 JSON" 格式:
+
+    )]}'
+
+    123
+    [["wrb.fr",null,"[null,[\"c_xxx\",\"r_xxx\"],null,null,[[\"rc_xxx\",[\"回答文本\"]...]]]"]]
+    25
+    [["di",90],["af.httprm",89,"...",2]]
+
+每一帧是一个十进制长度行加一个 JSON 数组。包含回答的帧是 "wrb.fr" 信封，
+其第三个元素是再次序列化的 JSON 字符串，回答文本位于 inner[4][0][1][0]，
+且每一帧都携带 "到目前为止" 的完整文本 (累积而非增量)。
+
+也可以直接解析录制下来的响应文件用于排查:
+    python -m app.utils.stream_generate recorded_response.txt
+"""
+import json
+import re
+import sys
+from typing import Any, List, Optional
+
+XSSI_PREFIX = ")]}'"
+
+_decoder = json.JSONDecoder()
+_LENGTH_LINE = re.compile(r"\n(\d+)\n")
+
+
+class StreamGenerateFrame:
+    """一个已解析的 wrb.fr 帧中与回答相关的字段"""
+    def __init__(
+        self,
+        text: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+        response_id: Optional[str] = None,
+        candidate_id: Optional[str] = None,
+        error_code: Optional[int] = None,
+    ):
+        self.text = text
+        self.conversation_id = conversation_id
+        self.response_id = response_id
+        self.candidate_id = candidate_id
+        self.error_code = error_code
+
+    def __repr__(self) -> str:
+        preview = (self.text or "")[:40]
+        return f"StreamGenerateFrame(text={preview!r}, cid={self.conversation_id!r}, error_code={self.error_code!r})"
+
+
+def _dig(data: Any, *path: int) -> Any:
+    for index in path:
+        if not isinstance(data, list) or len(data) <= index:
+            return None
+        data = data[index]
+    return data
+
+
+def parse_envelope(envelope: Any) -> Optional[StreamGenerateFrame]:
+    """解析单个信封，非 wrb.fr 信封返回 None"""
+    if not isinstance(envelope, list) or not envelope or envelope[0] != "wrb.fr":
+        return None
+
+    payload = envelope[2] if len(envelope) > 2 else None
+    if not isinstance(payload, str):
+        # 出错时 payload 为空，错误码位于信封尾部，如 [..., [2, null, [["type.googleapis.com/...", [1037]]]]]
+        code = _dig(envelope, 5, 2, 0, 1, 0)
+        return StreamGenerateFrame(error_code=code if isinstance(code, int) else -1)
+
+    try:
+        inner = json.loads(payload)
+    except json.JSONDecodeError:
+        return None
+
+    text = _dig(inner, 4, 0, 1, 0)
+    return StreamGenerateFrame(
+        text=text if isinstance(text, str) else None,
+        conversation_id=_dig(inner, 1, 0),
+        response_id=_dig(inner, 1, 1),
+        candidate_id=_dig(inner, 4, 0, 0),
+    )
+
+
+class StreamGenerateParser:
+    """
+    增量解析器：可以按任意边界喂入响应文本，每次返回新完成的帧。
+
+    帧的结束位置由 JSON 本身确定 (raw_decode)，长度前缀只用于判断数据是否已到齐，
+    因此不依赖长度的计数单位 (UTF-16 码元 / 字节) 是否精确。
+    """
+    def __init__(self):
+        self._buffer = ""
+        self._prefix_checked = False
+        self.text = ""  # 当前累积的完整回答
+        self.last_frame: Optional[StreamGenerateFrame] = None
+
+    def feed(self, chunk: str) -> List[StreamGenerateFrame]:
+        self._buffer += chunk
+        if not self._prefix_checked:
+            stripped = self._buffer.lstrip()
+            if len(stripped) < len(XSSI_PREFIX) and XSSI_PREFIX.startswith(stripped):
+                return []
+            if stripped.startswith(XSSI_PREFIX):
+                self._buffer = stripped[len(XSSI_PREFIX):]
+            self._prefix_checked = True
+
+        frames: List[StreamGenerateFrame] = []
+        while True:
+            envelopes = self._next_frame()
+            if envelopes is None:
+                break
+            for envelope in envelopes if isinstance(envelopes, list) else []:
+                frame = parse_envelope(envelope)
+                if frame is None:
+                    continue
+                if frame.text is not None:
+                    self.text = frame.text
+                self.last_frame = frame
+                frames.append(frame)
+        return frames
+
+    def feed_deltas(self, chunk: str) -> List[str]:
+        """喂入数据并返回回答文本的新增部分 (用于流式输出)"""
+        deltas = []
+        previous = self.text
+        for frame in self.feed(chunk):
+            if frame.text is None or len(frame.text) <= len(previous):
+                continue
+            # 正常情况下新文本以旧文本为前缀；偶发改写时只输出超出部分
+            deltas.append(frame.text[len(previous):])
+            previous = frame.text
+        return deltas
+
+    def _next_frame(self) -> Optional[Any]:
+        buffer = self._buffer
+        start = len(buffer) - len(buffer.lstrip())
+        newline = buffer.find("\n", start)
+        if newline == -1:
+            return None
+
+        length_line = buffer[start:newline].strip()
+        if not length_line.isdigit():
+            # 不是长度行 (兼容无长度前缀的单个 JSON 数组)
+            body_start = start
+            length = None
+        else:
+            body_start = newline + 1
+            length = int(length_line)
+
+        try:
+            body = buffer[body_start:]
+            envelopes, end = _decoder.raw_decode(buffer, body_start + len(body) - len(body.lstrip()))
+        except json.JSONDecodeError:
+            if length is not None and len(buffer[body_start:].encode("utf-16-le")) // 2 > length:
+                # 数据已超过声明长度仍无法解析：跳到下一个长度行，避免卡死
+                match = _LENGTH_LINE.search(buffer, body_start)
+                self._buffer = buffer[match.start() + 1:] if match else ""
+                return []
+            return None
+
+        self._buffer = buffer[end:]
+        return envelopes
+
+
+def parse_stream_generate_body(body: str) -> StreamGenerateParser:
+    """一次性解析完整的响应体，返回持有最终文本的解析器"""
+    parser = StreamGenerateParser()
+    parser.feed(body)
+    return parser
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("用法: python -m app.utils.stream_generate <录制的 StreamGenerate 响应文件>")
+        sys.exit(1)
+    with open(sys.argv[1], encoding="utf-8") as f:
+        result = parse_stream_generate_body(f.read())
+    if result.last_frame:
+        print(f"conversation_id: {result.last_frame.conversation_id}")
+        print(f"response_id:     {result.last_frame.response_id}")
+        print(f"error_code:      {result.last_frame.error_code}")
+    print("-" * 40)
+    print(result.text)
@@ -0,0 +1,171 @@
+"""
+离线负载测试：启动本地模拟 Gemini 页面 (mock_gemini.py)，在进程内运行 GeminiProvider，
+对 "浏览器池大小 × 并发度" 的每种组合发送真流式请求，输出吞吐量、延迟 p50/p95/p99、
+首 token 时间 (TTFT) 和每个浏览器的平均 RSS。
+
+--json 可把结果写入文件，便于在不同版本之间对比回归。
+
+用法 (在项目根目录):
+    python benchmarks/bench_load.py --pool-sizes 1,2,4 --concurrency 1,4,8 --requests 40
+    python benchmarks/bench_load.py --target http://127.0.0.1:9100 --json results.json   # 使用已启动的模拟页面
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import HTTPException
+from loguru import logger
+
+from app.core.config import settings
+from app.providers.gemini_provider import GeminiProvider
+from bench_pool_layout import _percentile, _process_tree_rss_mb
+
+MOCK_SCRIPT = Path(__file__).resolve().parent / "mock_gemini.py"
+
+
+async def start_mock(port: int, tokens: int, rate: float, first_token_delay: float) -> subprocess.Popen:
+    """在独立进程中启动模拟页面，避免与被测 Provider 争用同一个事件循环"""
+    process = subprocess.Popen([
+        sys.executable, str(MOCK_SCRIPT), "--port", str(port), "--tokens", str(tokens),
+        "--rate", str(rate), "--first-token-delay", str(first_token_delay),
+    ])
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                if (await client.get(f"http://127.0.0.1:{port}/app")).status_code == 200:
+                    return process
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("模拟页面启动超时。")
+
+
+async def run_case(pool_size: int, concurrency: int, total_requests: int) -> Dict[str, Any]:
+    settings.PLAYWRIGHT_POOL_SIZE = pool_size
+    settings.QUEUE_MAX_SIZE = total_requests
+    provider = GeminiProvider()
+    await provider.initialize()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    failures = 0
+
+    async def one_request(index: int):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            first: Optional[float] = None
+            try:
+                # 每个请求的提示词不同，避免被回答缓存或请求合并吸收
+                response = await provider.chat_completion({
+                    "stream": True,
+                    "messages": [{"role": "user", "content": f"bench request {index}"}],
+                })
+                async for chunk in response.body_iterator:
+                    if first is None and b'"content"' in chunk:
+                        first = time.perf_counter() - start
+            except HTTPException:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - start)
+            if first is not None:
+                ttfts.append(first)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(total_requests)))
+    elapsed = time.perf_counter() - started
+    rss_mb = _process_tree_rss_mb(os.getpid())
+    browsers = len(provider.browser_pool)
+    await provider.close()
+
+    return {
+        "pool_size": pool_size,
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "failed": failures,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": _percentile(latencies, 50),
+        "p95_s": _percentile(latencies, 95),
+        "p99_s": _percentile(latencies, 99),
+        "ttft_p50_s": _percentile(ttfts, 50),
+        "ttft_p95_s": _percentile(ttfts, 95),
+        "rss_per_browser_mb": rss_mb / browsers if browsers else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="基于本地模拟 Gemini 页面的离线负载测试")
+    parser.add_argument("--pool-sizes", default="1,2,4", help="逗号分隔的浏览器池大小列表")
+    parser.add_argument("--concurrency", default="1,4,8", help="逗号分隔的并发度列表")
+    parser.add_argument("--requests", type=int, default=40, help="每种组合发送的请求总数")
+    parser.add_argument("--target", default=None, help="已启动的模拟页面地址；不指定时自动启动")
+    parser.add_argument("--port", type=int, default=9100, help="自动启动模拟页面时使用的端口")
+    parser.add_argument("--tokens", type=int, default=200, help="模拟回答的 token 数")
+    parser.add_argument("--rate", type=float, default=50.0, help="模拟生成速度 (token/秒)")
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--extraction", choices=["dom", "network"], default=settings.EXTRACTION_MODE)
+    parser.add_argument("--json", dest="json_path", default=None, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    mock = None
+    if args.target:
+        settings.GEMINI_BASE_URL = args.target
+    else:
+        mock = await start_mock(args.port, args.tokens, args.rate, args.first_token_delay)
+        settings.GEMINI_BASE_URL = f"http://127.0.0.1:{args.port}"
+    settings.STREAMING_MODE = "live"
+    settings.EXTRACTION_MODE = args.extraction
+    settings.CACHE_ENABLED = False
+    settings.COALESCE_ENABLED = False
+
+    results = []
+    try:
+        for pool_size in (int(x) for x in args.pool_sizes.split(",")):
+            for concurrency in (int(x) for x in args.concurrency.split(",")):
+                results.append(await run_case(pool_size, concurrency, args.requests))
+    finally:
+        if mock:
+            mock.terminate()
+
+    header = (
+        f"{'pool':>4} {'conc':>5} {'ok':>4} {'fail':>4} {'rps':>7} {'p50(s)':>7} {'p95(s)':>7} {'p99(s)':>7} "
+        f"{'ttft50':>7} {'ttft95':>7} {'MB/brw':>7}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['pool_size']:>4} {r['concurrency']:>5} {r['ok']:>4} {r['failed']:>4} {r['throughput_rps']:>7.2f} "
+            f"{r['p50_s']:>7.2f} {r['p95_s']:>7.2f} {r['p99_s']:>7.2f} {r['ttft_p50_s']:>7.2f} {r['ttft_p95_s']:>7.2f} "
+            f"{r['rss_per_browser_mb']:>7.0f}"
+        )
+
+    if args.json_path:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "target": settings.GEMINI_BASE_URL,
+            "extraction": settings.EXTRACTION_MODE,
+            "mock": {"tokens": args.tokens, "rate": args.rate, "first_token_delay": args.first_token_delay},
+            "results": results,
+        }
+        Path(args.json_path).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"结果已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+"""
+浏览器进程 × 标签页 布局基准测试。
+
+对每种布局 (如 4x1 = 4 个浏览器进程、每个 1 个槽位；1x4 = 1 个进程、4 个槽位)
+在进程内启动 GeminiProvider，以 "总槽位数 × 并发倍数" 的并发度发送请求，
+输出吞吐量、延迟分位数以及浏览器进程树的总 RSS，用于选择
+PLAYWRIGHT_POOL_SIZE / BROWSER_TABS_PER_INSTANCE 的组合。
+
+用法 (在项目根目录):
+    python benchmarks/bench_pool_layout.py --layouts 4x1,2x2,1x4 --requests 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import HTTPException
+from loguru import logger
+
+from app.core.config import settings
+from app.providers.gemini_provider import GeminiProvider
+
+
+def _process_tree_rss_mb(root_pid: int) -> float:
+    """读取 /proc 统计 root_pid 的所有子孙进程 (浏览器进程) 的 RSS 总和"""
+    children: Dict[int, List[int]] = {}
+    rss: Dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/statm") as f:
+                rss[int(entry)] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total, stack = 0, list(children.get(root_pid, []))
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total / (1024 * 1024)
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def run_layout(browsers: int, tabs: int, total_requests: int, concurrency_factor: int, prompt: str) -> Dict[str, float]:
+    settings.PLAYWRIGHT_POOL_SIZE = browsers
+    settings.BROWSER_TABS_PER_INSTANCE = tabs
+    settings.QUEUE_MAX_SIZE = total_requests
+
+    provider = GeminiProvider()
+    await provider.initialize()
+    concurrency = provider.dispatcher.total_capacity * concurrency_factor
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def one_request():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await provider.chat_completion({"messages": [{"role": "user", "content": prompt}]})
+                latencies.append(time.perf_counter() - start)
+            except HTTPException:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(total_requests)))
+    elapsed = time.perf_counter() - started
+    rss_mb = _process_tree_rss_mb(os.getpid())
+    await provider.close()
+
+    return {
+        "layout": f"{browsers}x{tabs}",
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "failed": failures,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": _percentile(latencies, 50),
+        "p95_s": _percentile(latencies, 95),
+        "rss_mb": rss_mb,
+        "rps_per_gb": (len(latencies) / elapsed) / (rss_mb / 1024) if elapsed and rss_mb else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="比较不同 浏览器数 × 标签页数 布局的吞吐与内存")
+    parser.add_argument("--layouts", default="4x1,2x2,1x4", help="逗号分隔的 浏览器数x标签页数 列表")
+    parser.add_argument("--requests", type=int, default=20, help="每种布局发送的请求总数")
+    parser.add_argument("--concurrency-factor", type=int, default=2, help="并发度 = 总槽位数 × 该倍数")
+    parser.add_argument("--prompt", default="用一句话介绍你自己。")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    results = []
+    for layout in args.layouts.split(","):
+        browsers, tabs = (int(x) for x in layout.lower().split("x"))
+        results.append(await run_layout(browsers, tabs, args.requests, args.concurrency_factor, args.prompt))
+
+    header = f"{'layout':>8} {'conc':>5} {'ok':>4} {'fail':>4} {'rps':>7} {'p50(s)':>7} {'p95(s)':>7} {'RSS(MB)':>8} {'rps/GB':>7}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['layout']:>8} {r['concurrency']:>5} {r['ok']:>4} {r['failed']:>4} {r['throughput_rps']:>7.2f} "
+            f"{r['p50_s']:>7.2f} {r['p95_s']:>7.2f} {r['rss_mb']:>8.0f} {r['rps_per_gb']:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
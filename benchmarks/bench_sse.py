@@ -0,0 +1,83 @@
+"""
+SSE 编码微基准测试：对比逐词构造字典 + json.dumps 的旧编码方式与预序列化信封的 ChunkEncoder，
+并统计各分块策略下的数据块数量、每秒编码的数据块数和吞吐量。
+
+用法 (在项目根目录):
+    python benchmarks/bench_sse.py --words 2000 --rounds 50
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.sse_utils import ChunkEncoder, create_chat_completion_chunk, create_sse_data, split_text
+
+SAMPLE = "Gemini 的回答通常包含 **Markdown** 格式、代码块和中文标点。这是第 {i} 句，用于测试编码速度！\n"
+
+
+def build_answer(words: int) -> str:
+    sentences = []
+    count = 0
+    i = 0
+    while count < words:
+        sentence = SAMPLE.format(i=i)
+        sentences.append(sentence)
+        count += len(sentence.split())
+        i += 1
+    return "".join(sentences)
+
+
+def legacy_encode(text: str) -> int:
+    """原伪流式生成器的切分和编码方式 (不含每块 10ms 的延迟)"""
+    total = 0
+    for chunk in re.findall(r'(\*\*.*?\*\*|\n\n|\s|[^ \n]+)', text, re.DOTALL):
+        if chunk:
+            total += len(create_sse_data(create_chat_completion_chunk("chatcmpl-bench", "gemini-pro", chunk)))
+    return total
+
+
+def encoder_encode(text: str, strategy: str, chunk_bytes: int) -> int:
+    encoder = ChunkEncoder("chatcmpl-bench", "gemini-pro")
+    total = 0
+    for chunk in split_text(text, strategy, chunk_bytes):
+        total += len(encoder.encode(chunk))
+    return total + len(encoder.stop())
+
+
+def measure(name: str, func, rounds: int, chunks: int):
+    started = time.perf_counter()
+    size = 0
+    for _ in range(rounds):
+        size = func()
+    elapsed = time.perf_counter() - started
+    per_round = elapsed / rounds
+    print(f"{name:<28} {chunks:>8} {chunks / per_round:>14,.0f} {size / per_round / 1024 / 1024:>10.1f} {per_round * 1000:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE 编码微基准测试")
+    parser.add_argument("--words", type=int, default=2000, help="答案的大致词数")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--chunk-bytes", type=int, default=256)
+    args = parser.parse_args()
+
+    text = build_answer(args.words)
+    legacy_chunks = len([c for c in re.findall(r'(\*\*.*?\*\*|\n\n|\s|[^ \n]+)', text, re.DOTALL) if c])
+    print(f"答案长度: {len(text)} 字符 / {len(text.encode('utf-8'))} 字节")
+    print(f"原实现每块 sleep(0.01)，仅人为延迟即 {legacy_chunks * 0.01:.1f}s\n")
+    print(f"{'编码方式':<24} {'块数':>8} {'块/秒':>14} {'MB/s':>10} {'ms/答案':>10}")
+    measure("legacy (逐词 + json.dumps)", lambda: legacy_encode(text), args.rounds, legacy_chunks)
+    for strategy in ("bytes", "sentence"):
+        chunks = len(split_text(text, strategy, args.chunk_bytes))
+        measure(f"ChunkEncoder {strategy}/{args.chunk_bytes}", lambda s=strategy: encoder_encode(text, s, args.chunk_bytes), args.rounds, chunks)
+    # 与旧实现相同粒度下的纯编码开销对比
+    words = [c for c in re.findall(r'(\*\*.*?\*\*|\n\n|\s|[^ \n]+)', text, re.DOTALL) if c]
+    encoder = ChunkEncoder("chatcmpl-bench", "gemini-pro")
+    measure("ChunkEncoder 逐词", lambda: sum(len(encoder.encode(w)) for w in words), args.rounds, len(words))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+在本机启动若干个 Playwright 浏览器服务 (playwright run-server)，模拟多台远程浏览器节点，
+用于测试 REMOTE_BROWSER_ENDPOINTS 的负载分配、健康检查以及节点下线/恢复。
+
+用法 (在项目根目录):
+    python benchmarks/local_browser_farm.py --nodes 3 --base-port 3100 --capacity 2
+    # 按输出设置 REMOTE_BROWSER_ENDPOINTS 后启动服务 (可同时设置 PLAYWRIGHT_POOL_SIZE=0 只使用远程节点)
+    # 运行期间输入节点序号 (如 "2") 可停止/重启该节点，观察其被移出并重新加入浏览器池
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+from typing import Dict, Optional
+
+
+def start_node(port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "playwright", "run-server", "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="启动本地 Playwright 浏览器服务，模拟远程浏览器节点")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=3100)
+    parser.add_argument("--capacity", type=int, default=1, help="每个节点的并发槽位数")
+    args = parser.parse_args()
+
+    ports = [args.base_port + i for i in range(args.nodes)]
+    nodes: Dict[int, Optional[subprocess.Popen]] = {port: start_node(port) for port in ports}
+    endpoints = [f"playwright|ws://127.0.0.1:{port}/|{args.capacity}" for port in ports]
+    print(f"REMOTE_BROWSER_ENDPOINTS='{json.dumps(endpoints)}'")
+    print("输入节点序号 (1..N) 停止/重启该节点，Ctrl+C 退出。")
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = (await loop.run_in_executor(None, sys.stdin.readline)).strip()
+            if not line.isdigit() or not 1 <= int(line) <= len(ports):
+                continue
+            port = ports[int(line) - 1]
+            process = nodes[port]
+            if process is not None and process.poll() is None:
+                process.terminate()
+                nodes[port] = None
+                print(f"节点 {line} (:{port}) 已停止。")
+            else:
+                nodes[port] = start_node(port)
+                print(f"节点 {line} (:{port}) 已重启。")
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        for process in nodes.values():
+            if process is not None:
+                process.terminate()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,188 @@
+"""
+本地模拟 Gemini 页面，用于离线压测，不访问 gemini.google.com。
+
+复刻 GeminiProvider 依赖的 DOM 约定:
+  - rich-textarea div.ql-editor             输入框 (contenteditable)
+  - button[aria-label*="Send"]              发送按钮，输入为空时 aria-disabled="true"；
+                                            生成期间变为 "Stop response"，结束后恢复并禁用
+  - message-content                         每个回答一个块，生成过程中逐段追加文本
+  - button[aria-label*="New chat"]          清空当前对话
+
+页面通过 XHR 调用同样格式的 StreamGenerate 接口 (长度前缀 + wrb.fr 信封，累积文本)，
+因此 DOM 提取、网络层提取和直连 HTTP 模式都可以指向它。
+
+用法 (在项目根目录):
+    python benchmarks/mock_gemini.py --port 9100 --tokens 200 --rate 50
+    GEMINI_BASE_URL=http://127.0.0.1:9100 python main.py
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import AsyncGenerator
+from urllib.parse import parse_qs
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
+
+from app.utils.stream_generate import XSSI_PREFIX
+
+STREAM_GENERATE_ENDPOINT = "/_/BardChatUi/data/assistant.lamda.BardFrontendService/StreamGenerate"
+
+PAGE_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Mock Gemini</title>
+<script>
+window.WIZ_global_data = {"SNlM0e":"mock-at","FdrFJe":"mock-fsid","cfb2h":"mock-build"};
+</script>
+<style>
+  body { font-family: sans-serif; margin: 2em; }
+  message-content { display: block; white-space: pre-wrap; border-bottom: 1px solid #ccc; padding: 0.5em 0; }
+  .ql-editor { border: 1px solid #888; min-height: 2em; padding: 0.3em; }
+</style>
+</head>
+<body>
+<button aria-label="New chat" id="new-chat">New chat</button>
+<div id="conversation"></div>
+<rich-textarea><div class="ql-editor" contenteditable="true"></div></rich-textarea>
+<button class="send-button" aria-label="Send message" aria-disabled="true" id="send">Send</button>
+<script>
+(() => {
+  const endpoint = "%s";
+  const editor = document.querySelector("rich-textarea div.ql-editor");
+  const button = document.getElementById("send");
+  const conversation = document.getElementById("conversation");
+  let generating = false;
+
+  const setIdle = () => {
+    generating = false;
+    button.className = "send-button";
+    button.setAttribute("aria-label", "Send message");
+    button.setAttribute("aria-disabled", editor.innerText.trim() ? "false" : "true");
+  };
+  editor.addEventListener("input", () => { if (!generating) setIdle(); });
+
+  // 与 app/utils/stream_generate.py 相同的帧格式：取最后一个 wrb.fr 帧中的累积文本
+  const latestText = (body) => {
+    let text = null;
+    for (const line of body.split("\\n")) {
+      if (!line.startsWith("[")) continue;
+      try {
+        for (const envelope of JSON.parse(line)) {
+          if (envelope[0] !== "wrb.fr" || typeof envelope[2] !== "string") continue;
+          const inner = JSON.parse(envelope[2]);
+          text = inner[4][0][1][0];
+        }
+      } catch (e) { /* 不完整的帧，等待更多数据 */ }
+    }
+    return text;
+  };
+
+  button.addEventListener("click", () => {
+    const prompt = editor.innerText.trim();
+    if (generating || !prompt) return;
+    generating = true;
+    editor.innerText = "";
+    button.className = "stop-button";
+    button.setAttribute("aria-label", "Stop response");
+    button.setAttribute("aria-disabled", "false");
+
+    const answer = document.createElement("message-content");
+    conversation.appendChild(answer);
+    const xhr = new XMLHttpRequest();
+    xhr.open("POST", endpoint + "?rt=c");
+    xhr.setRequestHeader("Content-Type", "application/x-www-form-urlencoded;charset=utf-8");
+    const render = () => {
+      const text = latestText(xhr.responseText || "");
+      if (text !== null) answer.innerText = text;
+    };
+    xhr.addEventListener("progress", render);
+    xhr.addEventListener("loadend", () => { render(); setIdle(); });
+    const fReq = JSON.stringify([null, JSON.stringify([[prompt], null, null])]);
+    xhr.send("f.req=" + encodeURIComponent(fReq) + "&at=mock-at");
+  });
+
+  document.getElementById("new-chat").addEventListener("click", () => {
+    if (generating) return;
+    conversation.innerHTML = "";
+    editor.innerText = "";
+    setIdle();
+  });
+})();
+</script>
+</body>
+</html>
+""" % STREAM_GENERATE_ENDPOINT
+
+
+def encode_frame(envelopes: list) -> str:
+    """编码一个长度前缀帧 (长度按 UTF-16 码元计，与线上一致)"""
+    body = json.dumps(envelopes, ensure_ascii=False)
+    return f"{len(body.encode('utf-16-le')) // 2}\n{body}\n"
+
+
+def answer_frame(text: str, index: int) -> str:
+    inner = [None, ["c_mock", f"r_mock{index}"], None, None, [["rc_mock", [text]]]]
+    return encode_frame([["wrb.fr", None, json.dumps(inner, ensure_ascii=False)]])
+
+
+def build_answer(prompt: str, tokens: int) -> list:
+    """生成确定性的回答 token 序列，开头回显部分提示词以便核对"""
+    words = [f"[{prompt[:30]}]"] + [f"token{i}" for i in range(1, tokens)]
+    return [w + " " for w in words]
+
+
+def create_app(tokens: int, rate: float, first_token_delay: float, chunk_tokens: int) -> FastAPI:
+    app = FastAPI(title="Mock Gemini")
+
+    @app.get("/app", response_class=HTMLResponse)
+    async def gemini_app():
+        return HTMLResponse(PAGE_HTML)
+
+    @app.post(STREAM_GENERATE_ENDPOINT)
+    async def stream_generate(request: Request):
+        # 直接解析表单，避免依赖 python-multipart
+        form = parse_qs((await request.body()).decode("utf-8"))
+        try:
+            prompt = json.loads(json.loads(form["f.req"][0])[1])[0][0]
+        except (KeyError, ValueError, TypeError, IndexError):
+            prompt = ""
+
+        async def frames() -> AsyncGenerator[str, None]:
+            yield XSSI_PREFIX + "\n\n"
+            await asyncio.sleep(first_token_delay)
+            answer = build_answer(prompt, tokens)
+            text = ""
+            for index in range(0, len(answer), chunk_tokens):
+                text += "".join(answer[index:index + chunk_tokens])
+                yield answer_frame(text.rstrip(), index)
+                await asyncio.sleep(chunk_tokens / rate)
+            yield encode_frame([["di", 90], ["af.httprm", 89, "0", 2]])
+
+        return StreamingResponse(frames(), media_type="application/json; charset=utf-8")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 Gemini 页面 (离线压测用)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--tokens", type=int, default=200, help="每个回答的 token 数")
+    parser.add_argument("--rate", type=float, default=50.0, help="生成速度 (token/秒)")
+    parser.add_argument("--first-token-delay", type=float, default=0.5, help="首个 token 前的延迟 (秒)")
+    parser.add_argument("--chunk-tokens", type=int, default=5, help="每帧新增的 token 数")
+    args = parser.parse_args()
+
+    app = create_app(args.tokens, args.rate, args.first_token_delay, max(1, args.chunk_tokens))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
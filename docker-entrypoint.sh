@@ -0,0 +1,26 @@
+#!/usr/bin/env bash
+# 容器入口，由 tini 作为 PID 1 启动 (负责转发信号和回收僵尸进程)。
+#   API_WORKERS=1: 单进程运行，进程内持有浏览器池。
+#   API_WORKERS>1: 启动独占浏览器池的代理进程，再以 PROVIDER_MODE=broker 启动多个无状态 API worker；
+#                  任一进程退出都会关闭另一个并让容器退出，由 restart 策略整体重启。
+set -u
+
+if [ "${API_WORKERS:-1}" -le 1 ]; then
+    exec uvicorn main:app --host 0.0.0.0 --port 8000 --workers 1
+fi
+
+python -m app.core.broker &
+broker=$!
+PROVIDER_MODE=broker uvicorn main:app --host 0.0.0.0 --port 8000 --workers "$API_WORKERS" &
+api=$!
+
+shutdown() {
+    kill -TERM "$api" "$broker" 2>/dev/null
+}
+trap shutdown TERM INT
+
+wait -n "$broker" "$api"
+status=$?
+shutdown
+wait "$broker" "$api"
+exit "$status"
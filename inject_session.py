@@ -439,6 +439,11 @@ async def inject_cookies_to_context(
                 log_async("  - 跳过 Cookie 写入 (列表为空)。", is_error=False)
                 
             await context.close()
+
+            # 同时保存 Cookie 和动态参数，供直连 HTTP 模式 (PROVIDER_MODE=http) 使用
+            session_file = Path(normalized_dir) / "session.json"
+            session_file.write_text(json.dumps(session_data['data'], ensure_ascii=False, indent=2), encoding="utf-8")
+            log_async(f"  - 会话参数已写入: {session_file.as_posix()}", is_error=False)
             
             log_message = f"✅ 会话数据处理完成。目录: '{normalized_dir}'"
             log_async(log_message, is_error=False)
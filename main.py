@@ -1,3 +1,7 @@
+# 最先导入，启动耗时报告从这里开始计时
+from app.core.startup import startup_report
+
+import asyncio
 import sys
 from contextlib import asynccontextmanager
 from typing import Optional
@@ -6,11 +10,15 @@ import traceback
 import httpx 
 
 from fastapi import FastAPI, Request, HTTPException, Depends, Header
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 from loguru import logger
 
+from app.core import metrics
+from app.core.batch import BatchRunner, BatchStore, parse_upload
 from app.core.config import settings
-from app.providers.gemini_provider import GeminiProvider 
+from app.providers.base_provider import BaseProvider, ReleasingStreamingResponse
+
+startup_report.record("imports", time.perf_counter() - startup_report.started)
 
 # --- 配置 Loguru ---
 logger.remove()
@@ -21,20 +29,45 @@ logger.add(
     colorize=True
 )
 
-provider: Optional[GeminiProvider] = None
+provider: Optional[BaseProvider] = None
+batch_store: Optional[BatchStore] = None
+batch_runner: Optional[BatchRunner] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global provider
+    global provider, batch_store, batch_runner
     logger.info(f"应用启动中... {settings.APP_NAME} v{settings.APP_VERSION}")
-    provider = GeminiProvider()
-    await provider.initialize()
-    num_sessions = len(provider.browser_pool)
-    logger.info(f"服务已在 'Headless-Browser-Interaction' 模式下初始化 {num_sessions} 个可用浏览器实例。")
-    if num_sessions == 0:
-        logger.error("🚫 浏览器实例启动失败！请检查 Playwright 依赖和系统环境。")
+    # 按模式延迟导入 Provider：broker / http 模式的 worker 不需要加载 Playwright
+    if settings.PROVIDER_MODE == "broker":
+        from app.providers.broker_client_provider import BrokerClientProvider
+        provider = BrokerClientProvider()
+        await provider.initialize()
+        if not provider.is_ready():
+            logger.error("🚫 浏览器代理进程不可用！请先启动 python -m app.core.broker。")
+    elif settings.PROVIDER_MODE == "http":
+        from app.providers.gemini_http_provider import GeminiHttpProvider
+        provider = GeminiHttpProvider()
+        await provider.initialize()
+        if not provider.is_ready():
+            logger.error("🚫 直连模式会话凭据不可用！请检查 GEMINI_SESSION_FILE。")
+    else:
+        from app.providers.gemini_provider import GeminiProvider
+        provider = GeminiProvider()
+        await provider.initialize()
+        num_sessions = len(provider.browser_pool)
+        logger.info(f"服务已在 'Headless-Browser-Interaction' 模式下初始化 {num_sessions} 个可用浏览器实例。")
+        if num_sessions == 0:
+            logger.error("🚫 浏览器实例启动失败！请检查 Playwright 依赖和系统环境。")
+    if (await provider.readiness()).get("ready"):
+        startup_report.mark_ready()
+    if settings.BATCH_ENABLED:
+        batch_store = BatchStore(settings.BATCH_DIR)
+        batch_runner = BatchRunner(provider, batch_store, settings.BATCH_CONCURRENCY)
+        batch_runner.start()
     logger.info(f"服务将在 http://localhost:{settings.NGINX_PORT} 上可用")
     yield
+    if batch_runner:
+        await batch_runner.close()
     await provider.close()
     logger.info("应用关闭，浏览器实例已清理。")
 
@@ -54,13 +87,51 @@ async def verify_api_key(authorization: Optional[str] = Header(None)):
         if token != settings.API_MASTER_KEY:
             raise HTTPException(status_code=403, detail="无效的 API Key。")
 
+async def wait_for_disconnect(request: Request):
+    """请求体已读完，之后 receive() 只会在客户端断开时返回 http.disconnect"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def run_until_disconnect(request: Request, coro):
+    """
+    执行 coro 直到得到响应；客户端在此之前断开 (超时、关闭连接) 时取消它，
+    排队中的请求随之出队，进行中的浏览器交互被中止并立即归还槽位。
+    响应开始发送后的断开由 StreamingResponse 自身处理；ReleasingStreamingResponse 即使正文从未开始迭代也会释放订阅。
+    """
+    work = asyncio.ensure_future(coro)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({work, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if work in done:
+            return work.result()
+        logger.info("🔌 客户端已断开，取消对应的请求。")
+        work.cancel()
+        await asyncio.gather(work, return_exceptions=True)
+        if not work.cancelled() and work.exception() is None and isinstance(work.result(), ReleasingStreamingResponse):
+            await work.result().release()  # 与断开同时完成的流式响应不会再被发送
+        return Response(status_code=499)  # 沿用 nginx 的 "Client Closed Request"，仅出现在访问日志中
+    finally:
+        disconnected.cancel()
+        if not work.done():
+            work.cancel()
+
 @app.post("/v1/chat/completions", dependencies=[Depends(verify_api_key)], response_model=None, response_class=JSONResponse)
 async def chat_completions(request: Request):
-    if not provider or not provider.browser_pool:
-        raise HTTPException(status_code=503, detail="服务不可用：浏览器实例未启动或初始化失败。")
+    if not provider or not provider.is_ready():
+        raise HTTPException(status_code=503, detail="服务不可用：浏览器实例或会话凭据未初始化成功。")
     try:
         request_data = await request.json()
-        return await provider.chat_completion(request_data) 
+        # Cache-Control: no-cache / no-store 时绕过回答缓存
+        cache_control = request.headers.get("cache-control", "").lower()
+        if "no-cache" in cache_control or "no-store" in cache_control:
+            request_data["cache"] = False
+        # 会话保持模式下的显式会话键
+        conversation_id = request.headers.get("x-conversation-id")
+        if conversation_id:
+            request_data["conversation_id"] = conversation_id
+        return await run_until_disconnect(request, provider.chat_completion(request_data))
     except Exception as e:
         logger.error(f"处理聊天请求时发生顶层错误: {e}", exc_info=False)
         logger.error(f"顶层调用栈追踪:\n{traceback.format_exc(limit=5)}")
@@ -75,11 +146,124 @@ async def list_models():
         "data": [{"id": name, "object": "model", "created": int(time.time()), "owned_by": "Google"} for name in settings.KNOWN_MODELS]
     })
         
+@app.get("/metrics", dependencies=[Depends(verify_api_key)], include_in_schema=False)
+async def prometheus_metrics():
+    content = await provider.render_metrics() if provider else metrics.render_latest()
+    return Response(content=content, media_type=metrics.CONTENT_TYPE_LATEST)
+
+@app.get("/v1/stats", dependencies=[Depends(verify_api_key)])
+async def provider_stats():
+    if not provider:
+        raise HTTPException(status_code=503, detail="服务初始化失败，请检查应用日志。")
+    return JSONResponse(content=await provider.stats())
+
+@app.get("/v1/cache/stats", dependencies=[Depends(verify_api_key)])
+async def cache_stats():
+    if not provider:
+        raise HTTPException(status_code=503, detail="服务初始化失败，请检查应用日志。")
+    cache = (await provider.stats()).get("cache")
+    if cache is None:
+        raise HTTPException(status_code=404, detail="回答缓存未启用。")
+    return JSONResponse(content=cache)
+
+@app.get("/v1/accounts", dependencies=[Depends(verify_api_key)])
+async def account_health():
+    """各账号的熔断状态、冷却剩余时间、错误率和速率预算"""
+    if not provider:
+        raise HTTPException(status_code=503, detail="服务初始化失败，请检查应用日志。")
+    accounts = (await provider.stats()).get("accounts")
+    if accounts is None:
+        raise HTTPException(status_code=404, detail="账号健康度调度未启用。")
+    return JSONResponse(content={"object": "list", "data": accounts})
+
+def require_batch_store() -> BatchStore:
+    if not batch_store:
+        raise HTTPException(status_code=404, detail="批处理未启用。")
+    return batch_store
+
+@app.post("/v1/files", dependencies=[Depends(verify_api_key)])
+async def upload_file(request: Request, store: BatchStore = Depends(require_batch_store)):
+    try:
+        # 解析上传内容和写入文件都在线程池中执行，大文件不会阻塞事件循环
+        content, filename, fields = await asyncio.to_thread(parse_upload, request.headers.get("content-type", ""), await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    purpose = fields.get("purpose") or request.query_params.get("purpose") or "batch"
+    return JSONResponse(content=await asyncio.to_thread(store.create_file, content, filename, purpose))
+
+@app.get("/v1/files/{file_id}", dependencies=[Depends(verify_api_key)])
+async def get_file(file_id: str, store: BatchStore = Depends(require_batch_store)):
+    file = store.get_file(file_id)
+    if file is None:
+        raise HTTPException(status_code=404, detail=f"文件不存在: {file_id}")
+    return JSONResponse(content=file)
+
+@app.get("/v1/files/{file_id}/content", dependencies=[Depends(verify_api_key)])
+async def get_file_content(file_id: str, store: BatchStore = Depends(require_batch_store)):
+    if store.get_file(file_id) is None:
+        raise HTTPException(status_code=404, detail=f"文件不存在: {file_id}")
+    return FileResponse(store.file_path(file_id), media_type="application/jsonl")
+
+@app.post("/v1/batches", dependencies=[Depends(verify_api_key)])
+async def create_batch(request: Request, store: BatchStore = Depends(require_batch_store)):
+    body = await request.json()
+    try:
+        # 校验并统计输入文件的全部行，放到线程池中执行
+        batch = await asyncio.to_thread(
+            store.create_batch,
+            body.get("input_file_id", ""),
+            body.get("endpoint", "/v1/chat/completions"),
+            body.get("completion_window", "24h"),
+            body.get("metadata"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"📦 已创建批任务 {batch['id']} ({batch['request_counts']['total']} 行)。")
+    return JSONResponse(content=batch)
+
+@app.get("/v1/batches", dependencies=[Depends(verify_api_key)])
+async def list_batches(limit: int = 20, store: BatchStore = Depends(require_batch_store)):
+    batches = store.list_batches(limit)
+    return JSONResponse(content={
+        "object": "list",
+        "data": batches,
+        "first_id": batches[0]["id"] if batches else None,
+        "last_id": batches[-1]["id"] if batches else None,
+        "has_more": False,
+    })
+
+@app.get("/v1/batches/{batch_id}", dependencies=[Depends(verify_api_key)])
+async def get_batch(batch_id: str, store: BatchStore = Depends(require_batch_store)):
+    batch = store.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"批任务不存在: {batch_id}")
+    return JSONResponse(content=batch)
+
+@app.post("/v1/batches/{batch_id}/cancel", dependencies=[Depends(verify_api_key)])
+async def cancel_batch(batch_id: str, store: BatchStore = Depends(require_batch_store)):
+    batch = store.request_cancel(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"批任务不存在: {batch_id}")
+    return JSONResponse(content=batch)
+
+@app.get("/healthz", include_in_schema=False)
+async def liveness():
+    """存活检查：进程和事件循环在响应即可，不检查浏览器"""
+    return {"status": "alive"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readiness():
+    """就绪检查：足够的浏览器实例已完成预热导航 (或会话凭据可用) 时返回 200，否则 503"""
+    if not provider:
+        return JSONResponse(status_code=503, content={"ready": False, "detail": "服务仍在启动。"})
+    state = await provider.readiness()
+    return JSONResponse(status_code=200 if state.get("ready") else 503, content=state)
+
 @app.get("/", summary="根路径", include_in_schema=False)
 def root():
     if not provider:
         raise HTTPException(status_code=503, detail="服务初始化失败，请检查应用日志。")
-    if not provider.browser_pool:
-        raise HTTPException(status_code=503, detail="服务初始化成功，但浏览器实例池为空。请检查日志。")
+    if not provider.is_ready():
+        raise HTTPException(status_code=503, detail="服务初始化成功，但浏览器实例池为空或会话凭据不可用。请检查日志。")
         
     return {"message": f"欢迎来到 {settings.APP_NAME} v{settings.APP_VERSION}. 服务运行正常。"}
\ No newline at end of file
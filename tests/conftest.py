@@ -0,0 +1,17 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURES = ROOT / "tests" / "fixtures"
+
+sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture
+def fixture_text():
+    """读取 tests/fixtures 下录制的响应体 (保持原始换行)"""
+    def read(name: str) -> str:
+        return (FIXTURES / name).read_bytes().decode("utf-8")
+    return read
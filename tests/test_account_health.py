@@ -0,0 +1,97 @@
+import pytest
+
+from app.core.account_health import CLOSED, HALF_OPEN, OPEN, AccountHealth, AccountScheduler, TokenBucket, detect_rate_limit
+
+
+def make_health(bucket=None, min_requests=3, threshold=0.5, base=60, maximum=240, probe_timeout=30):
+    return AccountHealth("acc", bucket, window=300, error_threshold=threshold, min_requests=min_requests,
+                         base_cooldown=base, max_cooldown=maximum, probe_timeout=probe_timeout)
+
+
+def test_token_bucket_admits_burst_then_refills():
+    health = make_health(bucket=TokenBucket(rate=1.0, capacity=2))
+    now = health.bucket._updated
+    for _ in range(2):
+        assert health.allows(now)
+        health.admit(now)
+    assert not health.allows(now)
+    assert health.retry_in(now) == pytest.approx(1.0)
+    assert health.allows(now + 1.0)
+
+
+def test_trips_when_error_rate_reaches_threshold():
+    health = make_health(min_requests=4)
+    assert not health.record("error", 0)
+    assert not health.record("ok", 1)
+    assert not health.record("error", 2)  # 样本不足
+    assert health.record("error", 3)
+    assert health.state == OPEN
+    assert not health.allows(10)
+    assert health.retry_in(10) == pytest.approx(53)
+
+
+def test_throttled_trips_immediately():
+    health = make_health()
+    assert health.record("throttled", 0)
+    assert health.state == OPEN
+    assert health.last_reason == "检测到限流"
+
+
+def test_half_open_admits_a_single_probe():
+    health = make_health(probe_timeout=30)
+    health.record("throttled", 0)
+    assert health.allows(60)
+    assert health.state == HALF_OPEN
+    health.admit(60)
+    assert not health.allows(61)  # 探测进行中
+    assert health.allows(91)  # 探测超时未上报，允许下一个探测
+    health.record("ok", 62)
+    assert health.state == CLOSED
+    assert health.trips == 0
+
+
+def test_failed_probe_trips_again_with_doubled_cooldown():
+    health = make_health(base=60, maximum=240)
+    health.record("throttled", 0)
+    assert health.open_until == 60
+    health.allows(60)
+    health.admit(60)
+    assert health.record("error", 61)
+    assert health.open_until == 61 + 120
+    health.allows(181)
+    health.admit(181)
+    health.record("error", 182)
+    assert health.open_until == 182 + 240
+    health.allows(422)
+    health.admit(422)
+    health.record("error", 423)
+    assert health.open_until == 423 + 240  # 不超过 max_cooldown
+
+
+def test_results_during_cooldown_are_ignored():
+    health = make_health()
+    health.record("throttled", 0)
+    assert not health.record("error", 1)
+    assert health.trips == 1
+
+
+def test_scheduler_soonest_retry_and_forget():
+    scheduler = AccountScheduler(lambda instance: instance, 0, 5, 300, 0.5, 3, 60, 1800, 30)
+    scheduler.record("a", "throttled")
+    scheduler.record("b", "ok")
+    assert scheduler.allows("b")
+    assert not scheduler.allows("a")
+    assert scheduler.soonest_retry() == 1
+    scheduler.forget("b")
+    assert scheduler.soonest_retry() >= 59
+    assert [a["name"] for a in scheduler.stats()] == ["a"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("You've reached your limit. Try again later.", True),
+    ("请求过多，请稍后再试。", True),
+    ("这是一个正常的回答。", False),
+    ("try again later " * 40, False),
+])
+def test_detect_rate_limit(text, expected):
+    assert detect_rate_limit(text) is expected
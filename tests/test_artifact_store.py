@@ -0,0 +1,50 @@
+import asyncio
+import os
+import time
+
+from app.core.artifact_store import ArtifactStore
+
+
+def write(path, size, age=0):
+    path.write_bytes(b"x" * size)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+
+
+def test_evicts_expired_files(tmp_path):
+    store = ArtifactStore(tmp_path, max_bytes=10_000, max_age=3600)
+    write(tmp_path / "old.png", 10, age=7200)
+    write(tmp_path / "new.png", 10)
+    store.enforce()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new.png"]
+    assert store.evicted == 1
+
+
+def test_evicts_least_recently_used_until_under_limit(tmp_path):
+    store = ArtifactStore(tmp_path, max_bytes=250, max_age=0)
+    write(tmp_path / "a.html", 100, age=30)
+    write(tmp_path / "b.html", 100, age=20)
+    write(tmp_path / "c.html", 100, age=10)
+    store.enforce()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b.html", "c.html"]
+
+
+def test_files_being_written_are_never_evicted(tmp_path):
+    store = ArtifactStore(tmp_path, max_bytes=0, max_age=1)
+    recording = tmp_path / "video.webm"
+    write(recording, 100, age=3600)
+    store.hold(recording)
+
+    async def run():
+        with store.writing("failure", ".png") as path:
+            write(path, 100, age=3600)
+            await store.enforce_async()
+            assert path.exists()
+        await store.enforce_async()
+        assert not path.exists()
+
+    asyncio.run(run())
+    assert recording.exists()
+    store.unhold(recording)
+    store.enforce()
+    assert not recording.exists()
@@ -0,0 +1,81 @@
+import pytest
+
+from app.core.autoscaler import AutoscalePolicy
+
+
+def make_policy():
+    # 1-4 个实例，每个 2 个槽位；60s 窗口，占用率 >= 80% 扩容、<= 30% 缩容
+    return AutoscalePolicy(min_instances=1, max_instances=4, window=60, up_utilization=0.8, down_utilization=0.3,
+                           up_cooldown=30, down_cooldown=120, slots_per_instance=2)
+
+
+# 每一步: (时间, 排队数, 占用槽位, 总槽位, 当前实例数, 期望的 delta；None 表示不调整)
+CASES = {
+    "below_min": [(0, 0, 0, 0, 0, 1)],
+    "queue_sized_scale_up": [(0, 3, 2, 2, 1, 2)],
+    "queue_clamped_to_max": [(0, 10, 6, 6, 3, 1)],
+    "at_max_never_grows": [(0, 10, 8, 8, 4, None)],
+    "high_utilization": [(0, 0, 4, 4, 2, 1)],
+    "hysteresis_band_holds": [(t, 0, 2, 4, 2, None) for t in range(0, 241, 30)],
+    "up_cooldown": [
+        (0, 2, 2, 2, 1, 1),
+        (10, 2, 4, 4, 2, None),
+        (29, 2, 4, 4, 2, None),
+        (30, 2, 4, 4, 2, 1),
+    ],
+    "shrink_waits_for_full_window": [
+        (0, 0, 0, 4, 2, None),
+        (30, 0, 0, 4, 2, None),
+        (54, 0, 0, 4, 2, -1),
+    ],
+    "queue_in_window_blocks_shrink": [
+        *[(t, 0, 0, 8, 4, None) for t in range(0, 41, 10)],
+        (50, 1, 8, 8, 4, None),  # 已到最大实例数，排队不触发扩容
+        (60, 0, 0, 8, 4, None),
+        (110, 0, 0, 8, 4, None),
+        (120, 0, 0, 8, 4, -1),  # 排队的采样移出窗口后才缩容
+    ],
+    "down_cooldown_after_scale_up": [
+        (0, 1, 2, 2, 1, 1),
+        (60, 0, 0, 4, 2, None),
+        (119, 0, 0, 4, 2, None),
+        (120, 0, 0, 4, 2, -1),
+        (180, 0, 0, 2, 1, None),  # 已到最小实例数
+    ],
+    "one_instance_per_shrink": [
+        (0, 0, 0, 8, 4, None),
+        (60, 0, 0, 8, 4, -1),
+        (120, 0, 0, 6, 3, None),
+        (180, 0, 0, 6, 3, -1),
+    ],
+}
+
+
+@pytest.mark.parametrize("steps", CASES.values(), ids=CASES.keys())
+def test_decisions(steps):
+    policy = make_policy()
+    for t, queue, in_flight, capacity, current, expected in steps:
+        policy.observe(queue, in_flight, capacity, now=t)
+        decision = policy.decide(current, now=t)
+        assert (decision.delta if decision else None) == expected, f"t={t}"
+        if decision:
+            assert policy.clamp(decision.target) == decision.target
+
+
+def test_no_shrink_without_idle_instance():
+    policy = make_policy()
+    for t in range(0, 61, 10):
+        policy.observe(0, 0, 4, now=t)
+    assert policy.decide(2, can_shrink=False, now=60) is None
+    assert policy.decide(2, can_shrink=True, now=60).delta == -1
+
+
+@pytest.mark.parametrize("min_instances, max_instances, size, expected", [
+    (1, 4, 0, 1),
+    (1, 4, 3, 3),
+    (1, 4, 9, 4),
+    (3, 2, 1, 3),  # max 小于 min 时按 min 处理
+])
+def test_clamp(min_instances, max_instances, size, expected):
+    policy = AutoscalePolicy(min_instances, max_instances, 60, 0.8, 0.3, 30, 120, 2)
+    assert policy.clamp(size) == expected
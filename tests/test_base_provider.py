@@ -0,0 +1,62 @@
+import asyncio
+
+from app.providers.base_provider import ReleasingStreamingResponse
+
+
+async def body(events):
+    try:
+        yield b"data: x\n\n"
+    finally:
+        events.append("body")
+
+
+def test_releases_when_client_disconnects_before_iteration():
+    events = []
+    response = ReleasingStreamingResponse(body(events), on_release=lambda: events.append("released"))
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client gone")
+
+    async def run():
+        try:
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        except Exception:
+            pass
+
+    asyncio.run(run())
+    assert events == ["released"]
+
+
+def test_release_runs_once_and_accepts_coroutines():
+    events = []
+
+    async def close():
+        events.append("closed")
+
+    response = ReleasingStreamingResponse(body(events), on_release=close)
+
+    async def run():
+        await response.release()
+        await response.release()
+
+    asyncio.run(run())
+    assert events == ["closed"]
+
+
+def test_release_after_full_iteration():
+    events = []
+    response = ReleasingStreamingResponse(body(events), on_release=lambda: events.append("released"))
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(10)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send))
+    assert sent[0] == "http.response.start"
+    assert events == ["body", "released"]
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.responses import JSONResponse
+
+from app.core.batch import BatchRunner, BatchStore
+
+
+class FakeProvider:
+    """按 custom_id 应答的假 provider；block_on 中的请求一直挂起，on_call 在每次调用时执行"""
+    def __init__(self, block_on=(), on_call=None):
+        self.block_on = set(block_on)
+        self.on_call = on_call
+        self.calls = []
+
+    async def chat_completion(self, request_data):
+        prompt = request_data["messages"][0]["content"]
+        self.calls.append(prompt)
+        if self.on_call:
+            self.on_call(prompt)
+        if prompt in self.block_on:
+            await asyncio.Event().wait()
+        return JSONResponse({"id": f"chatcmpl-{prompt}", "choices": [{"message": {"content": prompt.upper()}}]})
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BatchStore(str(tmp_path / "batches"))
+
+
+def make_batch(store, custom_ids):
+    lines = [json.dumps({"custom_id": c, "method": "POST", "url": "/v1/chat/completions",
+                         "body": {"messages": [{"role": "user", "content": c}]}}) for c in custom_ids]
+    file = store.create_file(("\n".join(lines) + "\n").encode("utf-8"), "input.jsonl", "batch")
+    return store.create_batch(file["id"], "/v1/chat/completions", "24h")
+
+
+def output_ids(store, batch):
+    text = store.file_path(batch["output_file_id"]).read_text(encoding="utf-8")
+    return [json.loads(line)["custom_id"] for line in text.splitlines()]
+
+
+def test_runs_every_line(store):
+    batch = make_batch(store, ["a", "b", "c"])
+    provider = FakeProvider()
+    asyncio.run(BatchRunner(provider, store, concurrency=2)._run(batch))
+
+    saved = store.get_batch(batch["id"])
+    assert saved["status"] == "completed"
+    assert saved["request_counts"] == {"total": 3, "completed": 3, "failed": 0}
+    assert sorted(output_ids(store, batch)) == ["a", "b", "c"]
+    assert sorted(provider.calls) == ["a", "b", "c"]
+
+
+def test_resumes_after_restart(store):
+    batch = make_batch(store, ["a", "b", "c", "d"])
+
+    async def first_run():
+        # 第一个进程在 c 上挂起时被终止
+        runner = BatchRunner(FakeProvider(block_on={"c"}), store, concurrency=1, progress_interval=0)
+        task = asyncio.create_task(runner._run(batch))
+        while store.file_path(batch["output_file_id"]).read_text(encoding="utf-8").count("\n") != 2:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(first_run())
+    assert output_ids(store, batch) == ["a", "b"]
+    # 模拟中断时写了一半的一行
+    with store.file_path(batch["output_file_id"]).open("a", encoding="utf-8") as f:
+        f.write('{"custom_id": "c", "resp')
+
+    provider = FakeProvider()
+    asyncio.run(BatchRunner(provider, store, concurrency=2)._run(store.get_batch(batch["id"])))
+
+    assert sorted(provider.calls) == ["c", "d"]
+    assert sorted(output_ids(store, batch)) == ["a", "b", "c", "d"]
+    saved = store.get_batch(batch["id"])
+    assert saved["status"] == "completed"
+    assert saved["request_counts"]["completed"] == 4
+
+
+def test_cancel_stops_remaining_lines(store):
+    batch = make_batch(store, ["a", "b", "c", "d", "e"])
+
+    def on_call(prompt):
+        if prompt == "b":
+            store.request_cancel(batch["id"])
+
+    provider = FakeProvider(on_call=on_call)
+    asyncio.run(BatchRunner(provider, store, concurrency=1, progress_interval=0)._run(batch))
+
+    assert provider.calls == ["a", "b"]
+    saved = store.get_batch(batch["id"])
+    assert saved["status"] == "cancelled"
+    assert saved["cancelled_at"] is not None
+    assert saved["request_counts"]["completed"] == 2
+    assert output_ids(store, batch) == ["a", "b"]
+
+
+def test_cancelled_before_start_runs_nothing(store):
+    batch = make_batch(store, ["a", "b"])
+    store.request_cancel(batch["id"])
+    provider = FakeProvider()
+    asyncio.run(BatchRunner(provider, store, concurrency=2)._run(store.get_batch(batch["id"])))
+    assert provider.calls == []
+    assert store.get_batch(batch["id"])["status"] == "cancelled"
+
+
+def test_only_one_runner_holds_the_lock(store):
+    first = BatchRunner(FakeProvider(), store, concurrency=1)
+    second = BatchRunner(FakeProvider(), store, concurrency=1)
+    assert first._try_lock()
+    assert not second._try_lock()
+    asyncio.run(first.close())
+    # 持有者退出后其它 worker 可以接管
+    assert second._try_lock()
+    asyncio.run(second.close())
@@ -0,0 +1,144 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import conversation_store
+from app.core.conversation_store import Conversation, ConversationStore, ConversationTurn
+from app.providers.gemini_provider import GeminiProvider
+
+
+class Instance:
+    def __init__(self, name):
+        self.name = name
+
+
+I0, I1 = Instance("i0"), Instance("i1")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(conversation_store, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def make_store(max_pages=2, ttl=60):
+    closed = []
+    return ConversationStore(max_pages, ttl, closed.append), closed
+
+
+def test_next_turn_finds_previous_page():
+    store, _ = make_store()
+    first = ConversationTurn([{"role": "user", "content": "你好"}])
+    conversation = Conversation(I0, "page")
+    store.checkin(first.next_key("你好！"), conversation)
+
+    # 客户端回传的助手消息空白略有差异也能命中
+    second = ConversationTurn([
+        {"role": "user", "content": "你好"},
+        {"role": "assistant", "content": "你好！ "},
+        {"role": "user", "content": "再说一句"},
+    ])
+    assert store.checkout(second.lookup_key) is conversation
+    # 取出期间不在映射中，同一会话的并发请求不会拿到同一个页面
+    assert store.checkout(second.lookup_key) is None
+    assert store.stats() == {"pages": 0, "hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_explicit_conversation_id_pins_the_page():
+    store, _ = make_store()
+    conversation = Conversation(I1, "page")
+    store.checkin(ConversationTurn([{"role": "user", "content": "a"}], "thread-1").next_key("b"), conversation)
+    turn = ConversationTurn([{"role": "user", "content": "完全不同的历史"}], "thread-1")
+    checked_out = store.checkout(turn.lookup_key)
+    assert checked_out is conversation
+    assert checked_out.instance is I1
+
+
+def test_first_turn_has_no_lookup_key():
+    store, _ = make_store()
+    assert ConversationTurn([{"role": "user", "content": "hi"}]).lookup_key is None
+    assert store.checkout(None) is None
+
+
+def test_least_recently_used_page_is_evicted(clock):
+    store, closed = make_store(max_pages=2)
+    a, b, c = (Conversation(I0, name) for name in "abc")
+    store.checkin("a", a)
+    clock.now += 1
+    store.checkin("b", b)
+    clock.now += 1
+    store.checkin("a", store.checkout("a"))  # a 重新变为最近使用
+    clock.now += 1
+    store.checkin("c", c)
+    assert closed == [b]
+    assert store.checkout("b") is None
+    assert store.checkout("a") is a
+
+
+def test_idle_pages_expire(clock):
+    store, closed = make_store(ttl=60)
+    old, fresh = Conversation(I0, "old"), Conversation(I0, "fresh")
+    store.checkin("old", old)
+    clock.now += 50
+    store.checkin("fresh", fresh)
+    clock.now += 20
+    store.expire()
+    assert closed == [old]
+    assert store.checkout("fresh") is fresh
+
+
+def test_replaced_page_is_closed():
+    store, closed = make_store()
+    old, new = Conversation(I0, "old"), Conversation(I0, "new")
+    store.checkin("k", old)
+    store.checkin("k", new)
+    assert closed == [old]
+    assert store.stats()["evictions"] == 1
+
+
+def test_discard_instance_only_drops_its_pages():
+    store, closed = make_store(max_pages=4)
+    keep, drop = Conversation(I0, "keep"), Conversation(I1, "drop")
+    store.checkin("keep", keep)
+    store.checkin("drop", drop)
+    store.discard_instance(I1)
+    assert closed == [drop]
+    assert store.checkout("keep") is keep
+
+
+def test_provider_close_awaits_background_and_loop_tasks():
+    events = []
+
+    async def background():
+        await asyncio.sleep(0.01)
+        events.append("background done")
+
+    async def loop():
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            await asyncio.sleep(0)
+            events.append("loop cancelled")
+            raise
+
+    async def run():
+        provider = GeminiProvider()
+        provider._health_task = asyncio.create_task(loop())
+        provider._run_in_background(background())
+        await asyncio.sleep(0)
+        await provider.close()
+        return provider
+
+    provider = asyncio.run(run())
+    assert sorted(events) == ["background done", "loop cancelled"]
+    assert not provider._background_tasks
@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+from app.core.dispatcher import QueueFullError, RequestDispatcher
+
+
+class Instance:
+    def __init__(self, name, capacity=1):
+        self.name = name
+        self.capacity = capacity
+
+    def __repr__(self):
+        return self.name
+
+
+def make_dispatcher(*capacities, queue_max=10, max_wait=5.0, reserved=0):
+    dispatcher = RequestDispatcher(queue_max, max_wait, reserved)
+    for n, capacity in enumerate(capacities):
+        dispatcher.add_instance(Instance(f"i{n}", capacity))
+    return dispatcher
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_waiters_are_served_in_arrival_order():
+    async def run():
+        dispatcher = make_dispatcher(1)
+        held = await dispatcher.acquire()
+        order = []
+
+        async def waiter(n):
+            lease = await dispatcher.acquire()
+            order.append(n)
+            await asyncio.sleep(0)
+            dispatcher.release(lease)
+
+        tasks = []
+        for n in range(5):
+            tasks.append(asyncio.create_task(waiter(n)))
+            await asyncio.sleep(0)
+        assert dispatcher.queue_depth == 5
+        dispatcher.release(held)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4]
+
+
+def test_overflow_is_rejected_with_retry_after():
+    async def run():
+        dispatcher = make_dispatcher(1, queue_max=2)
+        await dispatcher.acquire()
+        queued = [asyncio.create_task(dispatcher.acquire()) for _ in range(2)]
+        await settle()
+        with pytest.raises(QueueFullError) as error:
+            await dispatcher.acquire()
+        for task in queued:
+            task.cancel()
+        return dispatcher, error.value
+
+    dispatcher, error = asyncio.run(run())
+    # 平均服务时长 10s，队列 2 个 + 本请求，单槽位
+    assert error.retry_after == 30
+    assert dispatcher.rejected == 1
+
+
+def test_wait_timeout_is_rejected():
+    async def run():
+        dispatcher = make_dispatcher(1, max_wait=0.05)
+        await dispatcher.acquire()
+        with pytest.raises(QueueFullError) as error:
+            await dispatcher.acquire()
+        return dispatcher, error.value
+
+    dispatcher, error = asyncio.run(run())
+    assert "0.05" in error.reason
+    assert error.retry_after >= 1
+    assert dispatcher.queue_depth == 0
+
+
+@pytest.mark.parametrize("handed_over", [False, True])
+def test_cancelled_waiter_does_not_leak_slot(handed_over):
+    async def run():
+        dispatcher = make_dispatcher(1)
+        held = await dispatcher.acquire()
+        task = asyncio.create_task(dispatcher.acquire())
+        await settle()
+        if handed_over:
+            # 实例已移交给排队请求、但请求还没来得及恢复运行时被取消
+            dispatcher.release(held)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if not handed_over:
+            dispatcher.release(held)
+        assert dispatcher.in_flight == 0
+        assert dispatcher.queue_depth == 0
+        lease = await asyncio.wait_for(dispatcher.acquire(), 1)
+        return lease
+
+    assert asyncio.run(run()).instance.name == "i0"
+
+
+def test_background_yields_to_interactive():
+    async def run():
+        dispatcher = make_dispatcher(1)
+        held = await dispatcher.acquire()
+        background = asyncio.create_task(dispatcher.acquire(background=True))
+        await settle()
+        interactive = asyncio.create_task(dispatcher.acquire())
+        await settle()
+        # 后台请求先到，但槽位释放后交给交互请求
+        dispatcher.release(held)
+        await settle()
+        assert interactive.done() and not background.done()
+        dispatcher.release(interactive.result())
+        await settle()
+        assert background.done()
+        dispatcher.release(background.result())
+        return dispatcher
+
+    assert asyncio.run(run()).in_flight == 0
+
+
+def test_background_respects_reserved_slots():
+    async def run():
+        dispatcher = make_dispatcher(1, 1, 1, reserved=1)
+        first = await dispatcher.acquire(background=True)
+        # 剩余 2 个空闲槽位，只有多于预留数的部分可以给后台请求
+        second = await dispatcher.acquire(background=True)
+        assert dispatcher.try_acquire_spare() is None
+        third = asyncio.create_task(dispatcher.acquire(background=True))
+        await settle()
+        assert not third.done()
+        # 交互请求不受预留限制
+        interactive = await dispatcher.acquire()
+        for lease in (first, second, interactive):
+            dispatcher.release(lease)
+        await settle()
+        assert third.done()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.instance is not second.instance
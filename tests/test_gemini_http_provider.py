@@ -0,0 +1,157 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.providers.gemini_http_provider import GeminiHttpProvider, STREAM_GENERATE_ENDPOINT
+
+FINAL_TEXT = "你好！这是一个测试回答 🚀\n\n- 第一项\n- 第二项 `code`"
+FRESH_PAGE = '<script>window.WIZ_global_data = {"SNlM0e":"fresh-at","FdrFJe":"fresh-fsid","cfb2h":"fresh-bl"};</script>'
+
+
+class FakeGemini:
+    """
+    MockTransport 的处理函数：记录 StreamGenerate 请求使用的 at / f.sid；
+    at 不在 valid_at 中时返回 status (模拟参数过期)，/app 页面给出刷新后的参数
+    """
+    def __init__(self, body: str, valid_at=("stale-at", "fresh-at"), status: int = 401):
+        self.body = body
+        self.valid_at = valid_at
+        self.status = status
+        self.calls = []
+        self.page_loads = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/app":
+            self.page_loads += 1
+            return httpx.Response(200, text=FRESH_PAGE)
+        assert request.url.path == STREAM_GENERATE_ENDPOINT
+        form = parse_qs(request.content.decode("utf-8"))
+        self.calls.append({"at": form["at"][0], "f.sid": request.url.params["f.sid"], "cookie": request.headers.get("cookie")})
+        if form["at"][0] not in self.valid_at:
+            return httpx.Response(self.status, text="expired")
+        return httpx.Response(200, content=self.body.encode("utf-8"))
+
+
+@pytest.fixture
+def session_file(tmp_path, monkeypatch):
+    path = tmp_path / "user_data_1" / "session.json"
+    path.parent.mkdir()
+    path.write_text(json.dumps({
+        "cookies": {"__Secure-1PSID": "psid-value"},
+        "dynamicParams": {"fSid": "stale-fsid", "at": "stale-at", "bl": "old-bl"},
+    }), encoding="utf-8")
+    monkeypatch.setattr(settings, "GEMINI_SESSION_FILE", str(path))
+    return path
+
+
+def make_provider(fake: FakeGemini) -> GeminiHttpProvider:
+    provider = GeminiHttpProvider()
+    provider.client = httpx.AsyncClient(base_url=settings.GEMINI_BASE_URL, transport=httpx.MockTransport(fake))
+    return provider
+
+
+async def complete(provider: GeminiHttpProvider, request_data):
+    await provider.initialize()
+    try:
+        return await provider.chat_completion(request_data)
+    finally:
+        await provider.close()
+
+
+def test_non_streaming_completion(session_file, fixture_text):
+    fake = FakeGemini(fixture_text("stream_generate_response.txt"))
+    response = asyncio.run(complete(make_provider(fake), {"messages": [{"role": "user", "content": "hi"}]}))
+    content = json.loads(response.body)
+    assert content["choices"][0]["message"]["content"] == FINAL_TEXT.strip()
+    assert fake.calls == [{"at": "stale-at", "f.sid": "stale-fsid", "cookie": "__Secure-1PSID=psid-value"}]
+    assert fake.page_loads == 0
+
+
+@pytest.mark.parametrize("status", [400, 401, 403])
+def test_refreshes_params_after_expired_status(session_file, fixture_text, status):
+    fake = FakeGemini(fixture_text("stream_generate_response.txt"), valid_at=("fresh-at",), status=status)
+    provider = make_provider(fake)
+    response = asyncio.run(complete(provider, {"messages": [{"role": "user", "content": "hi"}]}))
+    assert json.loads(response.body)["choices"][0]["message"]["content"] == FINAL_TEXT.strip()
+    assert fake.page_loads == 1
+    assert [(c["at"], c["f.sid"]) for c in fake.calls] == [("stale-at", "stale-fsid"), ("fresh-at", "fresh-fsid")]
+    # 刷新后的参数写回会话文件
+    saved = json.loads(session_file.read_text(encoding="utf-8"))["dynamicParams"]
+    assert saved == {"fSid": "fresh-fsid", "at": "fresh-at", "bl": "fresh-bl"}
+
+
+def test_refreshes_only_once_when_still_expired(session_file, fixture_text):
+    fake = FakeGemini(fixture_text("stream_generate_response.txt"), valid_at=())
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(complete(make_provider(fake), {"messages": [{"role": "user", "content": "hi"}]}))
+    assert error.value.status_code == 502
+    assert len(fake.calls) == 2
+    assert fake.page_loads == 1
+
+
+def test_concurrent_expired_requests_share_one_refresh(session_file, fixture_text):
+    fake = FakeGemini(fixture_text("stream_generate_response.txt"), valid_at=("fresh-at",))
+    provider = make_provider(fake)
+
+    async def run():
+        await provider.initialize()
+        try:
+            return await asyncio.gather(*[
+                provider.chat_completion({"messages": [{"role": "user", "content": "hi"}]}) for _ in range(2)
+            ])
+        finally:
+            await provider.close()
+
+    responses = asyncio.run(run())
+    assert all(r.status_code == 200 for r in responses)
+    assert fake.page_loads == 1
+
+
+def test_server_error_is_not_refreshed(session_file, fixture_text):
+    fake = FakeGemini(fixture_text("stream_generate_response.txt"), valid_at=(), status=500)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(complete(make_provider(fake), {"messages": [{"role": "user", "content": "hi"}]}))
+    assert error.value.status_code == 502
+    assert fake.page_loads == 0
+
+
+def test_missing_params_are_fetched_on_initialize(session_file, fixture_text):
+    session_file.write_text(json.dumps({"cookies": {"__Secure-1PSID": "psid-value"}}), encoding="utf-8")
+    fake = FakeGemini(fixture_text("stream_generate_response.txt"))
+    provider = make_provider(fake)
+    asyncio.run(complete(provider, {"messages": [{"role": "user", "content": "hi"}]}))
+    assert provider.is_ready()
+    assert fake.page_loads == 1
+    assert fake.calls[0]["at"] == "fresh-at"
+
+
+def test_error_frame_returns_502(session_file, fixture_text):
+    fake = FakeGemini(fixture_text("stream_generate_error.txt"))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(complete(make_provider(fake), {"messages": [{"role": "user", "content": "hi"}]}))
+    assert error.value.status_code == 502
+    assert "1037" in error.value.detail
+
+
+def test_streaming_completion(session_file, fixture_text):
+    fake = FakeGemini(fixture_text("stream_generate_response.txt"))
+    provider = make_provider(fake)
+
+    async def run():
+        await provider.initialize()
+        try:
+            response = await provider.chat_completion({"stream": True, "messages": [{"role": "user", "content": "hi"}]})
+            return [chunk async for chunk in response.body_iterator]
+        finally:
+            await provider.close()
+
+    chunks = b"".join(asyncio.run(run())).decode("utf-8")
+    events = [line[len("data: "):] for line in chunks.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    deltas = [json.loads(e)["choices"][0]["delta"].get("content", "") for e in events[:-1]]
+    assert "".join(deltas) == FINAL_TEXT
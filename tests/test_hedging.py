@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.hedging import HedgePolicy, PromptNotSent
+from app.providers.gemini_provider import BrowserInstance, GeminiProvider
+
+DELAY = 0.05
+
+
+class Script:
+    """
+    按实例名决定假 _attempt 的行为：(提交前等待秒数, 提交后等待秒数, 提交前抛出的异常)。
+    与真实的 _attempt 一样在结束时归还槽位，并记录每个实例上的尝试是否被取消
+    """
+    def __init__(self, provider, plans):
+        self.provider = provider
+        self.plans = plans
+        self.calls = []
+        self.cancelled = []
+
+    async def __call__(self, lease, conversation, turn, latest_user_message, sent=None):
+        name = lease.instance.name
+        self.calls.append(name)
+        before, after, error = self.plans[name]
+        try:
+            await asyncio.sleep(before)
+            if error is not None:
+                raise error
+            if sent is not None:
+                sent.set()
+            await asyncio.sleep(after)
+            return f"answer from {name}"
+        except asyncio.CancelledError:
+            self.cancelled.append(name)
+            raise
+        finally:
+            self.provider.dispatcher.release(lease)
+
+
+def make_provider(plans, hedge=True):
+    provider = GeminiProvider()
+    provider.hedging = HedgePolicy(hedge, quantile=0.95, min_delay=DELAY, max_ratio=1, min_samples=1)
+    provider.hedging.observe(0.01)
+    provider.dispatcher.reserved_slots = 0  # 两个实例的小池：对冲可以用掉最后一个空闲槽位
+    for name in plans:
+        instance = BrowserInstance(None, name)
+        provider.browser_pool.append(instance)
+        provider.dispatcher.add_instance(instance)
+    script = Script(provider, plans)
+    provider._attempt = script
+    return provider, script
+
+
+def answer(provider, first="a"):
+    async def run():
+        instance = next(i for i in provider.browser_pool if i.name == first)
+        lease = await provider.dispatcher.acquire(instance)
+        return await provider._answer_with_retries(lease, None, None, "hi", time.monotonic(), background=False)
+
+    return asyncio.run(run())
+
+
+def test_no_hedge_once_prompt_is_sent():
+    # 提交之后即使回答很慢也不对冲，避免同一提示词被提交两次
+    provider, script = make_provider({"a": (0, DELAY * 4, None), "b": (0, 0, None)})
+    assert answer(provider) == "answer from a"
+    assert script.calls == ["a"]
+    assert provider.hedging.counts["hedged"] == 0
+
+
+def test_hedge_fires_after_delay_and_cancels_loser():
+    provider, script = make_provider({"a": (DELAY * 10, 0, None), "b": (0, DELAY, None)})
+    assert answer(provider) == "answer from b"
+    assert script.calls == ["a", "b"]
+    assert script.cancelled == ["a"]
+    assert provider.hedging.counts["hedged"] == 1
+    assert provider.hedging.counts["hedge_won"] == 1
+
+
+def test_primary_sending_first_cancels_hedge():
+    provider, script = make_provider({"a": (DELAY * 2, DELAY, None), "b": (DELAY * 10, 0, None)})
+    assert answer(provider) == "answer from a"
+    assert script.calls == ["a", "b"]
+    assert script.cancelled == ["b"]
+    assert provider.hedging.counts["hedge_won"] == 0
+
+
+def test_hedge_survives_primary_failing_before_send():
+    provider, script = make_provider({"a": (DELAY * 2, 0, PromptNotSent("点击失败")), "b": (DELAY * 4, 0, None)})
+    assert answer(provider) == "answer from b"
+    assert script.cancelled == []
+
+
+def test_retry_excludes_tried_instance():
+    provider, script = make_provider({"a": (0, 0, PromptNotSent("点击失败")), "b": (0, 0, None)}, hedge=False)
+    assert answer(provider) == "answer from b"
+    assert script.calls == ["a", "b"]
+
+
+def test_error_after_send_is_not_retried():
+    provider, script = make_provider({"a": (0, 0, None), "b": (0, 0, None)}, hedge=False)
+
+    async def fail_after_send(lease, conversation, turn, latest_user_message, sent=None):
+        script.calls.append(lease.instance.name)
+        provider.dispatcher.release(lease)
+        raise TimeoutError("回答超时")
+
+    provider._attempt = fail_after_send
+    with pytest.raises(HTTPException) as error:
+        answer(provider)
+    assert error.value.status_code == 502
+    assert script.calls == ["a"]
@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+
+from app.core.page_pool import PagePool, WarmPage
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+
+class FakeBrowser:
+    """页面池的工厂 / 重置 / 关闭函数；session 模拟实例当前固定的登录会话"""
+    def __init__(self):
+        self.session = "a"
+        self.opened = []
+        self.closed = []
+
+    async def factory(self):
+        await asyncio.sleep(0)
+        warm = WarmPage(context=self.session, page=FakePage())
+        self.opened.append(warm)
+        return warm
+
+    async def resetter(self, warm):
+        return True
+
+    async def closer(self, warm):
+        warm.page.closed = True
+        self.closed.append(warm)
+
+
+def make_pool(browser, size=2, max_uses=10, acquire_timeout=None):
+    return PagePool("test", size, browser.factory, browser.resetter, browser.closer, max_uses, acquire_timeout)
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_renew_replaces_idle_and_in_use_pages():
+    browser = FakeBrowser()
+
+    async def run():
+        pool = make_pool(browser)
+        await pool.start()
+        in_use = await pool.acquire()
+        browser.session = "b"
+        pool.renew()
+        await settle()
+        # 空闲的旧页面已关闭并按新会话补足
+        assert pool.idle_count == 1
+        fresh = await pool.acquire()
+        assert fresh.context == "b"
+        # 使用中的旧页面归还时不再复用
+        pool.release(in_use)
+        await settle()
+        assert in_use in browser.closed
+        assert pool.idle_count == 1
+        assert (await pool.acquire()).context == "b"
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_page_is_replaced_after_max_uses():
+    browser = FakeBrowser()
+
+    async def run():
+        pool = make_pool(browser, size=1, max_uses=2)
+        await pool.start()
+        first = await pool.acquire()
+        pool.release(first)
+        await settle()
+        assert await pool.acquire() is first
+        assert first.uses == 2
+        pool.release(first)
+        await settle()
+        # 达到复用上限：关闭并预热替补
+        assert first in browser.closed
+        second = await pool.acquire()
+        assert second is not first and second.uses == 1
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_shrink_wakes_waiting_acquire():
+    browser = FakeBrowser()
+
+    async def run():
+        pool = make_pool(browser, size=1)
+        await pool.start()
+        held = await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await settle()
+        assert not waiter.done()
+        # 页面被移出池 (页面数下降)：等待者冷启动一个新页面，而不是等到超时
+        pool.detach(held)
+        warm = await asyncio.wait_for(waiter, 1)
+        assert warm is not held
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_failed_warmup_wakes_waiting_acquire():
+    browser = FakeBrowser()
+    fail = False
+
+    async def factory():
+        if fail:
+            raise RuntimeError("导航超时")
+        return await browser.factory()
+
+    async def resetter(warm):
+        return False
+
+    async def run():
+        nonlocal fail
+        pool = PagePool("test", 1, factory, resetter, browser.closer, 10)
+        await pool.start()
+        held = await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await settle()
+        # 重置失败，替补预热也失败：等待者被唤醒后自己冷启动并拿到异常
+        fail = True
+        pool.release(held)
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(waiter, 1)
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_acquire_times_out():
+    browser = FakeBrowser()
+
+    async def run():
+        pool = make_pool(browser, size=1, acquire_timeout=0.05)
+        await pool.start()
+        await pool.acquire()
+        with pytest.raises(TimeoutError):
+            await pool.acquire()
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_close_waits_for_background_tasks_and_closes_their_pages():
+    browser = FakeBrowser()
+
+    async def run():
+        started = asyncio.Event()
+
+        async def slow_reset(warm):
+            started.set()
+            await asyncio.sleep(10)
+            return True
+
+        pool = PagePool("test", 2, browser.factory, slow_reset, browser.closer, 10)
+        await pool.start()
+        in_reset = await pool.acquire()
+        pool.release(in_reset)
+        await started.wait()
+        await pool.close()
+        # 正在重置的页面和空闲页面都已关闭，没有遗留的后台任务
+        assert in_reset in browser.closed
+        assert all(warm.page.closed for warm in browser.opened)
+        assert not pool._tasks
+
+    asyncio.run(run())
@@ -0,0 +1,17 @@
+import pytest
+
+from app.core.response_cache import is_cacheable
+
+
+@pytest.mark.parametrize("request_data, expected", [
+    ({}, True),
+    ({"temperature": 0}, True),
+    ({"temperature": 0.7}, False),
+    ({"n": 2}, False),
+    ({"temperature": 0.7, "cache": True}, True),
+    ({"n": 3, "cache": True}, True),
+    ({"temperature": 0, "cache": False}, False),
+    ({"temperature": "hot"}, False),
+])
+def test_is_cacheable(request_data, expected):
+    assert is_cacheable(request_data) is expected
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from app.core.config import Settings, settings
+from app.core.route_policy import RoutePolicy
+
+
+class FakeRequest:
+    def __init__(self, resource_type, url):
+        self.resource_type = resource_type
+        self.url = url
+
+
+class FakeRoute:
+    def __init__(self, request):
+        self.request = request
+        self.action = None
+
+    async def abort(self, error_code=None):
+        self.action = "abort"
+
+    async def continue_(self):
+        self.action = "continue"
+
+
+class FakePage:
+    """记录 install() 注册的路由；load() 按 Playwright 的匹配方式分发一个请求"""
+    def __init__(self):
+        self.routes = []
+        self.listeners = []
+
+    def on(self, event, callback):
+        self.listeners.append(callback)
+
+    async def route(self, url, handler):
+        self.routes.append((url, handler))
+
+    async def load(self, resource_type, url):
+        request = FakeRequest(resource_type, url)
+        for callback in self.listeners:
+            callback(request)
+        for pattern, handler in self.routes:
+            if pattern == "**/*" or pattern.search(url):
+                route = FakeRoute(request)
+                await handler(route)
+                return route.action
+        return "direct"  # 没有匹配的路由：不经过 Python，由浏览器直接处理
+
+
+def make_policy(mode):
+    return RoutePolicy(mode, settings.ROUTE_BLOCK_RESOURCE_TYPES, settings.ROUTE_BLOCK_URL_PATTERNS,
+                       settings.ROUTE_ALLOW_URL_PATTERNS)
+
+
+def load(mode, resource_type, url):
+    async def run():
+        page = FakePage()
+        stats = {"requests": 0, "blocked": 0}
+        await make_policy(mode).install(page, stats)
+        action = await page.load(resource_type, url)
+        return action, stats
+
+    return asyncio.run(run())
+
+
+REQUESTS = [
+    # (资源类型, URL, fast 模式结果, precise 模式结果)
+    ("document", "https://gemini.google.com/app", "direct", "continue"),
+    ("script", "https://www.gstatic.com/_/mss/boq-bard-web/_/js/app.js", "direct", "continue"),
+    ("image", "https://lh3.googleusercontent.com/a/photo.png", "abort", "abort"),
+    ("image", "https://www.gstatic.com/logo.svg?v=2", "abort", "abort"),
+    # 没有扩展名的图片只有 precise 模式能识别
+    ("image", "https://lh3.googleusercontent.com/a/ACg8ocK=s64", "direct", "abort"),
+    ("font", "https://fonts.gstatic.com/s/roboto/v30/KFOmCnqEu92Fr1Mu4mxK.woff2", "abort", "abort"),
+    ("media", "https://www.gstatic.com/sound/ding.mp3", "abort", "abort"),
+    ("stylesheet", "https://www.gstatic.com/_/mss/boq-bard-web/_/ss/app.css", "direct", "continue"),
+    ("script", "https://www.googletagmanager.com/gtag/js?id=G-1", "abort", "abort"),
+    ("xhr", "https://play.google.com/log?format=json", "abort", "abort"),
+    ("ping", "https://gemini.google.com/gen_204?atyp=i", "abort", "abort"),
+    ("xhr", "https://gemini.google.com/_/BardChatUi/data/assistant.lamda.BardFrontendService/StreamGenerate",
+     "direct", "continue"),
+    ("xhr", "https://gemini.google.com/_/BardChatUi/data/batchexecute?rpcids=ESY5D", "direct", "continue"),
+    # 允许列表优先于扩展名规则
+    ("image", "https://gemini.google.com/_/BardChatUi/static/icon.png", "continue", "continue"),
+]
+
+
+@pytest.mark.parametrize("resource_type, url, fast, precise", REQUESTS)
+@pytest.mark.parametrize("mode", ["fast", "precise"])
+def test_blocked_requests(mode, resource_type, url, fast, precise):
+    action, stats = load(mode, resource_type, url)
+    assert action == (fast if mode == "fast" else precise)
+    assert stats == {"requests": 1, "blocked": 1 if action == "abort" else 0}
+
+
+@pytest.mark.parametrize("resource_type, url", [(r[0], r[1]) for r in REQUESTS])
+def test_off_installs_nothing(resource_type, url):
+    action, stats = load("off", resource_type, url)
+    assert action == "direct"
+    assert stats == {"requests": 0, "blocked": 0}
+
+
+def test_fast_is_the_default():
+    assert Settings.model_fields["ROUTE_POLICY"].default == "fast"
@@ -0,0 +1,170 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.single_flight import Flight, SingleFlight
+from app.providers.gemini_provider import GeminiProvider
+
+REQUEST = {"messages": [{"role": "user", "content": "hi"}]}
+
+
+class Leader:
+    """代替 _lead_flight：等待 gate 放行后发布回答 (或抛出 error)，记录被调用的次数"""
+    def __init__(self, error=None):
+        self.gate = asyncio.Event()
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self, flight, latest_user_message, is_streaming_request, cache_key, cache_status, started,
+                       turn=None, background=False):
+        self.calls += 1
+        try:
+            await self.gate.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        flight.publish(f"answer {self.calls}")
+        flight.finish()
+        return JSONResponse({"choices": [{"message": {"content": f"answer {self.calls}"}}]})
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setattr(settings, "COALESCE_ENABLED", True)
+    provider = GeminiProvider()
+    provider.browser_pool.append(object())
+    return provider
+
+
+def content(response):
+    return json.loads(response.body)["choices"][0]["message"]["content"]
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_identical_requests_share_one_interaction(provider):
+    leader = Leader()
+    provider._lead_flight = leader
+
+    async def run():
+        tasks = [asyncio.create_task(provider.chat_completion(dict(REQUEST))) for _ in range(5)]
+        await settle()
+        leader.gate.set()
+        return await asyncio.gather(*tasks)
+
+    responses = asyncio.run(run())
+    assert leader.calls == 1
+    assert [content(r) for r in responses] == ["answer 1"] * 5
+    assert provider.flights.stats() == {"in_flight": 0, "leaders": 1, "saved_sessions": 4}
+
+
+def test_follower_cancel_does_not_cancel_leader(provider):
+    leader = Leader()
+    provider._lead_flight = leader
+
+    async def run():
+        first = asyncio.create_task(provider.chat_completion(dict(REQUEST)))
+        await settle()
+        follower = asyncio.create_task(provider.chat_completion(dict(REQUEST)))
+        await settle()
+        follower.cancel()
+        await asyncio.gather(follower, return_exceptions=True)
+        leader.gate.set()
+        return await first
+
+    assert content(asyncio.run(run())) == "answer 1"
+    assert leader.calls == 1
+    assert leader.cancelled == 0
+
+
+def test_leader_error_reaches_every_follower(provider):
+    leader = Leader(error=HTTPException(status_code=502, detail="页面崩溃"))
+    provider._lead_flight = leader
+
+    async def run():
+        tasks = [asyncio.create_task(provider.chat_completion(dict(REQUEST))) for _ in range(3)]
+        await settle()
+        leader.gate.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert leader.calls == 1
+    assert all(isinstance(e, HTTPException) and e.detail == "页面崩溃" for e in errors)
+
+
+def test_cancelled_leader_hands_over_to_follower(provider):
+    leader = Leader()
+    provider._lead_flight = leader
+
+    async def run():
+        first = asyncio.create_task(provider.chat_completion(dict(REQUEST)))
+        await settle()
+        follower = asyncio.create_task(provider.chat_completion(dict(REQUEST)))
+        await settle()
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await settle()
+        leader.gate.set()
+        return await follower
+
+    # 领头请求被放弃后，跟随者自行重新执行
+    assert content(asyncio.run(run())) == "answer 2"
+    assert leader.calls == 2
+
+
+@pytest.mark.parametrize("request_data", [
+    {**REQUEST, "temperature": 0.7},
+    {**REQUEST, "n": 2},
+    {**REQUEST, "cache": False},
+])
+def test_sampled_requests_are_not_coalesced(provider, request_data):
+    leader = Leader()
+    provider._lead_flight = leader
+
+    async def run():
+        tasks = [asyncio.create_task(provider.chat_completion(dict(request_data))) for _ in range(3)]
+        await settle()
+        leader.gate.set()
+        return await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert leader.calls == 3
+    assert provider.flights.stats()["saved_sessions"] == 0
+
+
+def test_producer_is_cancelled_only_after_every_subscriber_leaves():
+    async def run():
+        flight, _ = SingleFlight().join("k")
+        flight.producer = asyncio.create_task(asyncio.sleep(3600))
+        first, second = flight.attach(), flight.attach()
+        first.close()
+        await asyncio.sleep(0)
+        assert not flight.producer.cancelled()
+        second.close()
+        await asyncio.gather(flight.producer, return_exceptions=True)
+        return flight.producer
+
+    assert asyncio.run(run()).cancelled()
+
+
+def test_late_subscriber_replays_published_parts():
+    async def run():
+        flight = Flight("k", lambda f: None)
+        flight.publish("a")
+        flight.publish("b")
+        subscription = flight.attach()
+        flight.publish("c")
+        flight.finish()
+        return [part async for part in subscription]
+
+    assert asyncio.run(run()) == ["a", "b", "c"]
@@ -0,0 +1,26 @@
+import pytest
+
+from app.utils.sse_utils import split_by_bytes, split_by_sentence
+
+TEXT = "a你🚀好b。第二句很长很长！"
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 2, 3, 4, 5, 7, 256])
+def test_split_by_bytes_never_breaks_characters(chunk_bytes):
+    chunks = split_by_bytes(TEXT, chunk_bytes)
+    assert "".join(chunks) == TEXT
+    for chunk in chunks:
+        # 只有单个字符宽于 chunk_bytes 时才允许超出
+        assert len(chunk.encode("utf-8")) <= chunk_bytes or len(chunk) == 1
+
+
+def test_split_by_bytes_short_text():
+    assert split_by_bytes("", 4) == []
+    assert split_by_bytes("你好", 6) == ["你好"]
+
+
+def test_split_by_sentence_limits_bytes_not_characters():
+    # 4 个字符、12 个字节：按字符数不超限，按字节数必须再切分
+    chunks = split_by_sentence("你好你好", 8)
+    assert chunks == ["你好", "你好"]
+    assert all(len(c.encode("utf-8")) <= 8 for c in chunks)
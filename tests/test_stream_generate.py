@@ -0,0 +1,117 @@
+import codecs
+import json
+import random
+
+import pytest
+
+from app.utils.stream_generate import StreamGenerateParser, parse_envelope, parse_stream_generate_body
+
+FINAL_TEXT = "你好！这是一个测试回答 🚀\n\n- 第一项\n- 第二项 `code`"
+
+
+def feed_bytes(data: bytes, cuts) -> StreamGenerateParser:
+    """按给定的字节位置切分后逐块喂入，解码方式与 httpx.Response.aiter_text 相同 (增量 UTF-8 解码)"""
+    parser = StreamGenerateParser()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    previous = 0
+    for cut in list(cuts) + [len(data)]:
+        parser.feed(decoder.decode(data[previous:cut]))
+        previous = cut
+    parser.feed(decoder.decode(b"", final=True))
+    return parser
+
+
+def test_parses_recorded_body(fixture_text):
+    parser = parse_stream_generate_body(fixture_text("stream_generate_response.txt"))
+    assert parser.text == FINAL_TEXT
+    assert parser.last_frame.error_code is None
+
+
+def test_extracts_conversation_and_response_ids(fixture_text):
+    frames = StreamGenerateParser().feed(fixture_text("stream_generate_response.txt"))
+    assert len(frames) == 4
+    for frame in frames:
+        assert frame.conversation_id == "c_8f3a2b1d4e5f6a7b"
+        assert frame.response_id == "r_1c2d3e4f5a6b7c8d"
+        assert frame.candidate_id == "rc_9e8d7c6b5a4f3e2d"
+
+
+def test_strips_xssi_prefix_split_across_chunks(fixture_text):
+    body = fixture_text("stream_generate_response.txt")
+    assert body.startswith(")]}'")
+    parser = StreamGenerateParser()
+    for char in body[:6]:
+        assert parser.feed(char) == []
+    parser.feed(body[6:])
+    assert parser.text == FINAL_TEXT
+
+
+def test_body_without_xssi_prefix(fixture_text):
+    body = fixture_text("stream_generate_response.txt")
+    parser = parse_stream_generate_body(body[len(")]}'"):])
+    assert parser.text == FINAL_TEXT
+
+
+def test_every_single_byte_boundary(fixture_text):
+    data = fixture_text("stream_generate_response.txt").encode("utf-8")
+    for cut in range(1, len(data)):
+        parser = feed_bytes(data, [cut])
+        assert parser.text == FINAL_TEXT, f"在第 {cut} 字节处切分时解析失败"
+
+
+def test_split_inside_multibyte_characters(fixture_text):
+    data = fixture_text("stream_generate_response.txt").encode("utf-8")
+    # 切在 "你" (3 字节) 和 "🚀" (4 字节) 的内部
+    inside = [data.index("你".encode()) + 1, data.index("🚀".encode()) + 1, data.index("🚀".encode()) + 3]
+    assert feed_bytes(data, inside).text == FINAL_TEXT
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_byte_chunks(fixture_text, seed):
+    data = fixture_text("stream_generate_response.txt").encode("utf-8")
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(data)), rng.randint(5, 60)))
+    assert feed_bytes(data, cuts).text == FINAL_TEXT
+
+
+def test_one_byte_at_a_time_deltas(fixture_text):
+    data = fixture_text("stream_generate_response.txt").encode("utf-8")
+    parser = StreamGenerateParser()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    deltas = []
+    for i in range(len(data)):
+        deltas.extend(parser.feed_deltas(decoder.decode(data[i:i + 1])))
+    assert "".join(deltas) == FINAL_TEXT
+    assert deltas[0] == "你好"
+
+
+def test_error_frame_reports_error_code(fixture_text):
+    parser = parse_stream_generate_body(fixture_text("stream_generate_error.txt"))
+    assert parser.text == ""
+    assert parser.last_frame.error_code == 1037
+
+
+def test_error_frame_split_at_every_byte(fixture_text):
+    data = fixture_text("stream_generate_error.txt").encode("utf-8")
+    for cut in range(1, len(data)):
+        assert feed_bytes(data, [cut]).last_frame.error_code == 1037
+
+
+def test_error_frame_without_code():
+    frame = parse_envelope(["wrb.fr", None, None])
+    assert frame.error_code == -1
+    assert frame.text is None
+
+
+def test_ignores_non_answer_envelopes():
+    assert parse_envelope(["di", 90]) is None
+    assert parse_envelope(["wrb.fr", None, "not json"]) is None
+
+
+def test_skips_unparsable_frame_and_recovers():
+    inner = [None, ["c_1", "r_1"], None, None, [["rc_1", ["ok"]]]]
+    good = json.dumps([["wrb.fr", None, json.dumps(inner)]])
+    body = ")]}'\n\n5\n[[}}\n" + f"{len(good)}\n{good}\n"
+    parser = parse_stream_generate_body(body)
+    assert parser.text == "ok"
+    assert parser.last_frame.conversation_id == "c_1"